@@ -1,12 +1,17 @@
 import os
+import sys
 import json
 import argparse
-from dotenv import load_dotenv
-from .llms import get_provider, get_model
+# First, so the startup span of --profile covers the other imports.
+from . import profiling
+from .llms import get_provider, get_model, invalidate_llm_cache, OFFLINE_PROVIDERS
 from colorama import Fore, Style
+from .utils import ask
+from . import daemon
+from .settings import ENV_FILE, load_env_file
 
 # Load environment variables from .env if available.
-load_dotenv()
+load_env_file()
 
 from . import logger
 
@@ -16,7 +21,7 @@ from . import logger
 # ---------------------------
 
 def _set_env_file(key: str, value: str) -> None:
-    env_path = os.path.join(os.path.dirname(__file__), '..', '.env')
+    env_path = ENV_FILE
     if not os.path.exists(env_path):
         with open(env_path, "w") as f:
             f.write("")
@@ -58,9 +63,9 @@ def set_api_key(api_key: str = None) -> None:
     """
     if not api_key:
         if get_provider() == "google":
-            api_key = input("Enter GOOGLE API key: ").strip()
+            api_key = ask("Enter GOOGLE API key: ").strip()
         else:
-            api_key = input("Enter OPENAI API key: ").strip()
+            api_key = ask("Enter OPENAI API key: ").strip()
     if not api_key:
         logger.warning("No API key entered. Aborting.")
         return
@@ -79,6 +84,8 @@ def ensure_api_key() -> None:
     """
     Ensure that the GOOGLE API or OPENAI API key is set. If not, prompt the user to enter it.
     """
+    if get_provider() in OFFLINE_PROVIDERS:
+        return
     if not get_api_key():
         logger.warning(f"{get_provider()} API key not found. Please enter your API key.")
         set_api_key()
@@ -88,10 +95,11 @@ def set_provider(provider: str = None) -> None:
     Set the provider.
     """
     if not provider:
-        provider = input("Enter provider: ").strip()
+        provider = ask("Enter provider: ").strip()
     os.environ["PROVIDER"] = provider
     
     _set_env_file("PROVIDER", provider)
+    invalidate_llm_cache()
     
 def get_provider() -> str:
     """
@@ -112,10 +120,11 @@ def set_temperature(temperature: float = None) -> None:
     Set the temperature.
     """
     if not temperature:
-        temperature = input("Enter temperature: ").strip()
+        temperature = ask("Enter temperature: ").strip()
     os.environ["TEMPERATURE"] = temperature
     
     _set_env_file("TEMPERATURE", temperature)
+    invalidate_llm_cache()
     
 def get_temperature() -> float:
     """
@@ -123,9 +132,16 @@ def get_temperature() -> float:
     """
     return os.getenv("TEMPERATURE")
 
-ensure_provider()
-ensure_api_key()
+def ensure_llm_ready() -> None:
+    """
+    Ensure the provider and its API key are set. Only needed by commands that
+    call the model, so bookkeeping commands never prompt for them.
+    """
+    ensure_provider()
+    ensure_api_key()
 
+# chat_manager only imports LangChain, the providers and the tools once a
+# command actually talks to the model, which keeps bookkeeping commands fast.
 from .chat_manager import (
     create_or_load_chat,
     get_chat_titles_list,
@@ -141,8 +157,19 @@ from .chat_manager import (
     flush_temp_chats,
     execute,
     list_messages,
-    current_chat_title
+    search_chats,
+    current_chat_title,
+    migrate_storage,
+    set_chat_compression,
+    set_streaming,
+    set_direct_tools,
+    set_response_cache,
+    clear_response_cache,
+    set_setting,
+    set_data_dir,
+    migrate_legacy_data
 )
+from .paths import resolve_data_dir
 
 # ---------------------------
 # CLI Command Handling
@@ -178,11 +205,22 @@ class ColoredHelpFormatter(argparse.HelpFormatter):
             help_text = Fore.WHITE + help_text + Style.RESET_ALL
         return super()._format_action(action)
 
-def main():
+def main(argv: list[str] = None):
     try:
-        load_dotenv(os.path.join(os.path.dirname(__file__), '..', '.env'))
-        ensure_provider()
-        ensure_api_key()
+        argv = sys.argv[1:] if argv is None else argv
+        profiling.enable_from_env()
+        profile = profiling.enabled() or any(arg == "--profile" or arg.startswith("--profile=") for arg in argv)
+        # Hand the command to the background daemon if one is running. A
+        # profiled command runs here, since the timings are of this process.
+        if "--daemon" not in argv and not profile:
+            code = daemon.forward(argv)
+            if code is not None:
+                if code:
+                    sys.exit(code)
+                return
+
+        # Only parsed again if it changed (e.g. in the daemon, after ai -k).
+        load_env_file()
         parser = argparse.ArgumentParser(
             description=Fore.CYAN + "AI Command-Line Chat Application" + Style.RESET_ALL,
             formatter_class=ColoredHelpFormatter
@@ -191,6 +229,10 @@ def main():
         parser.add_argument("-p", "--provider", nargs="?", const=True, help="Set the provider")
         parser.add_argument("-k", "--set-api-key", nargs="?", const=True, help="Set or update the API key")
         parser.add_argument("-mtemp", "--model-temperature", nargs="?", const=True, help="Set the temperature of the model. Default is 0")
+        parser.add_argument("--stream", choices=["on", "off"], help="Stream AI responses to the terminal as they are generated")
+        parser.add_argument("--direct-tools", choices=["on", "off"], help="Run the AI's commands without confirmation, several at once")
+        parser.add_argument("--response-cache", choices=["on", "off", "clear"], help="Answer repeated temperature 0 requests from a local cache, or clear it")
+        parser.add_argument("--set", nargs=2, metavar=("KEY", "VALUE"), help="Change a setting of config.json, e.g. --set command_timeout 300")
         
         # Chat management options
         parser.add_argument("-c", "--chat", help="Create or load a chat session with the specified title")
@@ -214,13 +256,42 @@ def main():
         
         # Print the chat history
         parser.add_argument("-lsm", "--list-messages", action="store_true", help="Print the chat history")
+        parser.add_argument("--search", metavar="QUERY", help="Search the messages of all chats")
         
         parser.add_argument("-ct", "--current-chat-title", action="store_true", help="Print the current chat title")
         
+        # Storage backend management
+        parser.add_argument("--data-dir", help="Directory for chats and settings (default: $AI_SHELL_DATA_DIR or ~/.local/share/ai-shell-agent)")
+        parser.add_argument("--migrate-storage", choices=["json", "sqlite"], help="Migrate all chats to the given storage backend and use it from now on")
+        parser.add_argument("--compress-chats", choices=["none", "gzip", "zstd"], help="Compress chat files (zstd needs the zstandard package) and rewrite the existing ones")
+        
+        # Background daemon
+        parser.add_argument("--daemon", choices=["start", "stop", "status"], help="Manage the background daemon that keeps the agent loaded between calls")
+        
+        # Profiling
+        parser.add_argument("--profile", nargs="?", const=True, metavar="TRACE_FILE", help="Print where the time of this command went, and optionally write a Chrome trace (also: $AI_SHELL_PROFILE)")
+        
         # Fallback: echo a simple message.
         parser.add_argument("message", nargs="?", help="Send a message (if no other options are provided)")
 
-        args = parser.parse_args()
+        args = parser.parse_args(argv)
+        if args.profile:
+            profiling.enable(args.profile if isinstance(args.profile, str) else None)
+        
+        if args.daemon:
+            if args.daemon == "start":
+                daemon.start()
+            elif args.daemon == "stop":
+                daemon.stop()
+            else:
+                pid = daemon.status()
+                logger.info(f"The ai daemon is running (pid {pid})." if pid else "The ai daemon is not running.")
+            return
+
+        # Resolved per command: the daemon serves terminals with different settings.
+        set_data_dir(args.data_dir or resolve_data_dir())
+        migrate_legacy_data()
+        profiling.end_startup()
         
         # Handle provider management
         if args.provider:
@@ -228,8 +299,10 @@ def main():
                 set_provider("google")
             elif args.provider.lower() == "openai":
                 set_provider("openai")
+            elif args.provider.lower() in OFFLINE_PROVIDERS:
+                set_provider(args.provider.lower())
             else:
-                logger.error("Invalid provider. Please enter 'google' or 'openai'.")
+                logger.error("Invalid provider. Please enter 'google', 'openai', 'fake' or 'replay'.")
             return
 
         # Handle API key management
@@ -254,6 +327,25 @@ def main():
                 logger.error("Temperature must be a number between 0 and 1")
             return
 
+        if args.stream:
+            set_streaming(args.stream == "on")
+            return
+
+        if args.direct_tools:
+            set_direct_tools(args.direct_tools == "on")
+            return
+
+        if args.response_cache:
+            if args.response_cache == "clear":
+                clear_response_cache()
+            else:
+                set_response_cache(args.response_cache == "on")
+            return
+
+        if args.set:
+            set_setting(*args.set)
+            return
+
         # Handle direct command execution
         if args.execute:
             output = execute(args.execute)
@@ -287,6 +379,14 @@ def main():
             delete_chat(args.delete_chat)
             return
 
+        if args.migrate_storage:
+            migrate_storage(args.migrate_storage)
+            return
+
+        if args.compress_chats:
+            set_chat_compression(args.compress_chats)
+            return
+
         # System prompt management
         if args.default_system_prompt:
             set_default_system_prompt(args.default_system_prompt)
@@ -298,14 +398,17 @@ def main():
 
         # Messaging commands
         if args.send_message:
+            ensure_llm_ready()
             send_message(args.send_message)
             return
 
         if args.temp_chat:
+            ensure_llm_ready()
             start_temp_chat(args.temp_chat)
             return
 
         if args.edit:
+            ensure_llm_ready()
             if len(args.edit) == 1:
                 new_message = args.edit[0]
                 edit_message(None, new_message)
@@ -327,8 +430,13 @@ def main():
         if args.list_messages:
             list_messages()
             return
+
+        if args.search:
+            search_chats(args.search)
+            return
         # Fallback: if a message is provided without other commands, send it to current chat
         if args.message:
+            ensure_llm_ready()
             # Use send_message which handles chat history properly
             send_message(args.message)
             return
@@ -338,6 +446,9 @@ def main():
     except KeyboardInterrupt:
         logger.info("\nOperation cancelled by user. Exiting gracefully...")
         return
+    finally:
+        profiling.report()
+        profiling.disable()
 
 if __name__ == "__main__":
     main()
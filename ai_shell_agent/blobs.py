@@ -0,0 +1,134 @@
+# File: ai_shell_agent/blobs.py
+"""
+Content-addressed store for large message contents such as command output.
+
+Each blob is stored once, zlib-compressed, under the SHA-256 digest of its
+text (``<blob dir>/<first two hex digits>/<digest>``). Chat records refer to
+blobs by digest, so repeating ``ps aux`` in one or several chats stores its
+output only once, and chat journals stay small and fast to parse.
+"""
+import os
+import time
+import zlib
+import hashlib
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+from . import logger
+from .locking import atomic_write
+
+BLOB_DIR_NAME = "blobs"
+# Contents shorter than this stay inline in the chat record.
+BLOB_MIN_BYTES = 1024
+# Decompressed blobs kept in memory; blobs never change once written.
+CACHE_SIZE = 256
+# Blobs younger than this are never collected: another process may have
+# stored them for a message it hasn't written to its chat yet.
+GC_GRACE_SECONDS = 3600
+
+
+class BlobStore:
+    """Stores texts by digest in a directory of compressed files."""
+
+    def __init__(self, blob_dir: str):
+        self.blob_dir = blob_dir
+        self._cache: OrderedDict[str, str] = OrderedDict()
+
+    def path(self, digest: str) -> str:
+        return os.path.join(self.blob_dir, digest[:2], digest)
+
+    def put(self, text: str) -> str:
+        """
+        Stores a text unless it is stored already.
+
+        Parameters:
+          text (str): The content to store.
+
+        Returns:
+          str: The digest referring to the text.
+        """
+        data = text.encode()
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            atomic_write(path, zlib.compress(data))
+        self._remember(digest, text)
+        return digest
+
+    def get(self, digest: str) -> Optional[str]:
+        """Returns the text stored under digest, or None if it is missing."""
+        if digest in self._cache:
+            self._cache.move_to_end(digest)
+            return self._cache[digest]
+        try:
+            with open(self.path(digest), "rb") as f:
+                text = zlib.decompress(f.read()).decode()
+        except (OSError, zlib.error) as e:
+            logger.debug(f"Could not read blob {digest}: {e}")
+            return None
+        self._remember(digest, text)
+        return text
+
+    def _remember(self, digest: str, text: str) -> None:
+        self._cache[digest] = text
+        self._cache.move_to_end(digest)
+        while len(self._cache) > CACHE_SIZE:
+            self._cache.popitem(last=False)
+
+    def collect_garbage(self, referenced: Iterable[str], grace_seconds: float = GC_GRACE_SECONDS) -> int:
+        """
+        Removes the blobs that are not referenced anymore.
+
+        Parameters:
+          referenced (Iterable[str]): The digests still used by any chat.
+          grace_seconds (float): Blobs modified more recently are kept.
+
+        Returns:
+          int: The number of removed blobs.
+        """
+        referenced = set(referenced)
+        cutoff = time.time() - grace_seconds
+        removed = 0
+        if not os.path.isdir(self.blob_dir):
+            return 0
+        for prefix in os.listdir(self.blob_dir):
+            prefix_dir = os.path.join(self.blob_dir, prefix)
+            if not os.path.isdir(prefix_dir):
+                continue
+            for name in os.listdir(prefix_dir):
+                if name in referenced:
+                    continue
+                path = os.path.join(prefix_dir, name)
+                try:
+                    if os.path.getmtime(path) > cutoff:
+                        continue
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+                self._cache.pop(name, None)
+                removed += 1
+        return removed
+
+def externalize(record: dict, blobs: BlobStore) -> dict:
+    """
+    Moves the content of a large tool or human message record into the blob
+    store; the record keeps the digest under "output" instead.
+    """
+    content = record.get("content")
+    if record.get("type") in ("tool", "human") and isinstance(content, str) and len(content) >= BLOB_MIN_BYTES:
+        record = dict(record, content="", output=blobs.put(content))
+    return record
+
+def internalize(record: dict, blobs: BlobStore) -> dict:
+    """Returns the record with the content of its blob (if any) back in place."""
+    if "output" not in record:
+        return record
+    record = dict(record)
+    digest = record.pop("output")
+    content = blobs.get(digest)
+    if content is None:
+        logger.warning(f"Output {digest[:12]} of a chat message is missing.")
+        content = "[output no longer available]"
+    record["content"] = content
+    return record
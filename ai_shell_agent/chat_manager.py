@@ -1,104 +1,360 @@
 # File: ai_shell_agent/chat_manager.py
+#
+# LangChain, the model providers and the tools are only imported inside the
+# functions that need them, so chat bookkeeping commands (listing, renaming,
+# deleting chats...) start without loading them.
+from __future__ import annotations
+
 import os
 import json
-from typing import Optional
+import logging
+from typing import Optional, TYPE_CHECKING
 import uuid
 from colorama import Fore, Style
 
-from langchain_openai import ChatOpenAI
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_core.messages import (
-    HumanMessage, 
-    AIMessage, 
-    SystemMessage, 
-    ToolMessage,
-    BaseMessage
-)
-from langchain_core.messages.utils import convert_to_openai_messages
-from .tools import tools_functions, direct_windows_shell_tool, tools
-from .prompts import default_system_prompt
+from .prompts import summary_prompt, retrieved_context_prefix
 from . import logger
-from .llms import get_llm
 from .utils import Spinner
+from . import storage
+from . import paths
+from . import settings
+from . import journal
+from . import blobs
+from . import profiling
+from .terminal import terminal_key
+from .message_views import Message, MessageView, read_views, materialize
+from .storage import read_json as _read_json, write_json as _write_json
+
+if TYPE_CHECKING:
+    from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
+    from . import search, retrieval
 
-CHAT_DIR = os.path.join("chats")
+# Files in the data directory (see paths.py and set_data_dir).
+DATA_DIR = paths.data_dir()
+CHAT_DIR = os.path.join(DATA_DIR, "chats")
 CHAT_MAP_FILE = os.path.join(CHAT_DIR, "chat_map.json")
-SESSION_FILE = "session.json"
-CONFIG_FILE = "config.json"
+SESSION_FILE = os.path.join(DATA_DIR, "session.json")
+CONFIG_FILE = paths.config_file()
+# Left in a chats/ folder of an older version once its chats were moved to the data directory.
+LEGACY_MIGRATED_MARKER = ".migrated"
+
+# Response caches by database path, see _response_cache.
+_response_caches: dict[str, object] = {}
+
+# Prompt tokens of the model calls of this process, see prompt_cache_usage.
+_prompt_cache_usage = {"calls": 0, "input_tokens": 0, "cache_read": 0}
+
+# Event loop of the synchronous API (send_message, start_temp_chat), see _run_sync.
+_runner = None
+
+# Chat stores by (backend, chat dir, chat map file, session file).
+_stores: dict[tuple, storage.ChatStore] = {}
+
+# Output blob stores by blob directory, see _blob_store.
+_blob_stores: dict[str, blobs.BlobStore] = {}
+
+# Search indexes by database path, see _search_index.
+_search_indexes: dict[str, search.SearchIndex] = {}
 
+# Embedders by name, see _vector_index.
+_embedders: dict[str, object] = {}
 
-# Ensure the chats directory exists.
-os.makedirs(CHAT_DIR, exist_ok=True)
+# Messages last read from or written to each chat journal, compared by identity
+# in _write_messages to find out which part of a history is new.
+_persisted_messages: dict[str, list[Message]] = {}
+# Store version of each chat when it was last read or written; while it is
+# unchanged (a long-running daemon), _read_messages serves the cached messages.
+_persisted_versions: dict[str, object] = {}
 
-def _read_json(file_path: str) -> dict:
-    if os.path.exists(file_path):
-        with open(file_path, "r") as f:
-            try:
-                return json.load(f)
-            except json.JSONDecodeError:
-                return {}
-    return {}
+def _remember_messages(file_path: str, messages: list[Message]) -> None:
+    _persisted_messages[file_path] = list(messages)
+    _persisted_versions[file_path] = _store().version(file_path)
 
-def _write_json(file_path: str, data: dict) -> None:
-    with open(file_path, "w") as f:
-        json.dump(data, f, indent=4)
+def _forget_messages(file_path: str) -> None:
+    _persisted_messages.pop(file_path, None)
+    _persisted_versions.pop(file_path, None)
+
+def _settings() -> settings.Settings:
+    """Returns the settings, with config.json only parsed again when it changed."""
+    return settings.load(CONFIG_FILE)
+
+def _store() -> storage.ChatStore:
+    """
+    Returns the chat store selected by the "storage_backend" config key, set up
+    to write chats with the "chat_compression" config key.
+    Stores are cached per backend and location, so overriding the module
+    level paths (as the tests do) transparently switches to a new store.
+    """
+    current = _settings()
+    key = (current.storage_backend, CHAT_DIR, CHAT_MAP_FILE, SESSION_FILE)
+    if key not in _stores:
+        _stores[key] = _create_store(current.storage_backend)
+    _stores[key].compression = current.chat_compression
+    return _stores[key]
+
+def _blob_store() -> blobs.BlobStore:
+    """Returns the store of large message contents, shared by all chats."""
+    blob_dir = os.path.join(CHAT_DIR, blobs.BLOB_DIR_NAME)
+    if blob_dir not in _blob_stores:
+        _blob_stores[blob_dir] = blobs.BlobStore(blob_dir)
+    return _blob_stores[blob_dir]
+
+def _collect_blob_garbage(grace_seconds: float = blobs.GC_GRACE_SECONDS) -> None:
+    """
+    Removes stored outputs that no chat refers to anymore, e.g. after deleting
+    chats. Runs under the store lock, so no chat write lands between the scan
+    and the deletes; recent blobs are kept (see blobs.GC_GRACE_SECONDS).
+    """
+    store = _store()
+    with store.lock():
+        referenced = set()
+        for title in store.list_titles():
+            chat_id = store.get_chat_id(title)
+            for record in store.read_records(store.chat_file(chat_id)):
+                if "output" in record:
+                    referenced.add(record["output"])
+                full_output = _full_output_digest(record.get("artifact"))
+                if full_output:
+                    referenced.add(full_output)
+        removed = _blob_store().collect_garbage(referenced, grace_seconds)
+    logger.debug(f"Removed {removed} unreferenced outputs")
+
+def _unindex_chats(chat_files: list[str]) -> None:
+    """Removes deleted chats from the search index and their embeddings."""
+    import sqlite3
+    try:
+        _search_index().remove_chats(storage.ChatStore.chat_id(chat_file) for chat_file in chat_files)
+    except sqlite3.Error as e:
+        logger.debug(f"Could not update the search index: {e}")
+    for chat_file in chat_files:
+        _vector_index(chat_file).remove()
+
+def _full_output_digest(artifact) -> Optional[str]:
+    """Returns the blob digest of the uncompressed output in a tool message artifact, if any."""
+    if isinstance(artifact, dict):
+        return artifact.get("full_output")
+    return None
+
+def _compress_tool_output(message: ToolMessage) -> ToolMessage:
+    """
+    Shortens the output the model sees with the "tool_output_filters"
+    pipeline, see tool_output. The full output is kept in the message
+    artifact and moved to the blob store when the message is written (see
+    _to_record), for list_messages.
+    """
+    current = _settings()
+    if not current.tool_output_filters or not isinstance(message.content, str):
+        return message
+    from . import tool_output
+    compressed = tool_output.compress(message.content, current.tool_output_filters.split(","), current.tool_output_max_chars)
+    if compressed != message.content:
+        logger.debug(f"Compressed tool output from {len(message.content)} to {len(compressed)} characters")
+        message.artifact = {"full_output_text": message.content}
+        message.content = compressed
+    return message
+
+def _full_tool_output(message: Message) -> str:
+    """Returns the uncompressed output of a tool message."""
+    artifact = getattr(message, "artifact", None)
+    if isinstance(artifact, dict) and "full_output_text" in artifact:
+        # Not written yet.
+        return artifact["full_output_text"]
+    digest = _full_output_digest(artifact)
+    if digest:
+        full_output = _blob_store().get(digest)
+        if full_output is not None:
+            return full_output
+    return message.content
+
+def _externalize_full_output(record: dict) -> dict:
+    """
+    Moves the full output kept by _compress_tool_output into the blob store;
+    the artifact keeps its digest under "full_output" instead. Only called
+    while writing under the store lock, so garbage collection never sees the
+    blob before the record referring to it.
+    """
+    artifact = record.get("artifact")
+    if not isinstance(artifact, dict) or "full_output_text" not in artifact:
+        return record
+    artifact = dict(artifact)
+    artifact["full_output"] = _blob_store().put(artifact.pop("full_output_text"))
+    return dict(record, artifact=artifact)
+
+def _dump_message(message: BaseMessage) -> dict:
+    """Serializes a message without its default-valued fields (they are restored on load)."""
+    data = message.model_dump(exclude_defaults=True)
+    data["type"] = message.type
+    return data
+
+def _to_record(message: Message) -> dict:
+    """Serializes a message; large outputs go to the blob store and are referenced by digest."""
+    if isinstance(message, MessageView):
+        # Read from the store: the record is already in its stored form.
+        return message.to_record()
+    return blobs.externalize(_externalize_full_output(_dump_message(message)), _blob_store())
+
+def _create_store(backend: str) -> storage.ChatStore:
+    os.makedirs(CHAT_DIR, exist_ok=True)
+    if backend == "sqlite":
+        return storage.SqliteChatStore(CHAT_DIR)
+    if backend != "json":
+        logger.warning(f"{Fore.YELLOW}Unknown storage backend '{backend}', using json.{Style.RESET_ALL}")
+    return storage.JsonChatStore(CHAT_DIR, CHAT_MAP_FILE, SESSION_FILE)
 
 def _get_console_session_id() -> str:
-    """Returns an identifier for a temporary console session."""
-    return f"temp_{os.getpid()}"
-
-def _read_messages(file_path: str) -> list[BaseMessage]:
-    """Read and deserialize messages from JSON file."""
-    if os.path.exists(file_path):
-        with open(file_path, "r") as f:
-            try:
-                messages_data = json.load(f)
-                messages = []
-                for msg in messages_data:
-                    if msg["type"] == "system":
-                        messages.append(SystemMessage(**msg))
-                    elif msg["type"] == "human":
-                        messages.append(HumanMessage(**msg))
-                    elif msg["type"] == "ai":
-                        messages.append(AIMessage(**msg))
-                    elif msg["type"] == "tool":  # Added branch for tool messages
-                        messages.append(ToolMessage(**msg))
-                logger.debug(f"Read messages: {messages}")
-                return messages
-            except json.JSONDecodeError:
-                return []
-    return []
-
-def _write_messages(file_path: str, messages: list[BaseMessage]) -> None:
-    """Write messages to JSON file."""
-    messages_data = [msg.model_dump() for msg in messages]
-    logger.debug(f"Writing messages: {messages_data}")
-    with open(file_path, "w") as f:
-        json.dump(messages_data, f, indent=4)
+    """Returns an identifier for the temporary chat of this terminal."""
+    return f"temp_{terminal_key()}"
+
+def _read_messages(file_path: str) -> list[Message]:
+    """
+    Read messages by replaying the chat journal.
+    Stored messages are returned as MessageViews; use materialize() to get
+    LangChain messages, e.g. to send them to the model.
+    """
+    with profiling.span("read_messages", "chat_io") as span:
+        store = _store()
+        version = store.version(file_path)
+        if version is not None and file_path in _persisted_messages and _persisted_versions.get(file_path) == version:
+            # Unchanged since this process last read or wrote it.
+            span["cached"] = True
+            return list(_persisted_messages[file_path])
+        messages = read_views(store.read_records(file_path), _blob_store())
+        span["messages"] = len(messages)
+        logger.debug(f"Read {len(messages)} messages")
+        _remember_messages(file_path, messages)
+        return messages
+
+def _same_message(old: Message, new: Message) -> bool:
+    return old is new or (old.id is not None and old.id == new.id)
+
+def _merge_concurrent_messages(file_path: str, persisted: list[Message], messages: list[Message]) -> list[Message]:
+    """
+    Merges the messages another process (e.g. a second terminal on the same
+    chat) appended since this process read the chat. They are inserted into
+    messages right after the history both processes share, so this process'
+    new messages follow them and nothing is lost. For edits of the shared part,
+    the last writer wins.
+
+    Returns:
+      list[Message]: The history now stored, to diff messages against.
+    """
+    stored = read_views(_store().read_records(file_path), _blob_store())
+    known = {msg.id for msg in persisted} | {msg.id for msg in messages}
+    foreign = [msg for msg in stored if msg.id not in known]
+    if foreign:
+        keep = 0
+        for old, new in zip(persisted, messages):
+            if not _same_message(old, new):
+                break
+            keep += 1
+        messages[keep:keep] = foreign
+        logger.debug(f"Merged {len(foreign)} messages written concurrently to {file_path}")
+    return stored
+
+def _write_messages(file_path: str, messages: list[Message]) -> None:
+    """
+    Write messages to the chat journal.
+    Only messages that were not persisted yet are serialized and appended; the
+    journal is rewritten when it can't be appended to or has grown too long.
+    Messages that other processes appended in the meantime are merged into
+    messages (in place), see _merge_concurrent_messages.
+    """
+    store = _store()
+    for msg in messages:
+        # Stable ids let per-message caches (e.g. token counts) survive across runs.
+        if msg.id is None:
+            msg.id = str(uuid.uuid4())
+    with profiling.span("write_messages", "chat_io") as span, store.lock():
+        persisted = _persisted_messages.get(file_path)
+        if persisted is not None and store.version(file_path) != _persisted_versions.get(file_path):
+            persisted = _merge_concurrent_messages(file_path, persisted, messages)
+        # Length of the history prefix that is already on disk.
+        keep = 0
+        if persisted is not None:
+            for old, new in zip(persisted, messages):
+                if not _same_message(old, new):
+                    break
+                keep += 1
+        can_append = persisted is not None and store.can_append(file_path)
+        if can_append and keep == len(persisted) == len(messages):
+            return
+        if can_append and not store.needs_compaction(file_path, len(messages)):
+            messages_data = [_to_record(msg) for msg in messages[keep:]]
+            logger.debug(f"Appending messages: {messages_data}")
+            store.append_records(file_path, messages_data, keep=keep if keep < len(persisted) else None)
+            span["appended"] = len(messages_data)
+        else:
+            messages_data = [_to_record(msg) for msg in messages]
+            logger.debug(f"Writing messages: {messages_data}")
+            store.write_records(file_path, messages_data)
+            span["rewritten"] = len(messages_data)
+        _remember_messages(file_path, messages)
+        _index_messages(file_path, keep, messages)
+        if _settings().retrieval_top_k:
+            _embed_messages(file_path, messages)
+
+def _search_index() -> search.SearchIndex:
+    """Returns the full-text index of the messages of all chats."""
+    from . import search
+    db_file = os.path.join(CHAT_DIR, search.INDEX_DB_NAME)
+    if db_file not in _search_indexes:
+        _search_indexes[db_file] = search.SearchIndex(db_file)
+    return _search_indexes[db_file]
+
+def _index_messages(file_path: str, keep: int, messages: list[Message]) -> None:
+    """
+    Updates the search index after a write of a chat history; keep is the
+    number of leading messages that were already stored. Failures are only
+    logged: the next search re-indexes chats the index missed.
+    """
+    import sqlite3
+    store = _store()
+    try:
+        _search_index().update(store.chat_id(file_path), keep, messages, store.history_version(file_path))
+    except sqlite3.Error as e:
+        logger.debug(f"Could not update the search index: {e}")
+
+def _vector_index(file_path: str) -> retrieval.VectorIndex:
+    """Returns the embeddings of a chat's messages, made by the "retrieval_embedder" embedder."""
+    from . import retrieval
+    name = _settings().retrieval_embedder
+    if name not in _embedders:
+        _embedders[name] = retrieval.get_embedder(name)
+    vector_dir = os.path.join(CHAT_DIR, retrieval.VECTOR_DIR_NAME)
+    return retrieval.VectorIndex(vector_dir, storage.ChatStore.chat_id(file_path), _embedders[name])
+
+def _embed_messages(file_path: str, messages: list[Message]) -> None:
+    """Embeds the new messages of a chat for retrieval; missed ones are embedded before the next retrieval."""
+    try:
+        count = _vector_index(file_path).update(messages)
+    except (RuntimeError, OSError) as e:
+        logger.debug(f"Could not update the vector index: {e}")
+        return
+    logger.debug(f"Embedded {count} messages")
 
 # ---------------------------
 # Chat Session Management
 # ---------------------------
 def set_current_chat(chat_file: str) -> None:
     """
-    Sets the current chat session.
+    Sets the current chat session of this terminal.
     
     Parameters:
       chat_file (str): The filepath of the chat session to set as current.
     """
     logger.debug(f"Setting current chat: {chat_file}")
-    _write_json(SESSION_FILE, {"current_chat": chat_file})
+    _store().set_current_chat(chat_file, terminal_key())
 
 def get_current_chat() -> str:
     """
-    Gets the current chat session.
+    Gets the current chat session of this terminal.
     
     Returns:
       str: The filepath of the current chat session, or None if not set.
     """
-    data = _read_json(SESSION_FILE)
-    logger.debug(f"Current chat data: {data}")
-    return data.get("current_chat", None)
+    chat_file = _store().get_current_chat(terminal_key())
+    logger.debug(f"Current chat: {chat_file}")
+    return chat_file
 
 def create_or_load_chat(title: str) -> str:
     """
@@ -111,34 +367,31 @@ def create_or_load_chat(title: str) -> str:
     Returns:
       str: The filepath of the chat session JSON file.
     """
-    chat_map = _read_json(CHAT_MAP_FILE)
-    logger.debug(f"Chat map: {chat_map}")
-    if (title in chat_map):
-        chat_id = chat_map[title]
-        logger.debug(f"Loading existing chat session: {title}")
-    else:
-        chat_id = str(uuid.uuid4())
-        chat_map[title] = chat_id
-        _write_json(CHAT_MAP_FILE, chat_map)
-    chat_file = os.path.join(CHAT_DIR, f"{chat_id}.json")
-    if not os.path.exists(chat_file):
+    store = _store()
+    with store.lock():
+        # Another terminal may create the same chat at the same time.
+        chat_id = store.get_chat_id(title)
+        if chat_id is not None:
+            logger.debug(f"Loading existing chat session: {title}")
+        else:
+            chat_id = store.create_chat(title)
+    chat_file = store.chat_file(chat_id)
+    if not store.has_history(chat_file):
         logger.info(f"{Fore.CYAN}Creating new chat session: {title}{Style.RESET_ALL}")
         # New chat: add default system prompt
-        config = _read_json(CONFIG_FILE)
-        logger.debug(f"Config: {config}")
-        if "default_system_prompt" not in config:
-            config["default_system_prompt"] = default_system_prompt
-            _write_json(CONFIG_FILE, config)
-        default_prompt = config.get("default_system_prompt", default_system_prompt)
-        initial_messages = [SystemMessage(content=default_prompt)]
-        _write_messages(chat_file, initial_messages)
+        current = _settings()
+        if "default_system_prompt" not in current.data:
+            # Saved so it can be edited in config.json.
+            settings.update(CONFIG_FILE, default_system_prompt=current.default_system_prompt)
+        default_prompt = current.default_system_prompt
+        # Written as a plain record so creating a chat doesn't need LangChain.
+        store.write_records(chat_file, [{"type": "system", "content": default_prompt, "id": str(uuid.uuid4())}])
     set_current_chat(chat_file)
     return chat_file
 
 def get_chat_titles_list() -> list:
     """Returns a list of all chat session titles."""
-    chat_map = _read_json(CHAT_MAP_FILE)
-    chats = list(chat_map.keys())
+    chats = _store().list_titles()
     chats_str = "\n - ".join(chats)
     logger.info(f"{Fore.CYAN}Chats: \n - {Fore.MAGENTA}{chats_str}{Style.RESET_ALL}")
     return chats
@@ -154,11 +407,7 @@ def rename_chat(old_title: str, new_title: str) -> bool:
     Returns:
       bool: True if successful, False otherwise.
     """
-    chat_map = _read_json(CHAT_MAP_FILE)
-    logger.debug(f"Chat map: {chat_map}")
-    if old_title in chat_map:
-        chat_map[new_title] = chat_map.pop(old_title)
-        _write_json(CHAT_MAP_FILE, chat_map)
+    if _store().rename_chat(old_title, new_title):
         logger.info(f"{Fore.CYAN}Chat session renamed: {Fore.MAGENTA}{old_title} -> {new_title}{Style.RESET_ALL}")
         return True
     logger.error(f"{Fore.RED}Chat session not found: {old_title}{Style.RESET_ALL}")
@@ -174,89 +423,571 @@ def delete_chat(title: str) -> bool:
     Returns:
       bool: True if successful, False otherwise.
     """
-    chat_map = _read_json(CHAT_MAP_FILE)
-    logger.debug(f"Chat map: {chat_map}")
-    if title in chat_map:
-        chat_id = chat_map.pop(title)
-        _write_json(CHAT_MAP_FILE, chat_map)
-        chat_file = os.path.join(CHAT_DIR, f"{chat_id}.json")
-        if os.path.exists(chat_file):
-            os.remove(chat_file)
-            logger.info(f"{Fore.CYAN}Chat session deleted: {Fore.MAGENTA}{title}{Style.RESET_ALL}")
+    removed = _store().delete_chats([title])
+    if removed:
+        for chat_file in removed:
+            _forget_messages(chat_file)
+        _unindex_chats(removed)
+        logger.info(f"{Fore.CYAN}Chat session deleted: {Fore.MAGENTA}{title}{Style.RESET_ALL}")
         return True
     logger.error(f"{Fore.RED}Chat session not found: {title}{Style.RESET_ALL}")
     return False
 
 def save_session(chat_file: str) -> None:
     """
-    Saves the active chat session to session.json.
+    Saves the active chat session.
     
     Parameters:
       chat_file (str): The filepath of the active chat session.
     """
     logger.debug(f"Saving session: {chat_file}")
-    _write_json(SESSION_FILE, {"current_chat": chat_file})
+    _store().set_current_chat(chat_file, terminal_key())
 
 def load_session() -> str:
     """
-    Loads the active chat session from session.json.
+    Loads the active chat session.
     
     Returns:
       str: The filepath of the active chat session, or None if not set.
     """
-    data = _read_json(SESSION_FILE)
-    logger.debug(f"Loaded session data: {data}")
-    return data.get("current_chat", None)
+    chat_file = _store().get_current_chat(terminal_key())
+    logger.debug(f"Loaded session: {chat_file}")
+    return chat_file
+
+def set_data_dir(data_dir: str) -> None:
+    """
+    Uses another data directory for chats, config.json and the sessions.
+    
+    Parameters:
+      data_dir (str): The data directory.
+    """
+    global DATA_DIR, CHAT_DIR, CHAT_MAP_FILE, SESSION_FILE, CONFIG_FILE
+    data_dir = os.path.abspath(os.path.expanduser(data_dir))
+    # Also read by modules below chat_manager, e.g. the executor's settings.
+    paths.set_data_dir(data_dir)
+    if data_dir == DATA_DIR:
+        return
+    DATA_DIR = data_dir
+    CHAT_DIR = os.path.join(DATA_DIR, "chats")
+    CHAT_MAP_FILE = os.path.join(CHAT_DIR, "chat_map.json")
+    SESSION_FILE = os.path.join(DATA_DIR, "session.json")
+    CONFIG_FILE = paths.config_file()
+    _persisted_messages.clear()
+    _persisted_versions.clear()
+    logger.debug(f"Data directory: {DATA_DIR}")
+
+def migrate_legacy_data(directory: str = ".") -> int:
+    """
+    Moves the chats an older version kept in a directory (chats/, config.json
+    and session.json, relative to where ai was run) into the data directory.
+    Runs once per directory: a marker is left in the old chats/ folder, which
+    is otherwise kept as it is. Chats whose title is taken get a numbered title.
+    
+    Parameters:
+      directory (str): The directory to look for old chats in.
+      
+    Returns:
+      int: The number of chats moved.
+    """
+    import shutil
+    legacy_chat_dir = os.path.abspath(os.path.join(directory, "chats"))
+    if legacy_chat_dir == os.path.abspath(CHAT_DIR):
+        return 0
+    if os.path.exists(os.path.join(legacy_chat_dir, LEGACY_MIGRATED_MARKER)):
+        return 0
+    legacy_map_file = os.path.join(legacy_chat_dir, "chat_map.json")
+    if not (os.path.isfile(legacy_map_file) or os.path.isfile(os.path.join(legacy_chat_dir, storage.SQLITE_DB_NAME))):
+        return 0
+    legacy_config = _read_json(os.path.join(directory, "config.json"))
+    if legacy_config and not os.path.exists(CONFIG_FILE):
+        os.makedirs(DATA_DIR, exist_ok=True)
+        _write_json(CONFIG_FILE, legacy_config)
+    if legacy_config.get("storage_backend") == "sqlite":
+        source = storage.SqliteChatStore(legacy_chat_dir)
+    else:
+        source = storage.JsonChatStore(legacy_chat_dir, legacy_map_file, os.path.join(directory, "session.json"))
+    target = _store()
+    with target.lock():
+        legacy_blob_dir = os.path.join(legacy_chat_dir, blobs.BLOB_DIR_NAME)
+        if os.path.isdir(legacy_blob_dir):
+            # Content-addressed: blobs of both directories can simply be merged.
+            shutil.copytree(legacy_blob_dir, _blob_store().blob_dir, dirs_exist_ok=True)
+        count = storage.migrate(source, target, replace=False)
+        _write_json(os.path.join(legacy_chat_dir, LEGACY_MIGRATED_MARKER), {"migrated_to": CHAT_DIR})
+    if isinstance(source, storage.SqliteChatStore):
+        source.close()
+    logger.info(f"{Fore.CYAN}Moved {count} chats from {legacy_chat_dir} to {CHAT_DIR}{Style.RESET_ALL}")
+    return count
+
+def migrate_storage(backend: str) -> int:
+    """
+    Copies all chats into the given storage backend and makes it the active one.
+    The previous backend's files are left in place.
+    
+    Parameters:
+      backend (str): The backend to migrate to ("json" or "sqlite").
+      
+    Returns:
+      int: The number of chats migrated.
+    """
+    if backend not in storage.BACKENDS:
+        logger.error(f"{Fore.RED}Unknown storage backend: {backend}. Choose one of: {', '.join(storage.BACKENDS)}{Style.RESET_ALL}")
+        return 0
+    current = _settings()
+    if current.storage_backend == backend:
+        logger.info(f"{Fore.CYAN}Chats are already stored with the {backend} backend.{Style.RESET_ALL}")
+        return 0
+    source = _store()
+    target = _create_store(backend)
+    target.compression = current.chat_compression
+    _stores[(backend, CHAT_DIR, CHAT_MAP_FILE, SESSION_FILE)] = target
+    count = storage.migrate(source, target)
+    settings.update(CONFIG_FILE, storage_backend=backend)
+    _persisted_messages.clear()
+    _persisted_versions.clear()
+    logger.info(f"{Fore.CYAN}Migrated {count} chats to the {backend} backend.{Style.RESET_ALL}")
+    return count
+
+def set_chat_compression(compression: str) -> int:
+    """
+    Sets the compression of chat files ("none", "gzip" or "zstd"), saved in
+    config.json, and rewrites the existing chats with it. Chats are read
+    transparently whatever their compression. Only the json backend compresses.
+    
+    Parameters:
+      compression (str): The compression to use.
+      
+    Returns:
+      int: The number of chats rewritten.
+    """
+    if compression not in journal.COMPRESSIONS:
+        logger.error(f"{Fore.RED}Unknown compression: {compression}. Choose one of: {', '.join(journal.COMPRESSIONS)}{Style.RESET_ALL}")
+        return 0
+    if compression == "zstd":
+        try:
+            import zstandard  # noqa: F401
+        except ImportError:
+            logger.error(f"{Fore.RED}zstd compression needs the zstandard package: pip install zstandard{Style.RESET_ALL}")
+            return 0
+    settings.update(CONFIG_FILE, chat_compression=compression)
+    store = _store()
+    if not isinstance(store, storage.JsonChatStore):
+        logger.warning(f"{Fore.YELLOW}Chats in the {_settings().storage_backend} backend are not compressed.{Style.RESET_ALL}")
+        return 0
+    count = 0
+    for title in store.list_titles():
+        chat_file = store.chat_file(store.get_chat_id(title))
+        if store.has_history(chat_file):
+            store.write_records(chat_file, store.read_records(chat_file))
+            _forget_messages(chat_file)
+            count += 1
+    logger.info(f"{Fore.CYAN}Chat compression set to {compression}; rewrote {count} chats.{Style.RESET_ALL}")
+    return count
 
 # ---------------------------
 # Messaging Functions
 # ---------------------------
-def _handle_tool_calls(ai_message: AIMessage) -> list[BaseMessage]:
-    """Handle tool calls from AI response and append tool messages to conversation."""
+def _response_cache():
+    """
+    Returns the on-disk response cache, or None unless it is enabled in
+    config.json ("response_cache") and the model runs at temperature 0.
+    """
+    current = _settings()
+    if not current.response_cache or current.temperature != 0:
+        return None
+    from .response_cache import ResponseCache, CACHE_DB_NAME
+    db_file = os.path.join(CHAT_DIR, CACHE_DB_NAME)
+    if db_file not in _response_caches:
+        _response_caches[db_file] = ResponseCache(db_file)
+    cache = _response_caches[db_file]
+    cache.max_bytes = int(current.response_cache_max_mb * 1024 * 1024)
+    cache.ttl = current.response_cache_ttl_hours * 3600
+    return cache
+
+def _cacheable(response: AIMessage) -> dict:
+    # Cached responses get a fresh id each time they are used.
+    data = _dump_message(response)
+    data.pop("id", None)
+    return data
+
+def _summarize(previous_summary: str, messages: list[Message]) -> str:
+    """Folds messages that rolled off the context window into the running summary."""
+    from langchain_core.messages import HumanMessage, SystemMessage
+    from .llms import get_llm, client_key
+    from . import context
+    transcript = context.render_transcript(messages)
+    request = f"Current summary:\n{previous_summary or '(empty)'}\n\nConversation to add:\n{transcript}"
+    cache = _response_cache()
+    if cache is not None:
+        from .response_cache import cache_key
+        key = cache_key(client_key(), summary_prompt, request)
+        cached = cache.get(key)
+        if cached is not None:
+            return cached["content"]
+    with profiling.span("summarize", "llm") as span, Spinner("Summarizing"):
+        response = get_llm().invoke([SystemMessage(content=summary_prompt), HumanMessage(content=request)])
+        span.update(_token_usage(response))
+    if cache is not None:
+        cache.put(key, _cacheable(response))
+    return response.content
+
+def _add_relevant_messages(chat_file: str, messages: list[Message], context_messages: list[Message], top_k: int) -> list[Message]:
+    """
+    Adds the top_k older messages (those before the context window) that are
+    most relevant to the latest user message to context_messages, see
+    retrieval. They go right before the latest user message rather than into
+    the system prompt, so the prompt prefix stays the same across turns.
+    """
+    from langchain_core.messages import HumanMessage
+    from . import context
+    # Messages before the verbatim window (the system prompt is replaced).
+    end = len(messages) - (len(context_messages) - 1)
+    query = next((msg.content for msg in reversed(messages) if msg.type == "human"), None)
+    if end <= 1 or not isinstance(query, str) or not query:
+        return context_messages
+    index = _vector_index(chat_file)
+    try:
+        index.update(messages)
+        positions = index.most_relevant(query, end, top_k)
+    except (RuntimeError, OSError) as e:
+        logger.warning(f"{Fore.YELLOW}Skipping retrieval of earlier messages: {e}{Style.RESET_ALL}")
+        return context_messages
+    if not positions:
+        return context_messages
+    logger.debug(f"Retrieved messages {positions}")
+    transcript = context.render_transcript([messages[i] for i in positions])
+    retrieved = HumanMessage(content=f"{retrieved_context_prefix}\n{transcript}")
+    latest = max(i for i, msg in enumerate(context_messages) if msg.type == "human")
+    return context_messages[:latest] + [retrieved] + context_messages[latest:]
+
+def _prepare_context(chat_file: str, messages: list[Message]) -> list:
+    """
+    Returns the OpenAI-format messages to send to the model, keeping the newest
+    turns within the configured "context_token_budget" and the older ones as a
+    persisted rolling summary, plus the older messages most relevant to the
+    request if "retrieval_top_k" is set.
+    """
+    from langchain_core.messages.utils import convert_to_openai_messages
+    from . import context
+    with profiling.span("prepare_context", "context", messages=len(messages)):
+        budget = _settings().context_token_budget
+        store = _store()
+        meta = store.read_meta(chat_file)
+        context_messages, summary_state = context.build_context(messages, budget, meta, _summarize)
+        if summary_state is not None:
+            meta["context_summary"] = summary_state
+            store.write_meta(chat_file, meta)
+        top_k = _settings().retrieval_top_k
+        if top_k and context_messages is not messages:
+            context_messages = _add_relevant_messages(chat_file, messages, context_messages, top_k)
+        # Only the messages sent to the model are built as LangChain messages.
+        return convert_to_openai_messages(materialize(context_messages))
+
+async def _invoke_tool(tool, tool_call: dict) -> ToolMessage:
+    """Runs one tool call; failing and unknown tools are answered with an error ToolMessage."""
+    from langchain_core.messages import ToolMessage
+    tool_name = tool_call["name"]
+    tool_call_id = tool_call["id"]
+    with profiling.span("tool", "tool", tool=tool_name, args=tool_call.get("args")) as span:
+        try:
+            if tool is None:
+                raise ValueError(f"Unknown tool: {tool_name}")
+            tool_response: ToolMessage = await tool.ainvoke(tool_call)
+            tool_response.tool_call_id = tool_call_id
+            # The function the model called, even if another tool ran it (direct
+            # mode); Gemini matches function responses to calls by name.
+            tool_response.name = tool_name
+            span["output_chars"] = len(str(tool_response.content))
+            return _compress_tool_output(tool_response)
+        except Exception as e:
+            span["error"] = str(e)
+            logger.error(f"{Fore.RED}Error executing tool {tool_name}: {e}{Style.RESET_ALL}")
+            # Answer the tool call with the error, so the agent can react to it
+            return ToolMessage(
+                content=f"Error executing tool {tool_name}: {e}",
+                tool_call_id=tool_call_id,
+                name=tool_name,
+                status="error",
+            )
+
+async def _run_tool_calls_in_parallel(tool_calls: list[dict], tools_dict: dict, messages: list[Message], max_parallel: int) -> None:
+    """
+    Runs shell tool calls concurrently, at most max_parallel at a time, and
+    appends their results to messages in the order of the tool calls.
+    
+    Python calls run afterwards, one at a time: the REPL redirects the
+    process-wide sys.stdout while it executes, which would capture the output
+    of anything running next to it.
+    """
+    import asyncio
+    limit = asyncio.Semaphore(max_parallel)
+
+    async def run_limited(tool_call: dict) -> ToolMessage:
+        async with limit:
+            return await _invoke_tool(tools_dict.get(tool_call["name"]), tool_call)
+
+    tasks = {
+        tool_call["id"]: asyncio.ensure_future(run_limited(tool_call))
+        for tool_call in tool_calls if tool_call["name"] != "run_python_code"
+    }
+    results = {}
+    try:
+        for tool_call in tool_calls:
+            if tool_call["id"] in tasks:
+                results[tool_call["id"]] = await tasks[tool_call["id"]]
+        for tool_call in tool_calls:
+            if tool_call["id"] not in results:
+                results[tool_call["id"]] = await _invoke_tool(tools_dict.get(tool_call["name"]), tool_call)
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        # Cancelling a command kills it; keep what finished, the caller answers the rest.
+        for task in tasks.values():
+            task.cancel()
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+        for tool_call_id, task in tasks.items():
+            if tool_call_id not in results and task.done() and not task.cancelled() and task.exception() is None:
+                results[tool_call_id] = task.result()
+        messages.extend(results[tool_call["id"]] for tool_call in tool_calls if tool_call["id"] in results)
+        raise
+    messages.extend(results[tool_call["id"]] for tool_call in tool_calls)
+
+async def _handle_tool_calls(ai_message: AIMessage, messages: list[Message]) -> None:
+    """
+    Runs the tool calls of an AI response and appends a ToolMessage for each
+    of them to messages. In direct mode, shell commands run without
+    confirmation and several of them run at the same time.
+    """
+    from .tools import tools, direct_windows_shell_tool, parallel_shell_tool
     logger.debug(f"AI message tool calls: {ai_message.tool_calls}")
     if not ai_message.tool_calls:
-        return []
-    messages = []
+        return
 
+    current = _settings()
+    direct = current.direct_tools
+    max_parallel = current.max_parallel_tools
+    parallel = direct and len(ai_message.tool_calls) > 1 and max_parallel > 1
+    shell_tool = tools[0]
+    if direct:
+        # Output is only streamed live when commands don't run side by side.
+        shell_tool = parallel_shell_tool if parallel else direct_windows_shell_tool
     tools_dict = {
-        "interactive_windows_shell_tool": tools[0],
+        "interactive_windows_shell_tool": shell_tool,
         "run_python_code": tools[1]
     }
     logger.info(f"{Fore.YELLOW}AI wants to run commands...{Style.RESET_ALL}")
 
+    if parallel:
+        await _run_tool_calls_in_parallel(ai_message.tool_calls, tools_dict, messages, max_parallel)
+        return
     for tool_call in ai_message.tool_calls:
-        tool_name = None
+        messages.append(await _invoke_tool(tools_dict.get(tool_call["name"]), tool_call))
+
+def _cancel_pending_tool_calls(messages: list[Message]) -> None:
+    """
+    Answers the tool calls of the last AI response that have no result yet
+    (e.g. after Ctrl-C), so the history stays valid for the next model call.
+    """
+    from langchain_core.messages import ToolMessage
+    for i in reversed(range(len(messages))):
+        if messages[i].type == "ai":
+            answered = {msg.tool_call_id for msg in messages[i + 1:] if msg.type == "tool"}
+            for tool_call in messages[i].tool_calls:
+                if tool_call["id"] not in answered:
+                    messages.append(ToolMessage(
+                        content="Cancelled: the user interrupted the command.",
+                        tool_call_id=tool_call["id"],
+                        name=tool_call["name"],
+                        status="error",
+                    ))
+            return
+
+async def _stream_response(llm, context_messages: list) -> AIMessage:
+    """
+    Streams a model response to the terminal as it is generated and returns
+    the assembled AIMessage, including tool calls built from the streamed chunks.
+    """
+    from langchain_core.messages import AIMessage
+    from langchain_core.messages.utils import message_chunk_to_message
+    chunks = aiter(llm.astream(context_messages))
+    # Keep the spinner until the first chunk arrives.
+    with Spinner("Thinking"):
+        response = await anext(chunks, None)
+    if response is None:
+        return AIMessage(content="")
+    printed = False
+
+    def show(chunk) -> None:
+        nonlocal printed
+        if isinstance(chunk.content, str) and chunk.content:
+            if not printed:
+                print(f"{Fore.GREEN}AI: ", end="")
+                printed = True
+            print(chunk.content, end="", flush=True)
+
+    show(response)
+    async for chunk in chunks:
+        response += chunk
+        show(chunk)
+    if printed:
+        print(Style.RESET_ALL)
+    return message_chunk_to_message(response)
+
+def _token_usage(response: AIMessage) -> dict:
+    """Returns the input, output and provider-cached tokens of a response, as far as the provider reports them."""
+    usage = getattr(response, "usage_metadata", None) or {}
+    details = usage.get("input_token_details") or {}
+    tokens = {field: usage[field] for field in ("input_tokens", "output_tokens") if usage.get(field) is not None}
+    if details.get("cache_read") is not None:
+        tokens["cache_read"] = details["cache_read"]
+    return tokens
+
+def _record_prompt_cache_usage(response: AIMessage) -> None:
+    """Adds the prompt tokens of a response, and how many the provider served from its prompt cache, to the totals."""
+    tokens = _token_usage(response)
+    input_tokens = tokens.get("input_tokens") or 0
+    cache_read = tokens.get("cache_read") or 0
+    _prompt_cache_usage["calls"] += 1
+    _prompt_cache_usage["input_tokens"] += input_tokens
+    _prompt_cache_usage["cache_read"] += cache_read
+    logger.debug(f"Prompt tokens: {input_tokens}, read from the provider's prompt cache: {cache_read}")
+
+def prompt_cache_usage() -> dict:
+    """
+    Returns the model calls made by this process, with their prompt tokens
+    ("input_tokens") and how many of them were provider cache hits ("cache_read").
+    """
+    return dict(_prompt_cache_usage)
+
+def _record_response(response: AIMessage) -> None:
+    """Appends a model response to the recording, if one is being made (see fake_llm)."""
+    from .fake_llm import recording_file, record_response
+    from .llms import OFFLINE_PROVIDERS
+    recording = recording_file()
+    if recording and _settings().provider not in OFFLINE_PROVIDERS:
+        record_response(recording, _cacheable(response))
+
+async def _invoke_llm(llm, context_messages: list, stream: bool, cache=None, client_key: tuple = None) -> AIMessage:
+    """
+    Gets one model response, streamed to the terminal or behind a spinner.
+    With a response cache, identical calls are answered from the cache.
+    """
+    from langchain_core.messages import AIMessage
+    with profiling.span("llm", "llm", messages=len(context_messages), stream=stream) as span:
+        key = None
+        if cache is not None:
+            from .response_cache import cache_key
+            key = cache_key(client_key, context_messages)
+            cached = cache.get(key)
+            if cached is not None:
+                logger.debug("Answered from the response cache")
+                span["response_cache"] = True
+                response = AIMessage(**cached)
+                if stream and response.content:
+                    print(f"{Fore.GREEN}AI: {response.content}{Style.RESET_ALL}")
+                return response
+        if stream:
+            response = await _stream_response(llm, context_messages)
+        else:
+            with Spinner("Thinking"):
+                response = await llm.ainvoke(context_messages)
+        span.update(_token_usage(response), tool_calls=len(response.tool_calls))
+    _record_prompt_cache_usage(response)
+    _record_response(response)
+    if key is not None:
+        cache.put(key, _cacheable(response))
+    return response
+
+async def _run_agent_loop(chat_file: str, current_messages: list[Message]) -> AIMessage:
+    """
+    Calls the model and runs the tool calls it requests until it returns a final
+    answer. All responses and tool results are appended to current_messages.
+    
+    Parameters:
+      chat_file (str): The chat session the messages belong to.
+      current_messages (list[Message]): The history, ending with the new human message.
+      
+    Returns:
+      AIMessage: The final AI response.
+    
+    Raises:
+      KeyboardInterrupt, asyncio.CancelledError: If the user interrupted the
+        model or a tool (or the task was cancelled). Tool calls left without a
+        result have been answered as cancelled, so the messages can still be saved.
+    """
+    import asyncio
+    from .llms import get_bound_llm, client_key
+    with profiling.span("load_model", "startup"):
+        from .tools import tools_functions
+        llm = get_bound_llm(tools_functions)
+    logger.debug(f"LLM: {llm}")
+    stream = _settings().stream
+    cache = _response_cache()
+    key = client_key(tools_functions) if cache is not None else None
+
+    try:
+        context_messages = _prepare_context(chat_file, current_messages)
+        ai_response = await _invoke_llm(llm, context_messages, stream, cache, key)
+        logger.debug(f"AI response: {ai_response}")
+        current_messages.append(ai_response)
+
+        # Handle tool calls outside the spinner
+        while ai_response.tool_calls and len(ai_response.tool_calls) > 0:
+            await _handle_tool_calls(ai_response, current_messages)
+
+            # Get next response
+            context_messages = _prepare_context(chat_file, current_messages)
+            ai_response = await _invoke_llm(llm, context_messages, stream, cache, key)
+            logger.debug(f"AI follow-up response: {ai_response}")
+            current_messages.append(ai_response)
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        _cancel_pending_tool_calls(current_messages)
+        raise
+
+    # Display final AI response (already shown while streaming)
+    if not stream:
+        logger.info(f"{Fore.GREEN}AI: {ai_response.content}{Style.RESET_ALL}")
+    return ai_response
+
+async def _complete_turn(chat_file: str, current_messages: list[Message]) -> AIMessage:
+    """Runs the agent loop and saves the chat; an interrupted turn is saved as far as it got."""
+    import asyncio
+    with profiling.span("turn", "turn"):
         try:
-            tool_name = tool_call["name"]
-            tool_call_id = tool_call["id"]
-            if tool_name not in tools_dict:
-                logger.error(f"{Fore.RED}Unknown tool: {tool_name}{Style.RESET_ALL}")
-                continue
-                
-            tool = tools_dict[tool_name]
-            tool_response: ToolMessage = tool.invoke(tool_call)
-            tool_response.tool_call_id = tool_call_id
-            messages.append(tool_response)
+            ai_response = await _run_agent_loop(chat_file, current_messages)
+        except (KeyboardInterrupt, asyncio.CancelledError):
+            _write_messages(chat_file, current_messages)
+            raise
+        _write_messages(chat_file, current_messages)
+        return ai_response
 
-        except Exception as e:
-            logger.error(f"{Fore.RED}Error executing tool {tool_name}: {e}{Style.RESET_ALL}")
-            # Append an error message to the conversation
-            error_message = AIMessage(content=f"Error executing tool {tool_name}: {e}")
-            messages.append(error_message)
-    return messages
+def _run_sync(coroutine):
+    """
+    Runs a coroutine for the synchronous API. All calls share one event loop,
+    so the async HTTP clients of the cached model clients stay usable.
+    """
+    global _runner
+    if _runner is None:
+        import asyncio
+        import atexit
+        _runner = asyncio.Runner()
+        atexit.register(_runner.close)
+    return _runner.run(coroutine)
 
-def send_message(message: str) -> str:
+async def send_message_async(message: str) -> str:
     """
     Handles message sending in two scenarios:
     1. No current chat: Creates a new temp chat with system prompt
     2. Existing chat: Appends to existing conversation
     
+    Model calls and commands run asynchronously, so this can be awaited from
+    an application's own event loop.
+    
     Parameters:
       message (str): The human message.
       
     Returns:
       str: The AI's response.
     """
+    from langchain_core.messages import HumanMessage, SystemMessage
     # Get or create chat session
     chat_file = get_current_chat()
     logger.debug(f"Chat file: {chat_file}")
@@ -269,10 +1000,8 @@ def send_message(message: str) -> str:
     logger.debug(f"Current messages: {current_messages}")
     
     # Ensure system prompt exists at the start
-    if len(current_messages) == 0 or not isinstance(current_messages[0], SystemMessage):
-        config = _read_json(CONFIG_FILE)
-        logger.debug(f"Config: {config}")
-        default_prompt = config.get("default_system_prompt", default_system_prompt)
+    if len(current_messages) == 0 or current_messages[0].type != "system":
+        default_prompt = _settings().default_system_prompt
         current_messages.insert(0, SystemMessage(content=default_prompt))
     
     # Append new human message
@@ -280,37 +1009,26 @@ def send_message(message: str) -> str:
     current_messages.append(human_message)
     logger.debug(f"Appended human message: {human_message}")
     # Log human message with correct index
-    human_count = sum(1 for msg in current_messages if isinstance(msg, HumanMessage))
+    human_count = sum(1 for msg in current_messages if msg.type == "human")
     logger.info(f"{Fore.BLUE}User[{human_count-1}]: {message}{Style.RESET_ALL}")
     
     # Get AI response with complete history
-    llm = get_llm().bind_tools(tools_functions)
+    ai_response = await _complete_turn(chat_file, current_messages)
+    return ai_response.content
 
-    ai_response: AIMessage = None
-    # Process response
-    with Spinner("Thinking"):
-        # Initial AI response
-        ai_response = llm.invoke(convert_to_openai_messages(current_messages))
-        logger.debug(f"AI response: {ai_response}")
-        current_messages.append(ai_response)
-    
-    # Handle tool calls outside the spinner
-    while ai_response.tool_calls and len(ai_response.tool_calls) > 0:
-        tool_messages = _handle_tool_calls(ai_response)
-        current_messages.extend(tool_messages)
-        
-        # Get next response with spinner
-        with Spinner("Thinking"):
-            ai_response = llm.invoke(convert_to_openai_messages(current_messages))
-            logger.debug(f"AI follow-up response: {ai_response}")
-            current_messages.append(ai_response)
+def send_message(message: str) -> str:
+    """
+    Synchronous version of send_message_async, used by the CLI.
     
-    # Display final AI response
-    logger.info(f"{Fore.GREEN}AI: {ai_response.content}{Style.RESET_ALL}")
-    _write_messages(chat_file, current_messages)
-    return ai_response.content
+    Parameters:
+      message (str): The human message.
+      
+    Returns:
+      str: The AI's response.
+    """
+    return _run_sync(send_message_async(message))
 
-def start_temp_chat(message: str) -> str:
+async def start_temp_chat_async(message: str) -> str:
     """
     Starts a temporary (in-memory) chat session with the default system prompt,
     appends the human message and the AI response (powered by ChatOpenAI with bound tools),
@@ -325,6 +1043,7 @@ def start_temp_chat(message: str) -> str:
     Returns:
       str: The final AI's response.
     """
+    from langchain_core.messages import HumanMessage, SystemMessage
     console_session_id = _get_console_session_id()
     logger.debug(f"Console session ID: {console_session_id}")
     chat_file = create_or_load_chat(console_session_id)
@@ -332,45 +1051,32 @@ def start_temp_chat(message: str) -> str:
     
     current_messages = _read_messages(chat_file)
     logger.debug(f"Messages: {current_messages}")
-    if not any(isinstance(msg, SystemMessage) for msg in current_messages):
-        config = _read_json(CONFIG_FILE)
-        logger.debug(f"Config: {config}")
-        default_prompt = config.get("default_system_prompt", default_system_prompt)
+    if not any(msg.type == "system" for msg in current_messages):
+        default_prompt = _settings().default_system_prompt
         current_messages.insert(0, SystemMessage(content=default_prompt))
     
-    human_message_count = sum(1 for msg in current_messages if isinstance(msg, HumanMessage))
+    human_message_count = sum(1 for msg in current_messages if msg.type == "human")
     human_index = human_message_count + 1
     
     current_messages.append(HumanMessage(content=message))
     logger.debug(f"{Fore.BLUE}User[{human_index}]: {message}{Style.RESET_ALL}")
     
-    llm = get_llm().bind_tools(tools_functions)
-    logger.debug(f"LLM: {llm}")
-    
-    # Get initial AI response with spinner
-    with Spinner("Thinking"):
-        ai_response: AIMessage = llm.invoke(convert_to_openai_messages(current_messages))
-        logger.debug(f"AI response: {ai_response}")
-        current_messages.append(ai_response)
-    
-    # Handle tool calls outside the spinner
-    while ai_response.tool_calls and len(ai_response.tool_calls) > 0:
-        tool_messages = _handle_tool_calls(ai_response)
-        current_messages.extend(tool_messages)
-        
-        # Get next response with spinner
-        with Spinner("Thinking"):
-            ai_response = llm.invoke(convert_to_openai_messages(current_messages))
-            logger.debug(f"AI follow-up response: {ai_response}")
-            current_messages.append(ai_response)
-    
-    # Display final AI response
-    logger.info(f"{Fore.GREEN}AI: {ai_response.content}{Style.RESET_ALL}")
-    
     set_current_chat(chat_file)
-    _write_messages(chat_file, current_messages)
+    ai_response = await _complete_turn(chat_file, current_messages)
     return ai_response.content
 
+def start_temp_chat(message: str) -> str:
+    """
+    Synchronous version of start_temp_chat_async, used by the CLI.
+    
+    Parameters:
+      message (str): The initial message for the temporary chat.
+      
+    Returns:
+      str: The final AI's response.
+    """
+    return _run_sync(start_temp_chat_async(message))
+
 def edit_message(index: Optional[int], new_message: str) -> bool:
     """
     Edits a previous message at the given index and truncates subsequent messages.
@@ -394,7 +1100,7 @@ def edit_message(index: Optional[int], new_message: str) -> bool:
     if index is None:
         # Find the last human message
         for i in reversed(range(len(messages))):
-            if isinstance(messages[i], HumanMessage):
+            if messages[i].type == "human":
                 index = i
                 break
         if index is None:
@@ -412,19 +1118,26 @@ def edit_message(index: Optional[int], new_message: str) -> bool:
     return True
 
 def flush_temp_chats() -> None:
-    """Removes all temporary chat sessions."""
-    chat_map = _read_json(CHAT_MAP_FILE)
-    logger.debug(f"Chat map: {chat_map}")
+    """
+    Removes all temporary chat sessions, then the sessions of terminals that
+    are gone and the stored outputs no chat refers to anymore (including
+    those of chats deleted with delete_chat).
+    """
+    store = _store()
     # Identify titles beginning with "temp_"
-    to_remove = [title for title in chat_map if title.startswith("temp_")]
-    for title in to_remove:
-        chat_id = chat_map.pop(title)
-        chat_file = os.path.join(CHAT_DIR, f"{chat_id}.json")
-        if os.path.exists(chat_file):
-            os.remove(chat_file)
-            logger.debug(f"{Fore.CYAN}Removed temporary chat: {Fore.MAGENTA}{title}{Style.RESET_ALL}")
-    logger.debug(f"Updated chat map: {chat_map}")
-    _write_json(CHAT_MAP_FILE, chat_map)
+    to_remove = [title for title in store.list_titles() if title.startswith("temp_")]
+    removed = store.delete_chats(to_remove)
+    for chat_file in removed:
+        _forget_messages(chat_file)
+    if removed:
+        _unindex_chats(removed)
+    with store.lock():
+        chat_files = {store.chat_file(store.get_chat_id(title)) for title in store.list_titles()}
+        pruned = store.prune_sessions(chat_files)
+    logger.debug(f"Removed {pruned} stale terminal sessions")
+    # Scans every chat, so only done here rather than on each delete_chat.
+    _collect_blob_garbage()
+    logger.debug(f"{Fore.CYAN}Removed temporary chats: {Fore.MAGENTA}{to_remove}{Style.RESET_ALL}")
 
 # ---------------------------
 # System Prompt Management
@@ -436,12 +1149,82 @@ def set_default_system_prompt(prompt_text: str) -> None:
     Parameters:
       prompt_text (str): The default system prompt.
     """
-    config = _read_json(CONFIG_FILE)
-    logger.debug(f"Config: {config}")
-    config["default_system_prompt"] = prompt_text
-    _write_json(CONFIG_FILE, config)
+    settings.update(CONFIG_FILE, default_system_prompt=prompt_text)
     logger.info(f"{Fore.CYAN}Default system prompt saved to config.json{Style.RESET_ALL}")
 
+def set_streaming(enabled: bool) -> None:
+    """
+    Enables or disables streaming AI responses to the terminal, saved in config.json.
+    
+    Parameters:
+      enabled (bool): Whether responses should be streamed.
+    """
+    settings.update(CONFIG_FILE, stream=enabled)
+    logger.info(f"{Fore.CYAN}Response streaming {'enabled' if enabled else 'disabled'}{Style.RESET_ALL}")
+
+def set_response_cache(enabled: bool) -> None:
+    """
+    Enables or disables the on-disk response cache, saved in config.json. The
+    cache only answers calls made at temperature 0.
+    
+    Parameters:
+      enabled (bool): Whether identical model calls should be answered from the cache.
+    """
+    settings.update(CONFIG_FILE, response_cache=enabled)
+    logger.info(f"{Fore.CYAN}Response cache {'enabled' if enabled else 'disabled'}{Style.RESET_ALL}")
+    temperature = _settings().temperature
+    if enabled and temperature != 0:
+        logger.warning(f"{Fore.YELLOW}The cache is only used at temperature 0 (current: {temperature}).{Style.RESET_ALL}")
+
+def clear_response_cache() -> None:
+    """Removes all cached model responses."""
+    from .response_cache import ResponseCache, CACHE_DB_NAME
+    db_file = os.path.join(CHAT_DIR, CACHE_DB_NAME)
+    if not os.path.exists(db_file):
+        logger.info(f"{Fore.CYAN}The response cache is empty.{Style.RESET_ALL}")
+        return
+    cache = _response_caches.get(db_file) or ResponseCache(db_file)
+    count = cache.clear()
+    logger.info(f"{Fore.CYAN}Removed {count} cached responses.{Style.RESET_ALL}")
+
+def set_setting(key: str, value: str) -> bool:
+    """
+    Changes a setting of config.json, see settings.CONFIG_FIELDS.
+    
+    Parameters:
+      key (str): The name of the setting.
+      value (str): The new value, converted to the setting's type.
+      
+    Returns:
+      bool: True if successful, False if the setting or value is invalid.
+    """
+    try:
+        parsed = settings.parse_value(key, value)
+    except KeyError:
+        logger.error(f"{Fore.RED}Unknown setting: {key}. Settings: {', '.join(settings.CONFIG_FIELDS)}{Style.RESET_ALL}")
+        return False
+    except ValueError:
+        logger.error(f"{Fore.RED}Invalid value for {key}: {value}{Style.RESET_ALL}")
+        return False
+    settings.update(CONFIG_FILE, **{key: parsed})
+    logger.info(f"{Fore.CYAN}Set {key} to {Fore.MAGENTA}{parsed!r}{Style.RESET_ALL}")
+    return True
+
+def set_direct_tools(enabled: bool) -> None:
+    """
+    Enables or disables direct mode, saved in config.json. In direct mode the
+    agent's shell commands run without confirmation, and independent commands
+    of one response run in parallel.
+    
+    Parameters:
+      enabled (bool): Whether the agent's commands should run without confirmation.
+    """
+    settings.update(CONFIG_FILE, direct_tools=enabled)
+    if enabled:
+        logger.info(f"{Fore.YELLOW}Direct mode enabled: the AI's commands will run without confirmation{Style.RESET_ALL}")
+    else:
+        logger.info(f"{Fore.CYAN}Direct mode disabled: the AI's commands need your confirmation{Style.RESET_ALL}")
+
 def update_system_prompt(prompt_text: str) -> None:
     """
     Updates the system prompt for the active chat session.
@@ -449,6 +1232,7 @@ def update_system_prompt(prompt_text: str) -> None:
     Parameters:
       prompt_text (str): The new system prompt.
     """
+    from langchain_core.messages import SystemMessage
     chat_file = load_session()
     logger.debug(f"Chat file: {chat_file}")
     if not chat_file:
@@ -471,6 +1255,8 @@ def execute(command: str) -> str:
     Returns:
       str: The command output.
     """
+    from langchain_core.messages import HumanMessage, SystemMessage
+    from .tools import user_shell_tool
     # Get or create chat session
     chat_file = get_current_chat()
     logger.debug(f"Chat file: {chat_file}")
@@ -484,14 +1270,12 @@ def execute(command: str) -> str:
     logger.debug(f"Current messages: {current_messages}")
     
     # Ensure system prompt exists
-    if not any(isinstance(msg, SystemMessage) for msg in current_messages):
-        config = _read_json(CONFIG_FILE)
-        logger.debug(f"Config: {config}")
-        default_prompt = config.get("default_system_prompt", default_system_prompt)
+    if not any(msg.type == "system" for msg in current_messages):
+        default_prompt = _settings().default_system_prompt
         current_messages.insert(0, SystemMessage(content=default_prompt))
     
     # Execute command and get output
-    output = direct_windows_shell_tool.invoke({"command": command})
+    output = user_shell_tool.invoke({"command": command})
     logger.debug(f"Command output: {output}")
     
     # Append new command message
@@ -512,39 +1296,75 @@ def list_messages(chat_title:Optional[str]=None):
         to print. If not provided, the current chat is used.
         
     """
+    store = _store()
     if not chat_title:
         chat_file = get_current_chat()
         if not chat_file:
             logger.error(f"{Fore.RED}No active chat session to list messages from.{Style.RESET_ALL}")
             return
-        # Find corresponding title from chat_map
-        chat_map = _read_json(CHAT_MAP_FILE)
-        for t, cid in chat_map.items():
-            if os.path.join(CHAT_DIR, f"{cid}.json") == chat_file:
-                chat_title = t
-                break
+        # Find corresponding title in the chat store
+        chat_title = store.get_title(chat_file)
 
-    chat_map = _read_json(CHAT_MAP_FILE)
-    logger.debug(f"Chat map: {chat_map}")
-    chat_id = chat_map.get(chat_title, None)
+    chat_id = store.get_chat_id(chat_title)
     if not chat_id:
         logger.error(f"{Fore.RED}Chat session not found: {chat_title}{Style.RESET_ALL}")
         return
-    chat_file = os.path.join(CHAT_DIR, f"{chat_id}.json")
-    current_messages = _read_messages(chat_file)
-    logger.debug(f"Chat messages: {current_messages}")
+    chat_file = store.chat_file(chat_id)
+    # Rendered from message views: stored outputs are only loaded when printed.
     user_messages = 0
-    for i, msg in enumerate(current_messages):
-        if isinstance(msg, SystemMessage):
-            logger.debug(f"{Fore.MAGENTA}System: {msg.content}{Style.RESET_ALL}")
-        elif isinstance(msg, HumanMessage):
+    for msg in _read_messages(chat_file):
+        if msg.type == "system":
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"{Fore.MAGENTA}System: {msg.content}{Style.RESET_ALL}")
+        elif msg.type == "human":
             logger.info(f"{Fore.BLUE}User[{user_messages}]: {msg.content}{Style.RESET_ALL}")
             user_messages += 1
-        elif isinstance(msg, AIMessage):
+        elif msg.type == "ai":
             logger.info(f"{Fore.GREEN}AI: {msg.content}{Style.RESET_ALL}")
-        elif isinstance(msg, ToolMessage):
-            logger.info(f"{Fore.YELLOW}Tool: {msg.content}{Style.RESET_ALL}")
+        elif msg.type == "tool":
+            logger.info(f"{Fore.YELLOW}Tool: {_full_tool_output(msg)}{Style.RESET_ALL}")
             
+def search_chats(query: str, limit: int = 20) -> list[dict]:
+    """
+    Searches the messages of all chats and prints the best matches.
+    Chats changed without updating the search index are re-indexed first.
+    
+    Parameters:
+      query (str): The words to look for.
+      limit (int): The maximum number of matches.
+      
+    Returns:
+      list[dict]: The matches, best first, with the chat "title", the "index"
+        of the message in the chat history (as used by -e), its "type" and
+        a "snippet" of its content.
+    """
+    from . import search
+    store = _store()
+    index = _search_index()
+    titles = {chat_id: title for title, chat_id in store.chat_ids().items()}
+    with store.lock():
+        indexed = index.versions()
+        for chat_id in titles:
+            chat_file = store.chat_file(chat_id)
+            version = store.history_version(chat_file)
+            if indexed.get(chat_id) != index.encode_version(version):
+                logger.debug(f"Indexing {chat_file}")
+                index.update(chat_id, 0, read_views(store.read_records(chat_file), _blob_store()), version)
+        index.remove_chats(set(indexed) - set(titles))
+    results = [
+        {"title": titles[chat_id], "index": seq, "type": msg_type, "snippet": snippet}
+        for chat_id, seq, msg_type, snippet in index.search(query, limit)
+    ]
+    if not results:
+        logger.info(f"{Fore.YELLOW}No messages found for: {query}{Style.RESET_ALL}")
+    labels = {"human": ("User", Fore.BLUE), "ai": ("AI", Fore.GREEN), "tool": ("Tool", Fore.YELLOW)}
+    for result in results:
+        label, color = labels[result["type"]]
+        snippet = " ".join(result["snippet"].split())
+        snippet = snippet.replace(search.MATCH_START, Style.BRIGHT).replace(search.MATCH_END, Style.NORMAL)
+        logger.info(f"{Fore.MAGENTA}{result['title']}{Style.RESET_ALL} [{result['index']}] {color}{label}: {snippet}{Style.RESET_ALL}")
+    return results
+
 def current_chat_title():
     """
     Prints the title of the current chat session.
@@ -553,8 +1373,6 @@ def current_chat_title():
     if not chat_file:
         logger.info(f"{Fore.YELLOW}No active chat session, you can use the {Fore.CYAN}-lsc{Fore.YELLOW} flag to list all available chat sessions and {Fore.CYAN}-lc{Fore.YELLOW} to load a chat session.{Style.RESET_ALL}")
         return
-    chat_map = _read_json(CHAT_MAP_FILE)
-    for title, chat_id in chat_map.items():
-        if os.path.join(CHAT_DIR, f"{chat_id}.json") == chat_file:
-            logger.info(f"{Fore.CYAN}Current chat: {Fore.MAGENTA}{title}{Style.RESET_ALL}")
-            return
\ No newline at end of file
+    title = _store().get_title(chat_file)
+    if title is not None:
+        logger.info(f"{Fore.CYAN}Current chat: {Fore.MAGENTA}{title}{Style.RESET_ALL}")
\ No newline at end of file
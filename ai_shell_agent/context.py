@@ -0,0 +1,154 @@
+# File: ai_shell_agent/context.py
+"""
+Token-budgeted context window for model calls.
+
+The newest turns of a chat are sent verbatim as long as they fit into the
+token budget; older turns are folded into a rolling summary that is appended
+to the system prompt. The summary is stored with the chat and only extended
+when more turns roll off the window, so most calls don't pay for it at all.
+
+The window keeps its start while it fits into the budget and then slides
+forward by several turns at once, so the beginning of the prompt (system
+prompt, summary and older turns) stays byte-identical from one call to the
+next and provider-side prompt caches keep hitting.
+Histories may hold stored message views; only their type, id and content are read.
+"""
+import hashlib
+from typing import Callable, Optional
+
+from langchain_core.messages import SystemMessage
+
+from . import logger
+from .message_views import Message
+from .settings import CONFIG_FIELDS
+from .prompts import summary_context_prefix
+
+DEFAULT_TOKEN_BUDGET = CONFIG_FIELDS["context_token_budget"][1]
+# Rough characters-per-token ratio used by the estimator, plus a fixed cost
+# for the role and message framing.
+CHARS_PER_TOKEN = 4
+MESSAGE_OVERHEAD_TOKENS = 4
+# Once the window exceeds the budget, it slides forward to fit into this share
+# of the budget, leaving room for the next turns before it has to move again.
+SLIDE_BUDGET_RATIO = 0.6
+
+# Token estimates by message id; messages are immutable once written.
+_token_counts: dict[str, int] = {}
+
+
+def _message_text(message: Message) -> str:
+    text = message.content if isinstance(message.content, str) else str(message.content)
+    tool_calls = getattr(message, "tool_calls", None)
+    if tool_calls:
+        text += str(tool_calls)
+    return text
+
+def count_tokens(message: Message) -> int:
+    """
+    Estimates the number of tokens a message costs in a prompt.
+    Estimates are cached for messages that have an id.
+
+    Parameters:
+      message (Message): The message to measure.
+
+    Returns:
+      int: The estimated token count.
+    """
+    count = _token_counts.get(message.id) if message.id else None
+    if count is None:
+        count = len(_message_text(message)) // CHARS_PER_TOKEN + MESSAGE_OVERHEAD_TOKENS
+        if message.id:
+            _token_counts[message.id] = count
+    return count
+
+def _fingerprint(message: Message) -> str:
+    """Identifies a message across processes, also for messages stored without an id."""
+    return message.id or hashlib.sha1(_message_text(message).encode()).hexdigest()
+
+def window_start(messages: list[Message], budget: int) -> int:
+    """
+    Returns the index of the oldest message that is still sent verbatim.
+
+    The window always starts at a human message, so tool calls are never split
+    from their results, and always includes the latest turn even if that turn
+    alone exceeds the budget. The system prompt at index 0 is not counted.
+    """
+    turn_starts = [i for i, msg in enumerate(messages) if i > 0 and msg.type == "human"]
+    if not turn_starts:
+        return 1 if messages and messages[0].type == "system" else 0
+    start = turn_starts[-1]
+    used = sum(count_tokens(msg) for msg in messages[start:])
+    for turn_start in reversed(turn_starts[:-1]):
+        cost = sum(count_tokens(msg) for msg in messages[turn_start:start])
+        if used + cost > budget:
+            break
+        used += cost
+        start = turn_start
+    return start
+
+def _summary_is_valid(meta: dict, messages: list[Message]) -> bool:
+    """Checks that a stored summary still describes the beginning of the history (edits truncate it)."""
+    covered = meta.get("covered", 0)
+    if not meta.get("summary") or covered <= 1 or covered > len(messages):
+        return False
+    return _fingerprint(messages[covered - 1]) == meta.get("last_id")
+
+def build_context(
+    messages: list[Message],
+    budget: int,
+    meta: dict,
+    summarize: Callable[[str, list[Message]], str],
+) -> tuple[list[Message], Optional[dict]]:
+    """
+    Builds the list of messages to send to the model.
+
+    Parameters:
+      messages (list[Message]): The full chat history, system prompt first.
+      budget (int): Token budget for the verbatim part of the history. 0 disables trimming.
+      meta (dict): The chat metadata holding the stored summary, if any.
+      summarize (Callable): Called as summarize(previous_summary, messages) to
+        fold rolled-off messages into the summary.
+
+    Returns:
+      tuple: The messages to send, and the updated summary state to persist
+        (None if it didn't change).
+    """
+    if not budget or not messages or messages[0].type != "system":
+        return messages, None
+
+    state = meta.get("context_summary", {})
+    if not _summary_is_valid(state, messages):
+        state = {"summary": "", "covered": 1, "last_id": None}
+    covered = state["covered"]
+    if sum(count_tokens(msg) for msg in messages[covered:]) <= budget:
+        # Keep the window where it is, so the prompt prefix doesn't change.
+        start = covered
+    else:
+        start = window_start(messages, int(budget * SLIDE_BUDGET_RATIO))
+
+    updated = None
+    if start > covered:
+        logger.debug(f"Summarizing messages {covered}-{start - 1} that rolled off the context window")
+        summary = summarize(state["summary"], messages[covered:start])
+        state = {"summary": summary, "covered": start, "last_id": _fingerprint(messages[start - 1])}
+        updated = state
+        covered = start
+    if not state["summary"]:
+        return messages, updated
+
+    system = messages[0]
+    system_with_summary = SystemMessage(
+        content=f"{system.content}\n\n{summary_context_prefix}\n{state['summary']}"
+    )
+    # Messages the summary already covers are never sent twice.
+    return [system_with_summary] + messages[max(start, covered):], updated
+
+def render_transcript(messages: list[Message], max_chars: int = 2000) -> str:
+    """Renders messages as a plain-text transcript for the summarizer."""
+    lines = []
+    for msg in messages:
+        text = _message_text(msg)
+        if len(text) > max_chars:
+            text = text[:max_chars] + " [...]"
+        lines.append(f"{msg.type.capitalize()}: {text}")
+    return "\n".join(lines)
@@ -0,0 +1,338 @@
+# File: ai_shell_agent/daemon.py
+"""
+Optional background daemon that keeps the agent warm between ``ai`` calls.
+
+The daemon listens on a Unix domain socket and runs CLI commands in-process,
+so LangChain, the model client and recently used chat histories stay loaded.
+``ai`` forwards its arguments, working directory and environment to it and
+relays output and prompts (e.g. command confirmation) back to the terminal.
+When no daemon is running, ``ai`` simply runs the command itself.
+
+Protocol: newline-delimited JSON messages over the socket. The client sends
+one request ({"type": "run" | "ping" | "stop", ...}); while running a command
+the daemon sends "output" and "ask" messages and finishes with "exit".
+
+Commands change process-wide state (working directory, environment, stdout),
+so the daemon runs one at a time, in a worker thread. While it is busy (a long
+agent turn, or a prompt waiting for its terminal), it answers other "run"
+requests with "busy" and those terminals run the command themselves; pings
+and "stop" are still answered right away.
+"""
+import os
+import sys
+import json
+import time
+import logging
+import threading
+from typing import Optional
+
+from . import logger
+from .utils import ask, set_prompt_handler
+from .terminal import TERMINAL_ENV, terminal_id
+
+SOCKET_ENV = "AI_SHELL_DAEMON_SOCKET"
+DISABLE_ENV = "AI_SHELL_NO_DAEMON"
+START_TIMEOUT = 15
+
+# True inside the daemon process, so commands it runs never forward to itself.
+_serving = False
+
+
+def is_supported() -> bool:
+    import socket
+    return os.name == "posix" and hasattr(socket, "AF_UNIX")
+
+def socket_path() -> str:
+    """Returns the per-user socket path, overridable with AI_SHELL_DAEMON_SOCKET."""
+    if os.getenv(SOCKET_ENV):
+        return os.getenv(SOCKET_ENV)
+    runtime_dir = os.getenv("XDG_RUNTIME_DIR")
+    if not runtime_dir:
+        import tempfile
+        runtime_dir = tempfile.gettempdir()
+    return os.path.join(runtime_dir, f"ai-shell-agent-{os.getuid()}.sock")
+
+def _send(stream, message: dict) -> None:
+    stream.write(json.dumps(message).encode() + b"\n")
+    stream.flush()
+
+def _receive(stream) -> Optional[dict]:
+    line = stream.readline()
+    return json.loads(line) if line else None
+
+def _connect() -> Optional["socket.socket"]:
+    if _serving or os.name != "posix" or os.getenv(DISABLE_ENV):
+        return None
+    path = socket_path()
+    # Checked first: without a daemon, ai doesn't even import socket.
+    if not os.path.exists(path) or not is_supported():
+        return None
+    import socket
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        return None
+    return sock
+
+def _request(message: dict) -> Optional[dict]:
+    """Sends a single control request and returns the reply, or None if no daemon is running."""
+    sock = _connect()
+    if sock is None:
+        return None
+    with sock, sock.makefile("rwb") as stream:
+        _send(stream, message)
+        return _receive(stream)
+
+# ---------------------------
+# Client
+# ---------------------------
+def forward(argv: list[str]) -> Optional[int]:
+    """
+    Runs a CLI command in the daemon, relaying its output and prompts.
+
+    Parameters:
+      argv (list[str]): The CLI arguments, without the program name.
+
+    Returns:
+      int: The command's exit code, or None if no daemon is running (or it
+        is busy with another terminal's command) and the command should run
+        in-process.
+    """
+    sock = _connect()
+    if sock is None:
+        return None
+    with sock, sock.makefile("rwb") as stream:
+        env = dict(os.environ)
+        # The daemon isn't attached to this terminal; tell it which one it runs for.
+        env.setdefault(TERMINAL_ENV, terminal_id())
+        _send(stream, {"type": "run", "argv": argv, "cwd": os.getcwd(), "env": env})
+        while True:
+            message = _receive(stream)
+            if message is None:
+                logger.error("The ai daemon closed the connection unexpectedly.")
+                return 1
+            if message["type"] == "busy":
+                logger.debug("The ai daemon is busy; running the command in-process.")
+                return None
+            if message["type"] == "output":
+                target = sys.stderr if message["stream"] == "stderr" else sys.stdout
+                target.write(message["data"])
+                target.flush()
+            elif message["type"] == "ask":
+                try:
+                    answer = ask(message["message"], message.get("default", ""))
+                except EOFError:
+                    answer = None
+                _send(stream, {"type": "answer", "data": answer})
+            elif message["type"] == "exit":
+                return message.get("code", 0)
+
+def start() -> bool:
+    """Starts the daemon in the background and waits until it accepts connections."""
+    if not is_supported():
+        logger.error("The ai daemon needs Unix domain sockets and is not available on this platform.")
+        return False
+    if status() is not None:
+        logger.info("The ai daemon is already running.")
+        return True
+    import subprocess
+    subprocess.Popen(
+        [sys.executable, "-m", "ai_shell_agent.daemon"],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+    deadline = time.monotonic() + START_TIMEOUT
+    while time.monotonic() < deadline:
+        if status() is not None:
+            logger.info("The ai daemon is running.")
+            return True
+        time.sleep(0.1)
+    logger.error("The ai daemon did not start in time.")
+    return False
+
+def stop() -> bool:
+    """Asks a running daemon to shut down."""
+    if _request({"type": "stop"}) is None:
+        logger.info("The ai daemon is not running.")
+        return False
+    logger.info("The ai daemon was stopped.")
+    return True
+
+def status() -> Optional[int]:
+    """Returns the pid of the running daemon, or None."""
+    reply = _request({"type": "ping"})
+    return reply.get("pid") if reply else None
+
+# ---------------------------
+# Server
+# ---------------------------
+class _ClientStream:
+    """Text stream standing in for stdout/stderr, sending writes to the client."""
+
+    def __init__(self, send, name: str):
+        self._send = send
+        self.name = name
+        self.disconnected = False
+
+    def write(self, data: str) -> int:
+        if self.disconnected or not data:
+            return len(data)
+        try:
+            self._send({"type": "output", "stream": self.name, "data": data})
+        except OSError:
+            # The client went away (usually Ctrl-C): stop the command.
+            self.disconnected = True
+            raise KeyboardInterrupt
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def isatty(self) -> bool:
+        return False
+
+def _warm_up() -> None:
+    """
+    Imports everything a model call needs and creates the model client with
+    the tools bound, so the first request is as fast as the others.
+    """
+    from . import ai, chat_manager, context  # noqa: F401
+    from .tools import tools_functions
+    from .llms import get_bound_llm
+    try:
+        get_bound_llm(tools_functions)
+    except Exception as e:
+        # Usually a missing API key; the first command will ask for it.
+        logger.debug(f"Could not create the model client yet: {e}")
+
+def _run_request(stream, request: dict) -> int:
+    """Runs a CLI command for a client with its cwd, environment and terminal; returns the exit code."""
+    from .ai import main
+
+    send_lock = threading.Lock()
+
+    def send(message: dict) -> None:
+        # The spinner writes from its own thread.
+        with send_lock:
+            _send(stream, message)
+
+    def remote_ask(message: str, default: str) -> str:
+        send({"type": "ask", "message": message, "default": default})
+        reply = _receive(stream)
+        if reply is None or reply.get("data") is None:
+            raise KeyboardInterrupt
+        return reply["data"]
+
+    handlers = [h for h in logger.handlers if isinstance(h, logging.StreamHandler)]
+    saved_cwd, saved_env = os.getcwd(), dict(os.environ)
+    saved_streams = (sys.stdout, sys.stderr, [h.stream for h in handlers])
+    code = 0
+    try:
+        os.chdir(request["cwd"])
+        os.environ.clear()
+        os.environ.update(request["env"])
+        sys.stdout = _ClientStream(send, "stdout")
+        sys.stderr = _ClientStream(send, "stderr")
+        for handler in handlers:
+            handler.setStream(sys.stderr)
+        set_prompt_handler(remote_ask)
+        main(request["argv"])
+    except SystemExit as e:
+        code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    except Exception as e:
+        code = 1
+        try:
+            logger.error(f"Error: {e}")
+        except KeyboardInterrupt:
+            pass
+    finally:
+        set_prompt_handler(None)
+        sys.stdout, sys.stderr, handler_streams = saved_streams
+        for handler, handler_stream in zip(handlers, handler_streams):
+            handler.setStream(handler_stream)
+        os.environ.clear()
+        os.environ.update(saved_env)
+        os.chdir(saved_cwd)
+    return code
+
+def _run_connection(connection, stream, request: dict, run_lock: threading.Lock) -> None:
+    """Runs a command in a worker thread, then frees the daemon for the next one."""
+    with connection, stream:
+        try:
+            code = _run_request(stream, request)
+        except (OSError, ValueError) as e:
+            logger.debug(f"Dropped daemon client: {e}")
+            return
+        finally:
+            # Before the client hears about the exit, so its next command isn't "busy".
+            run_lock.release()
+        try:
+            _send(stream, {"type": "exit", "code": code})
+        except OSError:
+            pass
+
+def serve(path: str = None) -> None:
+    """
+    Runs the daemon in the foreground until stopped. Commands run one at a
+    time; requests arriving meanwhile are answered as "busy".
+
+    Parameters:
+      path (str, optional): The socket path. Defaults to socket_path().
+    """
+    import socket
+    global _serving
+    path = path or socket_path()
+    if status() is not None:
+        logger.info("The ai daemon is already running.")
+        return
+    if os.path.exists(path):
+        os.remove(path)  # stale socket of a daemon that didn't shut down cleanly
+    _warm_up()
+    _serving = True
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        server.bind(path)
+        os.chmod(path, 0o600)
+        server.listen()
+        run_lock = threading.Lock()
+        while True:
+            connection, _ = server.accept()
+            stream = connection.makefile("rwb")
+            handed_off = False
+            try:
+                request = _receive(stream)
+                if request is None:
+                    continue
+                if request["type"] == "ping":
+                    _send(stream, {"type": "pong", "pid": os.getpid()})
+                elif request["type"] == "stop":
+                    _send(stream, {"type": "exit", "code": 0})
+                    break
+                elif request["type"] == "run":
+                    if not run_lock.acquire(blocking=False):
+                        _send(stream, {"type": "busy"})
+                        continue
+                    # The worker closes the connection and releases the lock.
+                    threading.Thread(target=_run_connection, args=(connection, stream, request, run_lock), daemon=True).start()
+                    handed_off = True
+            except (OSError, ValueError) as e:
+                logger.debug(f"Dropped daemon client: {e}")
+            finally:
+                if not handed_off:
+                    stream.close()
+                    connection.close()
+    finally:
+        _serving = False
+        server.close()
+        if os.path.exists(path):
+            os.remove(path)
+
+if __name__ == "__main__":
+    # Serve from the package module rather than this __main__ copy, so the CLI
+    # code sees the same module state (e.g. that it runs inside the daemon).
+    from ai_shell_agent import daemon
+    daemon.serve()
@@ -0,0 +1,431 @@
+# File: ai_shell_agent/executor.py
+"""
+Streaming execution of shell commands for the console tools.
+
+Output is forwarded to the terminal as it arrives, while only a bounded
+excerpt of it (the first and the last bytes, with an elision marker in
+between) is kept for the chat history. Commands like ``find /`` or
+``journalctl`` therefore neither balloon memory nor the next prompt.
+
+Commands get a wall-clock timeout and an optional idle-output timeout, so a
+command that hangs is killed instead of blocking the agent forever. Commands
+the user runs or confirms (``ai -x``, the confirmation prompt) keep the
+terminal, so ``sudo``, ``ssh`` and ``git`` can still ask for a password; on a
+timeout only the command's shell is killed. Commands the agent runs on its own
+(direct mode) are detached: they run in their own process group without a
+terminal on stdin, and on POSIX in a new session without a controlling
+terminal, so a command waiting for input or prompting on /dev/tty fails right
+away instead of hanging, and a timeout kills it together with its children.
+
+run_command drains the pipes with one reader thread each, which works the
+same on every platform (selectors can't wait on pipes on Windows);
+arun_command is its asyncio counterpart for the async agent loop.
+"""
+import os
+import time
+import queue
+import codecs
+import signal
+import asyncio
+import subprocess
+import threading
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from . import logger
+from . import paths
+from . import settings
+
+# Seconds between SIGTERM and SIGKILL when a command is stopped.
+KILL_GRACE_SECONDS = 2
+READ_SIZE = 64 * 1024
+
+
+def _settings() -> settings.Settings:
+    return settings.load(paths.config_file())
+
+def max_output_bytes() -> int:
+    """Returns the bytes of stdout (and, separately, stderr) kept for the chat, the "max_output_bytes" setting."""
+    return max(_settings().max_output_bytes, 1)
+
+def command_timeout() -> float:
+    """Returns the wall-clock timeout in seconds (0 for none), the "command_timeout" setting."""
+    return max(_settings().command_timeout, 0)
+
+def idle_timeout() -> float:
+    """Returns the idle-output timeout in seconds (0 for none), the "idle_timeout" setting."""
+    return max(_settings().idle_timeout, 0)
+
+class OutputBuffer:
+    """
+    Keeps the first and the last bytes written to it within a fixed byte cap.
+    Half of the cap goes to the head of the stream, the rest to a ring buffer
+    holding its tail.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.head_limit = max_bytes // 2
+        self.tail_limit = max_bytes - self.head_limit
+        self.head = bytearray()
+        self.tail: deque[bytes] = deque()
+        self.tail_size = 0
+        self.total = 0
+
+    def write(self, data: bytes) -> None:
+        self.total += len(data)
+        room = self.head_limit - len(self.head)
+        if room > 0:
+            self.head += data[:room]
+            data = data[room:]
+        if not data:
+            return
+        self.tail.append(data)
+        self.tail_size += len(data)
+        # Drop whole chunks once the remaining ones still cover the tail.
+        while self.tail_size - len(self.tail[0]) >= self.tail_limit:
+            self.tail_size -= len(self.tail.popleft())
+
+    @property
+    def truncated(self) -> bool:
+        return self.total > self.head_limit + self.tail_limit
+
+    def getvalue(self) -> str:
+        """Returns the kept output, with a marker where bytes were left out."""
+        tail = b"".join(self.tail)
+        if len(tail) > self.tail_limit:
+            tail = tail[len(tail) - self.tail_limit:]
+        text = self.head.decode(errors="replace")
+        omitted = self.total - len(self.head) - len(tail)
+        if omitted:
+            text += f"\n[... {omitted} bytes omitted ...]\n"
+        return text + tail.decode(errors="replace")
+
+@dataclass
+class CommandResult:
+    returncode: int
+    stdout: str
+    stderr: str
+    truncated: bool = False
+    # Why the command was killed, e.g. "ran longer than 600 seconds".
+    timeout_reason: Optional[str] = None
+
+    @property
+    def timed_out(self) -> bool:
+        return self.timeout_reason is not None
+
+class _Timeouts:
+    """Tracks the wall-clock and idle-output deadlines of a running command."""
+
+    def __init__(self, timeout: float, idle: float):
+        self.timeout = timeout
+        self.idle = idle
+        self.started = self.last_output = time.monotonic()
+
+    def output(self) -> None:
+        self.last_output = time.monotonic()
+
+    def remaining(self) -> Optional[float]:
+        """Seconds until the next timeout expires, or None without timeouts."""
+        deadlines = []
+        if self.timeout:
+            deadlines.append(self.started + self.timeout)
+        if self.idle:
+            deadlines.append(self.last_output + self.idle)
+        return max(min(deadlines) - time.monotonic(), 0) if deadlines else None
+
+    def expired(self) -> Optional[str]:
+        """Returns why the command has to be killed, or None if it may go on."""
+        now = time.monotonic()
+        if self.timeout and now - self.started >= self.timeout:
+            return f"ran longer than {self.timeout:g} seconds"
+        if self.idle and now - self.last_output >= self.idle:
+            return f"produced no output for {self.idle:g} seconds"
+        return None
+
+class _Capture:
+    """Collects the output of a command and passes decoded stdout on as it arrives."""
+
+    def __init__(self, max_bytes: int, on_output: Optional[Callable[[str], None]]):
+        self.buffers = {"stdout": OutputBuffer(max_bytes), "stderr": OutputBuffer(max_bytes)}
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self.on_output = on_output
+
+    def write(self, name: str, data: bytes) -> None:
+        self.buffers[name].write(data)
+        if name == "stdout" and self.on_output:
+            text = self.decoder.decode(data)
+            if text:
+                self.on_output(text)
+
+    def result(self, returncode: int, timeout_reason: Optional[str]) -> CommandResult:
+        if self.on_output:
+            rest = self.decoder.decode(b"", final=True)
+            if rest:
+                self.on_output(rest)
+        stdout, stderr = self.buffers["stdout"], self.buffers["stderr"]
+        return CommandResult(
+            returncode=returncode,
+            stdout=stdout.getvalue(),
+            stderr=stderr.getvalue(),
+            truncated=stdout.truncated or stderr.truncated,
+            timeout_reason=timeout_reason,
+        )
+
+def _limits(max_bytes: Optional[int], timeout: Optional[float], idle: Optional[float]) -> tuple[int, float, float]:
+    return (
+        max_bytes or max_output_bytes(),
+        command_timeout() if timeout is None else timeout,
+        idle_timeout() if idle is None else idle,
+    )
+
+def _spawn_options(detach: bool) -> dict:
+    if not detach:
+        # Inherits the terminal, to answer password prompts.
+        return {}
+    if os.name == "posix":
+        # A new session is also a new process group (killed with killpg), and
+        # has no controlling terminal to read a password from.
+        return {"stdin": subprocess.DEVNULL, "start_new_session": True}
+    return {"stdin": subprocess.DEVNULL, "creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+
+def _read_pipe(pipe, name: str, chunks: queue.Queue) -> None:
+    with pipe:
+        for data in iter(lambda: pipe.read1(READ_SIZE), b""):
+            chunks.put((name, data))
+    chunks.put((name, None))
+
+def kill_process_group(process: subprocess.Popen) -> None:
+    """Stops a detached command started by run_command together with all of its children."""
+    if os.name == "posix":
+        try:
+            os.killpg(process.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            return
+        try:
+            process.wait(KILL_GRACE_SECONDS)
+        except subprocess.TimeoutExpired:
+            pass
+        try:
+            # Also takes out children that ignored SIGTERM or outlived the shell.
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    else:
+        subprocess.run(
+            ["taskkill", "/F", "/T", "/PID", str(process.pid)],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+    process.wait()
+
+def _kill(process: subprocess.Popen, detach: bool) -> None:
+    if detach:
+        kill_process_group(process)
+    else:
+        process.kill()
+        process.wait()
+
+def run_command(
+    command: str,
+    on_output: Optional[Callable[[str], None]] = None,
+    max_bytes: int = None,
+    timeout: float = None,
+    idle: float = None,
+    detach: bool = False,
+) -> CommandResult:
+    """
+    Runs a shell command, passing its stdout to on_output as it arrives.
+    The command is killed when it exceeds a timeout or when the user presses
+    Ctrl-C.
+
+    Parameters:
+      command (str): The shell command to run.
+      on_output (Callable, optional): Called with every decoded stdout chunk.
+      max_bytes (int, optional): Bytes of stdout and of stderr to keep.
+        Defaults to max_output_bytes().
+      timeout (float, optional): Wall-clock limit in seconds, 0 for none.
+        Defaults to command_timeout().
+      idle (float, optional): Limit in seconds on the time without any
+        output, 0 for none. Defaults to idle_timeout().
+      detach (bool): Run the command without the terminal, in its own
+        process group that is killed as a whole. For commands the user didn't
+        confirm; others keep the terminal to answer password prompts.
+
+    Returns:
+      CommandResult: The exit code, the kept (possibly elided) output and
+        the reason the command was killed, if it was.
+    """
+    max_bytes, timeout, idle = _limits(max_bytes, timeout, idle)
+    capture = _Capture(max_bytes, on_output)
+    process = subprocess.Popen(
+        command,
+        shell=True,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        **_spawn_options(detach),
+    )
+    chunks: queue.Queue = queue.Queue()
+    readers = [
+        threading.Thread(target=_read_pipe, args=(process.stdout, "stdout", chunks), daemon=True),
+        threading.Thread(target=_read_pipe, args=(process.stderr, "stderr", chunks), daemon=True),
+    ]
+    for reader in readers:
+        reader.start()
+
+    timeouts = _Timeouts(timeout, idle)
+    timeout_reason = None
+    open_pipes = len(readers)
+    try:
+        while open_pipes:
+            try:
+                name, data = chunks.get(timeout=timeouts.remaining())
+            except queue.Empty:
+                timeout_reason = timeouts.expired()
+                if timeout_reason:
+                    break
+                continue
+            if data is None:
+                open_pipes -= 1
+                continue
+            timeouts.output()
+            capture.write(name, data)
+        if not timeout_reason:
+            # The pipes can close before the command exits.
+            while timeout_reason is None:
+                try:
+                    process.wait(timeout=timeouts.remaining())
+                    break
+                except subprocess.TimeoutExpired:
+                    timeout_reason = timeouts.expired()
+    except KeyboardInterrupt:
+        _kill(process, detach)
+        raise
+
+    if timeout_reason:
+        logger.debug(f"Killing command that {timeout_reason}: {command}")
+        _kill(process, detach)
+        # Collect what was written before the kill.
+        for reader in readers:
+            reader.join(KILL_GRACE_SECONDS)
+        while True:
+            try:
+                name, data = chunks.get_nowait()
+            except queue.Empty:
+                break
+            if data is not None:
+                capture.write(name, data)
+    return capture.result(process.wait(), timeout_reason)
+
+async def _akill_process_group(process: asyncio.subprocess.Process) -> None:
+    """Stops a detached command started by arun_command together with all of its children."""
+    if os.name == "posix":
+        try:
+            os.killpg(process.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            return
+        try:
+            await asyncio.wait_for(process.wait(), KILL_GRACE_SECONDS)
+        except TimeoutError:
+            pass
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    else:
+        taskkill = await asyncio.create_subprocess_exec(
+            "taskkill", "/F", "/T", "/PID", str(process.pid),
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        await taskkill.wait()
+    await process.wait()
+
+async def _akill(process: asyncio.subprocess.Process, detach: bool) -> None:
+    if detach:
+        await _akill_process_group(process)
+    else:
+        try:
+            process.kill()
+        except ProcessLookupError:
+            pass
+        # Not process.wait(): it also waits for the children of the shell,
+        # which were not killed and may keep the pipes open.
+        deadline = time.monotonic() + KILL_GRACE_SECONDS
+        while process.returncode is None and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+
+def _close_pipes(process: asyncio.subprocess.Process) -> None:
+    """Stops reading the pipes of a killed command that its children may still hold open."""
+    # asyncio.subprocess.Process doesn't expose its transport.
+    transport = getattr(process, "_transport", None)
+    if transport is not None:
+        transport.close()
+
+async def arun_command(
+    command: str,
+    on_output: Optional[Callable[[str], None]] = None,
+    max_bytes: int = None,
+    timeout: float = None,
+    idle: float = None,
+    detach: bool = False,
+) -> CommandResult:
+    """
+    Asynchronous version of run_command using an asyncio subprocess. The
+    command is killed when it exceeds a timeout or when the awaiting task is
+    cancelled.
+    """
+    max_bytes, timeout, idle = _limits(max_bytes, timeout, idle)
+    capture = _Capture(max_bytes, on_output)
+    process = await asyncio.create_subprocess_shell(
+        command,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        **_spawn_options(detach),
+    )
+    timeouts = _Timeouts(timeout, idle)
+
+    async def pump(stream: asyncio.StreamReader, name: str) -> None:
+        while data := await stream.read(READ_SIZE):
+            timeouts.output()
+            capture.write(name, data)
+
+    pumps = [
+        asyncio.ensure_future(pump(process.stdout, "stdout")),
+        asyncio.ensure_future(pump(process.stderr, "stderr")),
+    ]
+    timeout_reason = None
+    try:
+        while True:
+            _, pending = await asyncio.wait(pumps, timeout=timeouts.remaining())
+            if not pending:
+                break
+            timeout_reason = timeouts.expired()
+            if timeout_reason:
+                break
+        if not timeout_reason:
+            # The pipes can close before the command exits.
+            while timeout_reason is None:
+                try:
+                    await asyncio.wait_for(process.wait(), timeouts.remaining())
+                    break
+                except TimeoutError:
+                    timeout_reason = timeouts.expired()
+    except asyncio.CancelledError:
+        for task in pumps:
+            task.cancel()
+        await _akill(process, detach)
+        _close_pipes(process)
+        raise
+
+    if timeout_reason:
+        logger.debug(f"Killing command that {timeout_reason}: {command}")
+        await _akill(process, detach)
+        # Collect what was written before the kill.
+        _, pending = await asyncio.wait(pumps, timeout=KILL_GRACE_SECONDS)
+        for task in pending:
+            task.cancel()
+        _close_pipes(process)
+        returncode = process.returncode
+        return capture.result(-signal.SIGKILL if returncode is None else returncode, timeout_reason)
+    return capture.result(await process.wait(), timeout_reason)
@@ -0,0 +1,115 @@
+# File: ai_shell_agent/fake_llm.py
+"""
+Offline model providers for tests, benchmarks and demos.
+
+``PROVIDER=fake`` answers from a script of responses: the JSON list (or JSON
+lines) in the file named by AI_SHELL_FAKE_RESPONSES, used in order and then
+from the start again. Without a script, it echoes the latest user message.
+``PROVIDER=replay`` answers with the responses recorded in the file named by
+AI_SHELL_RECORDING, in order. Any provider records its responses there while
+AI_SHELL_RECORD is set as well, so a real session can be replayed offline.
+
+Responses are message dicts like ``{"content": "...", "tool_calls": [{"name":
+"interactive_windows_shell_tool", "args": {"command": "ls"}}]}``; tool calls
+without an id get one. AI_SHELL_FAKE_LATENCY adds a delay (in seconds) to
+every response, to stand in for the model's latency.
+"""
+import os
+import json
+import time
+import asyncio
+from typing import Any, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+RESPONSES_ENV = "AI_SHELL_FAKE_RESPONSES"
+LATENCY_ENV = "AI_SHELL_FAKE_LATENCY"
+RECORDING_ENV = "AI_SHELL_RECORDING"
+RECORD_ENV = "AI_SHELL_RECORD"
+CHARS_PER_TOKEN = 4
+
+
+def read_responses(file_path: str) -> list[dict]:
+    """Reads responses from a JSON list or a JSON lines file."""
+    with open(file_path, "r") as f:
+        text = f.read()
+    if text.lstrip().startswith("["):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+def record_response(file_path: str, response: dict) -> None:
+    """Appends a response (a serialized AIMessage) to a recording."""
+    with open(file_path, "a") as f:
+        f.write(json.dumps(response, separators=(",", ":")) + "\n")
+
+def recording_file() -> Optional[str]:
+    """Returns the file responses are recorded to, or None unless recording is enabled."""
+    if os.getenv(RECORD_ENV) and os.getenv(RECORDING_ENV):
+        return os.environ[RECORDING_ENV]
+    return None
+
+class FakeChatModel(BaseChatModel):
+    """Chat model answering from a list of responses, with a fixed latency."""
+
+    responses: list[dict] = []
+    latency: float = 0.0
+    # Index of the next response.
+    position: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "ai-shell-agent-fake"
+
+    def bind_tools(self, tools, **kwargs):
+        # Responses are scripted; the tool schemas are accepted and ignored.
+        return self
+
+    def _next_message(self, messages: list[BaseMessage]) -> AIMessage:
+        if self.responses:
+            data = dict(self.responses[self.position % len(self.responses)])
+        else:
+            last = next((msg.content for msg in reversed(messages) if msg.type == "human"), "")
+            data = {"content": f"Echo: {last}"}
+        self.position += 1
+        tool_calls = [
+            dict(tool_call, id=tool_call.get("id") or f"call_{self.position}_{i}")
+            for i, tool_call in enumerate(data.pop("tool_calls", []))
+        ]
+        prompt_chars = sum(len(str(msg.content)) for msg in messages)
+        output_chars = len(str(data.get("content", "")))
+        usage = {
+            "input_tokens": prompt_chars // CHARS_PER_TOKEN,
+            "output_tokens": output_chars // CHARS_PER_TOKEN,
+            "total_tokens": (prompt_chars + output_chars) // CHARS_PER_TOKEN,
+        }
+        data.pop("type", None)
+        data.setdefault("content", "")
+        data.setdefault("usage_metadata", usage)
+        return AIMessage(tool_calls=tool_calls, **data)
+
+    def _generate(self, messages: list[BaseMessage], stop: Optional[list[str]] = None, run_manager: Any = None, **kwargs) -> ChatResult:
+        if self.latency:
+            time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._next_message(messages))])
+
+    async def _agenerate(self, messages: list[BaseMessage], stop: Optional[list[str]] = None, run_manager: Any = None, **kwargs) -> ChatResult:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._next_message(messages))])
+
+def create_fake_llm(provider: str) -> FakeChatModel:
+    """
+    Creates the model of an offline provider.
+
+    Parameters:
+      provider (str): "fake" (scripted responses) or "replay" (a recording).
+    """
+    env = RECORDING_ENV if provider == "replay" else RESPONSES_ENV
+    file_path = os.getenv(env)
+    if provider == "replay" and not file_path:
+        raise RuntimeError(f"The replay provider needs a recording: set {RECORDING_ENV}")
+    responses = read_responses(file_path) if file_path else []
+    latency = float(os.getenv(LATENCY_ENV) or 0)
+    return FakeChatModel(responses=responses, latency=latency)
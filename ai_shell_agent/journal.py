@@ -0,0 +1,210 @@
+# File: ai_shell_agent/journal.py
+"""
+Append-only JSON-Lines journal used to persist chat histories.
+
+Every line of a journal is either a serialized message record, which is
+appended to the history, or an operation record such as
+``{"op": "truncate", "length": 3}``, which drops every message past the given
+length. Replaying the journal from the top yields the current history.
+
+Journals are compacted (rewritten with one line per live message) only once
+they hold noticeably more lines than live messages, so a regular chat turn
+costs O(new messages) instead of O(history).
+
+Journals can be gzip or zstd compressed. Every write adds a complete gzip
+member / zstd frame, and concatenated members decompress to the concatenated
+lines, so compressed journals are appended to just like plain ones. The
+format is detected from the first bytes of the file when reading.
+"""
+import os
+import json
+import zlib
+
+from . import logger
+from .locking import atomic_write
+
+COMPRESSIONS = ("none", "gzip", "zstd")
+_MAGIC = {
+    "gzip": b"\x1f\x8b",
+    "zstd": b"\x28\xb5\x2f\xfd",
+}
+
+# Compact a journal once it holds more than COMPACT_RATIO lines per live
+# message, but never bother for journals shorter than COMPACT_MIN_LINES.
+COMPACT_RATIO = 2
+COMPACT_MIN_LINES = 64
+
+# Number of journal lines per file, known for journals read or written by this
+# process. Files missing from here (or written in the legacy format) must be
+# rewritten before they can be appended to.
+_line_counts: dict[str, int] = {}
+# Compression of each of those journals; appends keep the format of the file.
+_formats: dict[str, str] = {}
+
+
+def _dumps(record: dict) -> str:
+    return json.dumps(record, separators=(",", ":"))
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        raise RuntimeError("zstd compressed chats need the zstandard package (pip install zstandard)")
+    return zstandard
+
+def detect_compression(head: bytes) -> str:
+    """Returns the compression of a journal from its first bytes."""
+    for compression, magic in _MAGIC.items():
+        if head.startswith(magic):
+            return compression
+    return "none"
+
+def _compress(data: bytes, compression: str) -> bytes:
+    if compression == "gzip":
+        return zlib.compress(data, wbits=31)
+    if compression == "zstd":
+        return _zstd().ZstdCompressor().compress(data)
+    return data
+
+def _decompress(data: bytes, compression: str) -> tuple[bytes, bool]:
+    """
+    Decompresses all members / frames of a journal. An incomplete last one
+    (from an interrupted write) is dropped, like a torn line of a plain journal.
+
+    Returns:
+      tuple[bytes, bool]: The data, and False if a member / frame was dropped.
+    """
+    if compression == "none":
+        return data, True
+    parts = []
+    while data:
+        if compression == "gzip":
+            decompressor = zlib.decompressobj(wbits=31)
+        else:
+            decompressor = _zstd().ZstdDecompressor().decompressobj()
+        try:
+            part = decompressor.decompress(data)
+        except Exception as e:
+            # zlib.error or zstandard.ZstdError for a corrupted block
+            logger.debug(f"Could not decompress journal block: {e}")
+            part, eof = b"", False
+        else:
+            eof = decompressor.eof
+        if not eof:
+            logger.debug("Skipping incomplete compressed journal block")
+            return b"".join(parts), False
+        parts.append(part)
+        data = decompressor.unused_data
+    return b"".join(parts), True
+
+def _is_legacy(data: bytes) -> bool:
+    """Returns True if the file holds a single JSON list (the old chat format)."""
+    return data.lstrip()[:1] == b"["
+
+def read_records(file_path: str) -> list[dict]:
+    """
+    Replays a journal and returns the live message records.
+    Compressed journals and legacy chat files holding a plain JSON list are
+    read as well.
+
+    Parameters:
+      file_path (str): The journal to read.
+
+    Returns:
+      list[dict]: The message records, oldest first.
+    """
+    _line_counts.pop(file_path, None)
+    _formats.pop(file_path, None)
+    if not os.path.exists(file_path):
+        return []
+    with open(file_path, "rb") as f:
+        data = f.read()
+    compression = detect_compression(data[:4])
+    data, complete = _decompress(data, compression)
+    if compression == "none" and _is_legacy(data):
+        try:
+            return json.loads(data)
+        except json.JSONDecodeError:
+            return []
+
+    records = []
+    line_count = 0
+    # A write that didn't finish leaves a partial last line (or member /
+    # frame); appending after it would glue the next record onto it, and
+    # frames after an incomplete one can't be decompressed at all.
+    torn = not complete or (bool(data) and not data.endswith(b"\n"))
+    for line in data.decode().splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            # A torn last line from an interrupted write; everything
+            # before it is still a consistent history.
+            logger.debug(f"Skipping unreadable journal line in {file_path}")
+            torn = True
+            continue
+        line_count += 1
+        if "op" in record:
+            if record["op"] == "truncate":
+                del records[record["length"]:]
+            continue
+        records.append(record)
+    if torn:
+        # Not recorded as appendable, so the next write rewrites the journal.
+        return records
+    _line_counts[file_path] = line_count
+    _formats[file_path] = compression
+    return records
+
+def write_records(file_path: str, records: list[dict], compression: str = "none") -> None:
+    """
+    Rewrites a journal from scratch with one line per record (compaction).
+
+    Parameters:
+      file_path (str): The journal to write.
+      records (list[dict]): The complete list of message records.
+      compression (str): "none", "gzip" or "zstd".
+    """
+    data = "".join(_dumps(record) + "\n" for record in records).encode()
+    # Replaced as a whole, so readers never see a half-written journal.
+    atomic_write(file_path, _compress(data, compression))
+    _line_counts[file_path] = len(records)
+    _formats[file_path] = compression
+
+def can_append(file_path: str) -> bool:
+    """Returns True if the journal is known to this process and can be appended to."""
+    return file_path in _line_counts and os.path.exists(file_path)
+
+def append_records(file_path: str, records: list[dict], keep: int = None) -> None:
+    """
+    Appends records to a journal, optionally truncating the history first.
+    The records are compressed like the rest of the journal.
+
+    Parameters:
+      file_path (str): The journal to append to.
+      records (list[dict]): The new message records.
+      keep (int, optional): Number of already persisted records to keep.
+        If given, a truncate operation is written before the new records.
+    """
+    lines = []
+    if keep is not None:
+        lines.append(_dumps({"op": "truncate", "length": keep}))
+    lines.extend(_dumps(record) for record in records)
+    if not lines:
+        return
+    data = ("\n".join(lines) + "\n").encode()
+    with open(file_path, "ab") as f:
+        f.write(_compress(data, _formats.get(file_path, "none")))
+    _line_counts[file_path] = _line_counts.get(file_path, 0) + len(lines)
+
+def needs_compaction(file_path: str, live_count: int) -> bool:
+    """Returns True if the journal has grown enough to be worth rewriting."""
+    line_count = _line_counts.get(file_path, 0)
+    return line_count > max(COMPACT_MIN_LINES, COMPACT_RATIO * live_count)
+
+def forget(file_path: str) -> None:
+    """Drops what this process knows about a journal, e.g. after deleting it."""
+    _line_counts.pop(file_path, None)
+    _formats.pop(file_path, None)
@@ -1,23 +1,110 @@
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_openai import ChatOpenAI
 import os
+import json
+import hashlib
 
-PROVIDER = os.environ.get("PROVIDER", "google")
-TEMPERATURE = os.environ.get("TEMPERATURE", 0)
+from . import paths
+from . import settings
 
+# OpenAI caches prompt prefixes automatically; calls with the same
+# prompt_cache_key (and prefix) are routed to the same cache. Gemini caches
+# identical prefixes implicitly. Either way, the context is built so that
+# every call of a chat starts with the same bytes, see context.py.
+PROMPT_CACHE_KEY = "ai-shell-agent"
+# Other OpenAI-compatible servers may reject the unknown parameter, so by
+# default ("auto") it is only sent to api.openai.com; the "prompt_cache_key"
+# setting can also be "on" or "off".
+OPENAI_HOST = "api.openai.com"
+
+# Providers that answer without network access or API keys, see fake_llm.py.
+OFFLINE_PROVIDERS = ("fake", "replay")
+
+# Model clients by (provider, model, temperature, tool set digest). Clients are
+# kept for the lifetime of the process, so their HTTP connection pools and TLS
+# sessions are reused by every call of the tool loop (and across commands in
+# the daemon).
+_clients: dict[tuple, object] = {}
+
+# Provider, model and temperature are read from the settings at call time, so
+# changing them (e.g. with ai -p) takes effect without restarting the process.
 def get_provider():
-    return PROVIDER
+    return settings.load().provider
 
 def get_model():
-    if PROVIDER == "google":
-        return "gemini-2.0-flash"
+    return settings.load().model
+
+def get_temperature() -> float:
+    return settings.load().temperature
+
+def _sends_prompt_cache_key() -> bool:
+    """Returns True if OpenAI calls should carry PROMPT_CACHE_KEY, see the "prompt_cache_key" setting."""
+    mode = settings.load(paths.config_file()).prompt_cache_key.strip().lower()
+    if mode in ("on", "off"):
+        return mode == "on"
+    base_url = os.getenv("OPENAI_BASE_URL") or os.getenv("OPENAI_API_BASE")
+    if not base_url:
+        return True
+    from urllib.parse import urlparse
+    return urlparse(base_url).hostname == OPENAI_HOST
+
+def _create_llm():
+    # Provider packages are slow to import, so they are only loaded once a model is needed.
+    current = settings.load()
+    if current.provider in OFFLINE_PROVIDERS:
+        from .fake_llm import create_fake_llm
+        return create_fake_llm(current.provider)
+    if current.provider == "google":
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        return ChatGoogleGenerativeAI(model=current.model, temperature=current.temperature)
     else:
-        return "gpt-4o-mini"
+        from langchain_openai import ChatOpenAI
+        # stream_usage: streamed responses report token usage (and cache hits) too.
+        return ChatOpenAI(
+            model=current.model,
+            temperature=current.temperature,
+            stream_usage=True,
+            extra_body={"prompt_cache_key": PROMPT_CACHE_KEY} if _sends_prompt_cache_key() else None,
+        )
+
+def _tools_digest(tools_functions: list[dict]) -> str:
+    return hashlib.sha256(json.dumps(tools_functions, sort_keys=True).encode()).hexdigest()
+
+def client_key(tools_functions: list[dict] = None) -> tuple:
+    """
+    Returns what identifies a model client: provider, model, temperature and
+    the digest of the bound tools (None without tools).
+    """
+    tools = _tools_digest(tools_functions) if tools_functions is not None else None
+    current = settings.load()
+    return (current.provider, current.model, current.temperature, tools)
+
+def is_deterministic() -> bool:
+    """Returns True if the model is called with temperature 0."""
+    return get_temperature() == 0
+
+def _cache_key(tools_functions: list[dict] = None) -> tuple:
+    # Whether the client sends the prompt cache key doesn't change answers,
+    # so it is not part of client_key (which also keys the response cache).
+    return client_key(tools_functions) + (_sends_prompt_cache_key(),)
 
 def get_llm():
-    model = get_model()
-    if PROVIDER == "google":
-        return ChatGoogleGenerativeAI(model=model, temperature=TEMPERATURE)
-    else:
-        return ChatOpenAI(model=model, temperature=TEMPERATURE)
+    """Returns the cached model client for the current provider, model and temperature."""
+    key = _cache_key()
+    if key not in _clients:
+        _clients[key] = _create_llm()
+    return _clients[key]
+
+def get_bound_llm(tools_functions: list[dict]):
+    """
+    Returns the cached model client with the given tools bound to it.
+    
+    Parameters:
+      tools_functions (list[dict]): The OpenAI function schemas of the tools.
+    """
+    key = _cache_key(tools_functions)
+    if key not in _clients:
+        _clients[key] = get_llm().bind_tools(tools_functions)
+    return _clients[key]
 
+def invalidate_llm_cache() -> None:
+    """Drops all cached clients, e.g. after the provider or temperature was changed."""
+    _clients.clear()
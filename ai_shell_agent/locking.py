@@ -0,0 +1,106 @@
+# File: ai_shell_agent/locking.py
+"""
+Advisory inter-process file locks and atomic file writes.
+
+Several ``ai`` processes (one per terminal, plus the daemon) share the chat
+directory. Read-modify-write cycles on shared files (the chat map, a chat
+journal) hold ``file_lock`` on a lock file of the chat directory, and files
+that are replaced as a whole are written with ``atomic_write``, so readers
+never see a half-written file.
+
+Locks are reentrant within a process: code holding the lock can call other
+functions that take it again.
+"""
+import os
+import threading
+from contextlib import contextmanager
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+LOCK_FILE_NAME = ".lock"
+
+
+class _HeldLock:
+    def __init__(self):
+        self.mutex = threading.RLock()
+        self.depth = 0
+        self.file = None
+
+# Locks held by this process, by lock file path.
+_held: dict[str, _HeldLock] = {}
+_held_guard = threading.Lock()
+
+
+def _lock_file(f) -> None:
+    if os.name == "nt":
+        f.seek(0)
+        while True:
+            try:
+                # Blocks for about 10 seconds, then raises; keep waiting.
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                continue
+    fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+def _unlock_file(f) -> None:
+    if os.name == "nt":
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+    else:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+@contextmanager
+def file_lock(lock_path: str):
+    """
+    Holds an exclusive advisory lock on lock_path (created if missing) while
+    the block runs, waiting for other processes to release it first.
+
+    Parameters:
+      lock_path (str): The lock file.
+    """
+    lock_path = os.path.abspath(lock_path)
+    with _held_guard:
+        held = _held.setdefault(lock_path, _HeldLock())
+    with held.mutex:
+        if held.depth == 0:
+            os.makedirs(os.path.dirname(lock_path), exist_ok=True)
+            f = open(lock_path, "a+b")
+            try:
+                _lock_file(f)
+            except BaseException:
+                f.close()
+                raise
+            held.file = f
+        held.depth += 1
+        try:
+            yield
+        finally:
+            held.depth -= 1
+            if held.depth == 0:
+                _unlock_file(held.file)
+                held.file.close()
+                held.file = None
+
+def atomic_write(file_path: str, data: bytes) -> None:
+    """
+    Replaces file_path with data through a temporary file and a rename, so
+    other processes always see either the old or the new content. (The file is
+    not fsynced: this guards against concurrent access, not power loss.)
+
+    Parameters:
+      file_path (str): The file to write.
+      data (bytes): The complete new content.
+    """
+    tmp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
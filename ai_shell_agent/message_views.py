@@ -0,0 +1,97 @@
+# File: ai_shell_agent/message_views.py
+"""
+Lightweight views of stored chat messages.
+
+Reading a chat doesn't build a validated LangChain message per record: most of
+a long history is only counted, measured or printed. A MessageView keeps the
+stored record and exposes the attributes the rest of the package reads (type,
+id, content, tool calls); the LangChain message is built by ``materialize``
+when the history is actually sent to the model. Contents kept in the blob
+store are loaded on first access.
+"""
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Optional, Union
+
+from . import blobs
+
+if TYPE_CHECKING:
+    from langchain_core.messages import BaseMessage
+
+# Message class by record type, filled on first use so that reading a chat
+# doesn't import LangChain.
+_message_classes: dict[str, type] = {}
+
+
+def _message_class(message_type: str) -> type:
+    if not _message_classes:
+        from langchain_core.messages import SystemMessage, HumanMessage, AIMessage, ToolMessage
+        _message_classes.update(system=SystemMessage, human=HumanMessage, ai=AIMessage, tool=ToolMessage)
+    return _message_classes[message_type]
+
+class MessageView:
+    """Read-only stand-in for a stored message, built without validation."""
+
+    __slots__ = ("type", "id", "record", "_blob_store", "_content", "_message")
+
+    def __init__(self, record: dict, blob_store: blobs.BlobStore):
+        self.type = record["type"]
+        self.id = record.get("id")
+        self.record = record
+        self._blob_store = blob_store
+        self._content = None
+        self._message = None
+
+    @property
+    def content(self) -> Union[str, list]:
+        if self._content is None:
+            if "output" in self.record:
+                self._content = blobs.internalize(self.record, self._blob_store)["content"]
+            else:
+                self._content = self.record.get("content", "")
+        return self._content
+
+    @property
+    def tool_calls(self) -> list[dict]:
+        return self.record.get("tool_calls", [])
+
+    @property
+    def tool_call_id(self) -> Optional[str]:
+        return self.record.get("tool_call_id")
+
+    @property
+    def name(self) -> Optional[str]:
+        return self.record.get("name")
+
+    @property
+    def artifact(self):
+        return self.record.get("artifact")
+
+    def to_record(self) -> dict:
+        """Returns the stored record, with the id if one was assigned since."""
+        if self.id != self.record.get("id"):
+            return dict(self.record, id=self.id)
+        return self.record
+
+    def to_message(self) -> BaseMessage:
+        """Builds (once) the LangChain message this view stands for."""
+        if self._message is None:
+            record = dict(self.record, content=self.content, id=self.id)
+            record.pop("output", None)
+            self._message = _message_class(self.type)(**record)
+        return self._message
+
+    def __repr__(self) -> str:
+        return f"MessageView(type={self.type!r}, id={self.id!r})"
+
+# A message of a chat history: stored (view) or created in this process.
+Message = Union["BaseMessage", MessageView]
+
+
+def read_views(records: list[dict], blob_store: blobs.BlobStore) -> list[MessageView]:
+    """Wraps stored records in views, skipping records of unknown types."""
+    return [MessageView(record, blob_store) for record in records if record.get("type") in ("system", "human", "ai", "tool")]
+
+def materialize(messages: list[Message]) -> list[BaseMessage]:
+    """Returns the messages with every view replaced by its LangChain message."""
+    return [msg.to_message() if isinstance(msg, MessageView) else msg for msg in messages]
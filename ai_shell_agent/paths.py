@@ -0,0 +1,44 @@
+# File: ai_shell_agent/paths.py
+"""
+Location of the data directory holding chats, config.json and the sessions.
+
+The directory is, in order of precedence: the ``--data-dir`` option, the
+AI_SHELL_DATA_DIR environment variable, ``$XDG_DATA_HOME/ai-shell-agent``,
+and ``~/.local/share/ai-shell-agent`` (``%APPDATA%\\ai-shell-agent`` on
+Windows). It doesn't depend on the working directory, so every ``ai`` call
+sees the same chats and caches.
+"""
+import os
+
+DATA_DIR_ENV = "AI_SHELL_DATA_DIR"
+APP_NAME = "ai-shell-agent"
+CONFIG_FILE_NAME = "config.json"
+
+# Resolved once per process, see data_dir().
+_data_dir = None
+
+
+def resolve_data_dir() -> str:
+    """Resolves the data directory from the environment (not cached)."""
+    if os.getenv(DATA_DIR_ENV):
+        return os.path.abspath(os.path.expanduser(os.environ[DATA_DIR_ENV]))
+    if os.name == "nt" and os.getenv("APPDATA"):
+        return os.path.join(os.environ["APPDATA"], APP_NAME)
+    base = os.getenv("XDG_DATA_HOME") or os.path.join(os.path.expanduser("~"), ".local", "share")
+    return os.path.join(os.path.abspath(base), APP_NAME)
+
+def data_dir() -> str:
+    """Returns the data directory, resolved on first use."""
+    global _data_dir
+    if _data_dir is None:
+        _data_dir = resolve_data_dir()
+    return _data_dir
+
+def set_data_dir(data_dir: str) -> None:
+    """Uses another data directory from now on, e.g. the one given with --data-dir."""
+    global _data_dir
+    _data_dir = os.path.abspath(os.path.expanduser(data_dir))
+
+def config_file() -> str:
+    """Returns the path of config.json in the data directory."""
+    return os.path.join(data_dir(), CONFIG_FILE_NAME)
@@ -0,0 +1,179 @@
+# File: ai_shell_agent/profiling.py
+"""
+Opt-in timing of the hot path of an ``ai`` call.
+
+With ``ai --profile`` (or AI_SHELL_PROFILE=1), spans are recorded for the
+startup, reading and writing the chat, preparing the context, loading the
+model client, every model call (with its token usage) and every tool call.
+A summary table is printed when the command finishes. ``--profile FILE`` (or
+AI_SHELL_PROFILE=FILE) also writes the spans to FILE in the Chrome trace
+event format: a JSON object that chrome://tracing and Perfetto open as a
+timeline, with the token usage in the ``args`` of each event.
+
+While profiling is off, span() only checks a flag. ai.py imports this module
+first, so it only imports what the timing itself needs.
+"""
+import os
+import sys
+import time
+import threading
+from typing import Optional
+
+PROFILE_ENV = "AI_SHELL_PROFILE"
+# Values of AI_SHELL_PROFILE that enable the summary without exporting a file.
+ENABLE_VALUES = ("1", "true", "yes", "on")
+TOKEN_FIELDS = ("input_tokens", "output_tokens", "cache_read")
+
+# perf_counter() when this module was imported: the start of the "startup" span.
+_process_started = time.perf_counter()
+_enabled = False
+_export_file: Optional[str] = None
+_spans: list[dict] = []
+
+
+def enable(export_file: Optional[str] = None) -> None:
+    """
+    Starts recording spans, with the startup of the process as the first one.
+
+    Parameters:
+      export_file (str): Where report() writes the Chrome trace, if anywhere.
+    """
+    global _enabled, _export_file
+    _enabled = True
+    _export_file = export_file
+    _spans.clear()
+    _spans.append(_new_span("startup", "startup", _process_started, {}))
+
+def enable_from_env() -> bool:
+    """Enables profiling if AI_SHELL_PROFILE is set. Returns whether it is enabled."""
+    value = os.getenv(PROFILE_ENV, "")
+    if value and value.lower() not in ("0", "false", "no", "off"):
+        enable(None if value.lower() in ENABLE_VALUES else value)
+    return _enabled
+
+def enabled() -> bool:
+    return _enabled
+
+def disable() -> None:
+    global _enabled, _export_file
+    _enabled = False
+    _export_file = None
+    _spans.clear()
+
+def _lane() -> int:
+    """Identifies the asyncio task (or thread) a span runs in, so concurrent tool calls get their own rows."""
+    asyncio = sys.modules.get("asyncio")
+    if asyncio is not None:
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        if task is not None:
+            return id(task)
+    return threading.get_ident()
+
+def _new_span(name: str, category: str, start: float, args: dict) -> dict:
+    return {"name": name, "category": category, "start": start, "end": None, "lane": _lane(), "args": args}
+
+class span:
+    """
+    Context manager timing a block as a span. The ``as`` target is the
+    span's args dict, to add details like token counts while the block runs.
+
+    Parameters:
+      name (str): The span name, the rows of the summary table.
+      category (str): A group of spans, like "chat_io" or "llm".
+      **args: Details shown in the trace.
+    """
+
+    __slots__ = ("record",)
+
+    def __init__(self, name: str, category: str = "", **args):
+        self.record = _new_span(name, category, 0.0, args) if _enabled else None
+
+    def __enter__(self) -> dict:
+        if self.record is None:
+            return {}
+        _spans.append(self.record)
+        self.record["start"] = time.perf_counter()
+        return self.record["args"]
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if self.record is not None:
+            self.record["end"] = time.perf_counter()
+            if exc_type is not None:
+                self.record["args"]["error"] = exc_type.__name__
+
+def end_startup() -> None:
+    """Ends the startup span: imports, argument parsing and settings are done."""
+    if _enabled and _spans and _spans[0]["name"] == "startup" and _spans[0]["end"] is None:
+        _spans[0]["end"] = time.perf_counter()
+
+def spans() -> list[dict]:
+    """Returns the finished spans, with "start" and "duration_ms" in ms since the process started."""
+    return [
+        {
+            "name": record["name"],
+            "category": record["category"],
+            "start_ms": (record["start"] - _process_started) * 1000,
+            "duration_ms": (record["end"] - record["start"]) * 1000,
+            "args": dict(record["args"]),
+        }
+        for record in _spans if record["end"] is not None
+    ]
+
+def chrome_trace() -> dict:
+    """Returns the spans as a Chrome trace (complete "X" events, times in µs)."""
+    pid = os.getpid()
+    events = [
+        {
+            "name": record["name"],
+            "cat": record["category"],
+            "ph": "X",
+            "ts": round((record["start"] - _process_started) * 1e6, 1),
+            "dur": round((record["end"] - record["start"]) * 1e6, 1),
+            "pid": pid,
+            "tid": record["lane"],
+            "args": record["args"],
+        }
+        for record in _spans if record["end"] is not None
+    ]
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+def summary_table() -> str:
+    """Returns the time spent per span name and the token usage of every model call, as a table."""
+    finished = spans()
+    rows: dict[str, list[float]] = {}
+    for record in finished:
+        rows.setdefault(record["name"], []).append(record["duration_ms"])
+    wall_ms = (time.perf_counter() - _process_started) * 1000
+    lines = [f"{'span':<18}{'calls':>6}{'total [ms]':>12}{'mean [ms]':>11}{'max [ms]':>10}{'% wall':>8}"]
+    for name, durations in rows.items():
+        total = sum(durations)
+        lines.append(
+            f"{name:<18}{len(durations):>6}{total:>12.1f}{total / len(durations):>11.1f}"
+            f"{max(durations):>10.1f}{100 * total / wall_ms:>7.1f}%"
+        )
+    lines.append(f"{'wall time':<18}{'':>6}{wall_ms:>12.1f}")
+    calls = [record for record in finished if record["category"] == "llm"]
+    for i, record in enumerate(calls, 1):
+        args = record["args"]
+        details = ", ".join(f"{field} {args[field]}" for field in TOKEN_FIELDS if field in args)
+        if args.get("response_cache"):
+            details = "answered from the response cache"
+        lines.append(f"model call {i}: {record['duration_ms']:.1f} ms" + (f" ({details})" if details else ""))
+    return "\n".join(lines)
+
+def report() -> None:
+    """Prints the summary table and writes the Chrome trace, if profiling is enabled."""
+    if not _enabled:
+        return
+    import json
+    from colorama import Fore, Style
+    from . import logger
+    end_startup()
+    logger.info(f"{Fore.CYAN}Profile:{Style.RESET_ALL}\n{summary_table()}")
+    if _export_file:
+        with open(_export_file, "w") as f:
+            json.dump(chrome_trace(), f)
+        logger.info(f"Trace written to {_export_file}")
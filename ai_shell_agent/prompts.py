@@ -132,3 +132,17 @@ elif "Linux" in os_brand:
     default_system_prompt = default_linux_prompt
 elif "Darwin" in os_brand:
     default_system_prompt = default_mac_prompt
+
+summary_prompt = """\
+You maintain a running summary of a support conversation between a user and a shell agent.
+You will receive the current summary (possibly empty) and the next part of the conversation transcript.
+Return an updated summary that keeps:
+- the user's goals and open requests,
+- commands that were run and the key facts learned from their output (versions, paths, errors, results),
+- decisions taken and anything left unfinished.
+Be concise and factual, use short bullet points, and do not add commentary.
+"""
+
+summary_context_prefix = "Summary of the earlier part of this conversation:"
+
+retrieved_context_prefix = "Earlier messages of this conversation that may be relevant to the current request:"
@@ -0,0 +1,108 @@
+# File: ai_shell_agent/response_cache.py
+"""
+On-disk cache of model responses for deterministic (temperature 0) calls.
+
+Responses are stored in a small SQLite database, keyed by a hash of
+everything that determines the completion: provider, model, temperature,
+tool schemas and the messages sent. Entries expire after a TTL, and the
+least recently used ones are evicted once the cache grows past its size cap.
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+from typing import Optional
+
+from . import logger
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_TTL_SECONDS = 7 * 24 * 3600
+CACHE_DB_NAME = "responses.db"
+
+
+def cache_key(*parts) -> str:
+    """
+    Returns the cache key for a model call.
+
+    Parameters:
+      *parts: JSON-serializable values identifying the call, e.g. the model
+        client key and the messages in OpenAI format.
+    """
+    data = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+class ResponseCache:
+    """Size-capped LRU cache of serialized model responses with a TTL."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS responses (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            created REAL NOT NULL,
+            used REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS responses_used ON responses (used);
+    """
+
+    def __init__(self, db_file: str, max_bytes: int = DEFAULT_MAX_BYTES, ttl: float = DEFAULT_TTL_SECONDS):
+        self.db_file = db_file
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._conn = None
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.db_file) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.db_file, timeout=30, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode = WAL")
+            self._conn.executescript(self.SCHEMA)
+        return self._conn
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def get(self, key: str) -> Optional[dict]:
+        """Returns the cached response for key, or None if there is none or it expired."""
+        row = self.conn.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        now = time.time()
+        if self.ttl and now - row[1] > self.ttl:
+            self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            return None
+        self.conn.execute("UPDATE responses SET used = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def put(self, key: str, value: dict) -> None:
+        """Stores a response and evicts the least recently used ones beyond the size cap."""
+        data = json.dumps(value, separators=(",", ":"))
+        now = time.time()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO responses (key, value, size, created, used) VALUES (?, ?, ?, ?, ?)",
+            (key, data, len(data), now, now),
+        )
+        self._evict(now)
+
+    def _evict(self, now: float) -> None:
+        if self.ttl:
+            self.conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        for key, size in self.conn.execute("SELECT key, size FROM responses ORDER BY used").fetchall():
+            if total <= self.max_bytes:
+                break
+            self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+        logger.debug(f"Evicted {evicted} responses from the response cache")
+
+    def clear(self) -> int:
+        """Removes all cached responses and returns how many there were."""
+        return self.conn.execute("DELETE FROM responses").rowcount
@@ -0,0 +1,173 @@
+# File: ai_shell_agent/retrieval.py
+"""
+Retrieval of older messages that are relevant to the current request.
+
+Every message of a chat is embedded once, when it is written, into a
+per-chat vector index (``<chat dir>/vectors/<chat id>.f32``, one float32 row
+per message of the history, next to a small JSON file with the message ids).
+Before a model call, the messages that rolled off the context window are
+ranked by cosine similarity with the latest user message, and the best ones
+are added to the context, right before that message.
+
+Embedders are pluggable (see EMBEDDERS); the default hashes word and
+character n-grams into a fixed-size vector, so it runs offline and gives the
+same vectors in every process. NumPy is imported on first use.
+"""
+import os
+import re
+import zlib
+from typing import Callable
+
+from .storage import read_json, write_json
+from .search import message_text
+
+VECTOR_DIR_NAME = "vectors"
+DEFAULT_EMBEDDER = "hashed"
+# Only the beginning of very long messages (e.g. tool outputs) is embedded.
+MAX_EMBED_CHARS = 8000
+# Messages scoring below this cosine similarity are never retrieved.
+MIN_SCORE = 0.15
+
+_WORD = re.compile(r"\w+")
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise RuntimeError("Retrieval needs the numpy package (pip install numpy)")
+    return numpy
+
+class HashedNgramEmbedder:
+    """
+    Embeds texts by hashing their words and the character n-grams of their
+    words into dim buckets (the feature hashing trick), with signed, log-scaled
+    counts. Deterministic and dependency-free apart from NumPy.
+    """
+
+    name = "hashed"
+
+    def __init__(self, dim: int = 512, n: int = 3):
+        self.dim = dim
+        self.n = n
+
+    def _features(self, text: str) -> list[str]:
+        features = []
+        for word in _WORD.findall(text[:MAX_EMBED_CHARS].lower()):
+            features.append(word)
+            padded = f" {word} "
+            features.extend(padded[i:i + self.n] for i in range(len(padded) - self.n + 1))
+        return features
+
+    def embed(self, texts: list[str]):
+        """Returns a (len(texts), dim) float32 array of unit-length vectors (zero for empty texts)."""
+        np = _numpy()
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            features = self._features(text)
+            if not features:
+                continue
+            hashes = np.fromiter((zlib.crc32(feature.encode()) for feature in features), dtype=np.uint32, count=len(features))
+            signs = np.where(hashes & 0x80000000, -1.0, 1.0)
+            counts = np.bincount(hashes % self.dim, weights=signs, minlength=self.dim)
+            vectors[row] = np.sign(counts) * np.log1p(np.abs(counts))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        np.divide(vectors, norms, out=vectors, where=norms > 0)
+        return vectors
+
+# Embedder factories by name, selected with the "retrieval_embedder" config key.
+# An embedder has a name, a dim and an embed(texts) method returning unit vectors.
+EMBEDDERS: dict[str, Callable[[], object]] = {"hashed": HashedNgramEmbedder}
+
+
+def register_embedder(name: str, factory: Callable[[], object]) -> None:
+    """Makes an embedder available under name, e.g. one backed by an embedding model."""
+    EMBEDDERS[name] = factory
+
+def get_embedder(name: str = DEFAULT_EMBEDDER):
+    """Returns a new embedder by name, or the default one if there is no such embedder."""
+    factory = EMBEDDERS.get(name)
+    if factory is None:
+        from . import logger
+        logger.warning(f"Unknown embedder '{name}', using {DEFAULT_EMBEDDER}.")
+        factory = EMBEDDERS[DEFAULT_EMBEDDER]
+    return factory()
+
+class VectorIndex:
+    """Embeddings of the messages of one chat; row i belongs to message i of the history."""
+
+    def __init__(self, vector_dir: str, chat_id: str, embedder):
+        self.vectors_file = os.path.join(vector_dir, f"{chat_id}.f32")
+        self.ids_file = os.path.join(vector_dir, f"{chat_id}.json")
+        self.embedder = embedder
+
+    def _ids(self) -> list:
+        """Returns the ids of the embedded messages, or [] if they are stale or torn."""
+        data = read_json(self.ids_file)
+        if data.get("embedder") != self.embedder.name or data.get("dim") != self.embedder.dim:
+            return []
+        ids = data.get("ids", [])
+        size = os.path.getsize(self.vectors_file) if os.path.exists(self.vectors_file) else 0
+        if size != len(ids) * self.embedder.dim * 4:
+            return []
+        return ids
+
+    def update(self, messages: list) -> int:
+        """
+        Embeds the messages that are not in the index yet. Rows of messages
+        that changed (e.g. after an edit) and all rows after them are replaced.
+
+        Parameters:
+          messages (list): The full chat history.
+
+        Returns:
+          int: The number of messages embedded.
+        """
+        ids = self._ids()
+        keep = 0
+        for indexed_id, msg in zip(ids, messages):
+            if indexed_id is None or indexed_id != msg.id:
+                break
+            keep += 1
+        if keep == len(ids) == len(messages):
+            return 0
+        new_messages = messages[keep:]
+        vectors = self.embedder.embed([message_text(msg) for msg in new_messages])
+        os.makedirs(os.path.dirname(self.vectors_file), exist_ok=True)
+        with open(self.vectors_file, "ab") as f:
+            f.truncate(keep * self.embedder.dim * 4)
+            f.write(vectors.tobytes())
+        ids = ids[:keep] + [msg.id for msg in new_messages]
+        write_json(self.ids_file, {"embedder": self.embedder.name, "dim": self.embedder.dim, "ids": ids})
+        return len(new_messages)
+
+    def vectors(self):
+        """Returns the (messages, dim) array of embeddings."""
+        np = _numpy()
+        if not os.path.exists(self.vectors_file):
+            return np.zeros((0, self.embedder.dim), dtype=np.float32)
+        return np.fromfile(self.vectors_file, dtype=np.float32).reshape(-1, self.embedder.dim)
+
+    def remove(self) -> None:
+        for file_path in (self.vectors_file, self.ids_file):
+            if os.path.exists(file_path):
+                os.remove(file_path)
+
+    def most_relevant(self, query: str, end: int, top_k: int, min_score: float = MIN_SCORE) -> list[int]:
+        """
+        Returns the positions of the messages before end that are most
+        similar to query, in history order.
+
+        Parameters:
+          query (str): The text to compare messages with.
+          end (int): Only messages 1 (after the system prompt) to end - 1 are candidates.
+          top_k (int): The maximum number of positions.
+          min_score (float): The minimum cosine similarity.
+        """
+        np = _numpy()
+        candidates = self.vectors()[1:end]
+        if not len(candidates) or top_k <= 0:
+            return []
+        scores = candidates @ self.embedder.embed([query])[0]
+        best = np.argsort(-scores, kind="stable")[:top_k]
+        return sorted(int(i) + 1 for i in best if scores[i] >= min_score)
@@ -0,0 +1,151 @@
+# File: ai_shell_agent/search.py
+"""
+Full-text search over the messages of all chats.
+
+Messages are kept in an SQLite FTS5 index (``<chat dir>/search.db``) that
+mirrors every chat history: each write of a history updates the index with
+the messages that changed (usually just the new turn), and a search first
+re-indexes the chats whose store version changed without going through the
+index (e.g. written by an older version). Rows are ranked with BM25.
+"""
+import os
+import json
+from typing import Iterable, Optional, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import sqlite3
+
+INDEX_DB_NAME = "search.db"
+# Message types that are indexed; system prompts are the same in most chats.
+INDEXED_TYPES = ("human", "ai", "tool")
+SNIPPET_TOKENS = 16
+# Highlight markers around matched terms in snippets.
+MATCH_START = "\x02"
+MATCH_END = "\x03"
+
+
+def message_text(message) -> str:
+    """Returns the searchable text of a message: its content and the arguments of its tool calls."""
+    content = message.content
+    if not isinstance(content, str):
+        content = " ".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+    parts = [content]
+    for tool_call in getattr(message, "tool_calls", None) or []:
+        parts.extend(str(value) for value in tool_call.get("args", {}).values())
+    return "\n".join(part for part in parts if part)
+
+def fts_query(query: str) -> str:
+    """Turns free text into an FTS5 query matching all of its words (the last one as a prefix)."""
+    words = [word.replace('"', '""') for word in query.split()]
+    terms = [f'"{word}"' for word in words]
+    if terms:
+        terms[-1] += "*"
+    return " ".join(terms)
+
+class SearchIndex:
+    """FTS5 index of chat messages, by chat id and position in the history."""
+
+    SCHEMA = """
+        CREATE VIRTUAL TABLE IF NOT EXISTS messages USING fts5(
+            text, chat_id UNINDEXED, seq UNINDEXED, type UNINDEXED,
+            tokenize = 'unicode61'
+        );
+        CREATE TABLE IF NOT EXISTS chats (
+            chat_id TEXT PRIMARY KEY,
+            length INTEGER NOT NULL,
+            version TEXT
+        );
+    """
+
+    def __init__(self, db_file: str):
+        self.db_file = db_file
+        self._conn = None
+
+    @property
+    def conn(self) -> "sqlite3.Connection":
+        if self._conn is None:
+            import sqlite3
+            os.makedirs(os.path.dirname(self.db_file) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.db_file, timeout=30, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode = WAL")
+            self._conn.executescript(self.SCHEMA)
+        return self._conn
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    @staticmethod
+    def encode_version(version: Optional[object]) -> Optional[str]:
+        return None if version is None else json.dumps(version)
+
+    def update(self, chat_id: str, keep: int, messages: list, version: Optional[object] = None) -> None:
+        """
+        Mirrors a write of a chat history: drops the indexed messages past
+        keep and indexes messages, the history from position keep on.
+        Messages already indexed beyond what the index holds are re-indexed.
+
+        Parameters:
+          chat_id (str): The chat.
+          keep (int): Number of leading messages that didn't change.
+          messages (list): The full history (messages or message views).
+          version (object, optional): The store version after the write.
+        """
+        conn = self.conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT length FROM chats WHERE chat_id = ?", (chat_id,)).fetchone()
+            start = min(keep, row[0] if row else 0)
+            conn.execute("DELETE FROM messages WHERE chat_id = ? AND seq >= ?", (chat_id, start))
+            conn.executemany(
+                "INSERT INTO messages (text, chat_id, seq, type) VALUES (?, ?, ?, ?)",
+                [
+                    (message_text(msg), chat_id, seq, msg.type)
+                    for seq, msg in enumerate(messages[start:], start)
+                    if msg.type in INDEXED_TYPES
+                ],
+            )
+            conn.execute(
+                "INSERT INTO chats (chat_id, length, version) VALUES (?, ?, ?) "
+                "ON CONFLICT(chat_id) DO UPDATE SET length = excluded.length, version = excluded.version",
+                (chat_id, len(messages), self.encode_version(version)),
+            )
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def versions(self) -> dict[str, Optional[str]]:
+        """Returns the encoded store version each indexed chat was indexed at."""
+        return dict(self.conn.execute("SELECT chat_id, version FROM chats"))
+
+    def remove_chats(self, chat_ids: Iterable[str]) -> None:
+        conn = self.conn
+        conn.execute("BEGIN IMMEDIATE")
+        for chat_id in chat_ids:
+            conn.execute("DELETE FROM messages WHERE chat_id = ?", (chat_id,))
+            conn.execute("DELETE FROM chats WHERE chat_id = ?", (chat_id,))
+        conn.execute("COMMIT")
+
+    def search(self, query: str, limit: int = 20) -> list[tuple]:
+        """
+        Returns the best matches for query.
+
+        Parameters:
+          query (str): Free text; every word has to match.
+          limit (int): The maximum number of results.
+
+        Returns:
+          list[tuple]: (chat id, position in the history, message type, snippet)
+            tuples, best match first. Matches in snippets are enclosed in
+            MATCH_START and MATCH_END.
+        """
+        match = fts_query(query)
+        if not match:
+            return []
+        return self.conn.execute(
+            "SELECT chat_id, seq, type, snippet(messages, 0, ?, ?, '...', ?) FROM messages "
+            "WHERE messages MATCH ? ORDER BY rank LIMIT ?",
+            (MATCH_START, MATCH_END, SNIPPET_TOKENS, match, limit),
+        ).fetchall()
@@ -0,0 +1,194 @@
+# File: ai_shell_agent/settings.py
+"""
+Typed settings, loaded once and cached until their sources change.
+
+Settings come from two places: the model settings (provider, temperature)
+from the environment, which ``ai`` fills from its ``.env`` file, and everything
+else from ``config.json`` in the data directory. ``load`` parses config.json
+only when its modification time or size changed, and ``load_env_file`` parses
+``.env`` only when it changed, so the many settings lookups of a command (or
+of a long-running daemon) cost a stat call instead of a JSON parse.
+"""
+import os
+import json
+from typing import Optional
+
+from . import logger
+from .prompts import default_system_prompt
+
+ENV_FILE = os.path.join(os.path.dirname(__file__), "..", ".env")
+DEFAULT_PROVIDER = "google"
+MODELS = {"google": "gemini-2.0-flash", "openai": "gpt-4o-mini", "fake": "fake", "replay": "replay"}
+
+# config.json keys with their type and default value.
+CONFIG_FIELDS = {
+    "default_system_prompt": (str, default_system_prompt),
+    "storage_backend": (str, "json"),
+    "chat_compression": (str, "none"),
+    "context_token_budget": (int, 16000),
+    "retrieval_top_k": (int, 0),
+    "retrieval_embedder": (str, "hashed"),
+    "stream": (bool, False),
+    "direct_tools": (bool, False),
+    "max_parallel_tools": (int, 4),
+    "tool_output_filters": (str, "ansi,dedupe,tables,elide"),
+    "tool_output_max_chars": (int, 8000),
+    "response_cache": (bool, False),
+    "response_cache_max_mb": (float, 64.0),
+    "response_cache_ttl_hours": (float, 7 * 24.0),
+    # Limits of the agent's shell commands, see executor.
+    "max_output_bytes": (int, 32 * 1024),
+    "command_timeout": (float, 600.0),
+    "idle_timeout": (float, 0.0),
+    # "auto" sends OpenAI's prompt_cache_key only to api.openai.com, see llms.
+    "prompt_cache_key": (str, "auto"),
+}
+
+
+class Settings:
+    """
+    Read-only snapshot of the settings. Every key of CONFIG_FIELDS is an
+    attribute, next to provider, model and temperature; ``data`` holds the raw
+    content of config.json.
+    """
+
+    __slots__ = ("provider", "model", "temperature", "data") + tuple(CONFIG_FIELDS)
+
+    def __init__(self, config: dict, provider: str, temperature: float):
+        set_attribute = object.__setattr__
+        set_attribute(self, "data", config)
+        set_attribute(self, "provider", provider)
+        set_attribute(self, "model", MODELS.get(provider, MODELS["openai"]))
+        set_attribute(self, "temperature", temperature)
+        for key, (kind, default) in CONFIG_FIELDS.items():
+            set_attribute(self, key, _coerce(config, key, kind, default))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Settings are read-only; use settings.update() to change config.json")
+
+    def __repr__(self) -> str:
+        return f"Settings(provider={self.provider!r}, temperature={self.temperature!r}, ...)"
+
+def _coerce(config: dict, key: str, kind: type, default):
+    if key not in config:
+        return default
+    value = config[key]
+    if kind is bool and isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        logger.warning(f"Invalid value for {key} in config.json: {value!r}; using {default!r}.")
+        return default
+
+def parse_value(key: str, value: str):
+    """
+    Converts a setting given as text (e.g. on the command line) to its type.
+
+    Raises:
+      KeyError: If key is not a setting of CONFIG_FIELDS.
+      ValueError: If value doesn't convert to the setting's type.
+    """
+    kind = CONFIG_FIELDS[key][0]
+    if kind is bool:
+        if value.strip().lower() not in ("1", "true", "yes", "on", "0", "false", "no", "off"):
+            raise ValueError(f"expected on or off, got {value!r}")
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    return kind(value)
+
+def _environment() -> tuple[str, float]:
+    provider = os.getenv("PROVIDER") or DEFAULT_PROVIDER
+    try:
+        temperature = float(os.getenv("TEMPERATURE") or 0)
+    except ValueError:
+        logger.warning(f"Invalid TEMPERATURE {os.getenv('TEMPERATURE')!r}; using 0.")
+        temperature = 0.0
+    return provider, temperature
+
+def _stat(file_path: Optional[str]) -> Optional[tuple]:
+    if file_path is None:
+        return None
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+# Parsed config files by path: (stat when parsed, content).
+_configs: dict[str, tuple] = {}
+# Last settings built, with what they were built from.
+_settings: dict[Optional[str], tuple] = {}
+
+
+def _read_config(config_file: str) -> dict:
+    stat = _stat(config_file)
+    cached = _configs.get(config_file)
+    if cached is not None and cached[0] == stat:
+        return cached[1]
+    config = {}
+    if stat is not None:
+        with open(config_file, "r") as f:
+            try:
+                config = json.load(f)
+            except json.JSONDecodeError:
+                logger.warning(f"Could not parse {config_file}; using the default settings.")
+    _configs[config_file] = (stat, config)
+    return config
+
+def load(config_file: str = None) -> Settings:
+    """
+    Returns the current settings.
+
+    Parameters:
+      config_file (str, optional): The config.json to read. Without it, only
+        the model settings are read and the others have their defaults.
+
+    Returns:
+      Settings: The settings, shared until config.json or the environment change.
+    """
+    config = _read_config(config_file) if config_file else {}
+    environment = _environment()
+    cached = _settings.get(config_file)
+    if cached is not None and cached[0] is config and cached[1] == environment:
+        return cached[2]
+    settings = Settings(config, *environment)
+    _settings[config_file] = (config, environment, settings)
+    return settings
+
+def read_config(config_file: str) -> dict:
+    """Returns a copy of the raw content of config.json, e.g. to change and write it."""
+    return dict(_read_config(config_file))
+
+def update(config_file: str, **changes) -> None:
+    """
+    Changes keys of config.json.
+
+    Parameters:
+      config_file (str): The config.json to update.
+      **changes: The keys to set.
+    """
+    from .storage import write_json
+    config = read_config(config_file)
+    config.update(changes)
+    write_json(config_file, config)
+    _configs.pop(config_file, None)
+
+# Content of the .env file by stat when parsed, see load_env_file.
+_env_file = (None, {})
+
+
+def load_env_file(env_file: str = ENV_FILE) -> None:
+    """
+    Sets the variables of the .env file that are not set in the environment
+    yet. The file is parsed again only when it changed.
+    """
+    global _env_file
+    stat = _stat(env_file)
+    if stat is None:
+        return
+    if _env_file[0] != (env_file, stat):
+        from dotenv import dotenv_values
+        _env_file = ((env_file, stat), dotenv_values(env_file))
+    for key, value in _env_file[1].items():
+        if value is not None and key not in os.environ:
+            os.environ[key] = value
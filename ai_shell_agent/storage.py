@@ -0,0 +1,583 @@
+# File: ai_shell_agent/storage.py
+"""
+Pluggable storage backends for chats, their messages and the current session
+of each terminal.
+
+Chats are addressed by their chat file path (``<chat dir>/<chat id>.json``),
+which is what the rest of the package passes around and keeps in the session.
+The JSON backend stores exactly that file (as a journal) next to
+``chat_map.json`` and one small ``sessions/<terminal>.json`` file per terminal;
+the SQLite backend keeps everything in a single database and only uses the
+path to derive the chat id. ``session.json``, the single current chat of older
+versions, is still read for terminals that don't have a session yet.
+"""
+import os
+import json
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Optional, TYPE_CHECKING
+
+from . import logger
+from . import journal
+from . import locking
+
+if TYPE_CHECKING:
+    import sqlite3
+
+BACKENDS = ("json", "sqlite")
+DEFAULT_BACKEND = "json"
+SQLITE_DB_NAME = "chats.db"
+SESSION_DIR_NAME = "sessions"
+# Terminal sessions not changed for this long are pruned, see prune_sessions.
+SESSION_MAX_AGE = 30 * 24 * 3600
+
+
+def read_json(file_path: str) -> dict:
+    if os.path.exists(file_path):
+        with open(file_path, "r") as f:
+            try:
+                return json.load(f)
+            except json.JSONDecodeError:
+                logger.warning(f"Could not parse {file_path}; treating it as empty.")
+                return {}
+    return {}
+
+def write_json(file_path: str, data: dict) -> None:
+    """Writes a JSON file atomically: concurrent readers never see it half written."""
+    os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+    locking.atomic_write(file_path, json.dumps(data, indent=4).encode())
+
+
+class ChatStore:
+    """
+    Interface of a chat storage backend.
+
+    Message records are the plain dicts produced by ``BaseMessage.model_dump()``;
+    converting them to and from LangChain messages is up to the caller.
+    """
+
+    # Compression used when (re)writing chat histories; see journal.COMPRESSIONS.
+    # Backends that can't compress ignore it.
+    compression = "none"
+
+    def __init__(self, chat_dir: str):
+        self.chat_dir = chat_dir
+
+    def lock(self):
+        """
+        Returns a context manager that keeps other processes from changing the
+        store while it is held, for read-modify-write cycles. Reentrant.
+        """
+        return locking.file_lock(os.path.join(self.chat_dir, locking.LOCK_FILE_NAME))
+
+    def chat_file(self, chat_id: str) -> str:
+        """Returns the chat file path used to address the chat with the given id."""
+        return os.path.join(self.chat_dir, f"{chat_id}.json")
+
+    @staticmethod
+    def chat_id(chat_file: str) -> str:
+        """Returns the chat id encoded in a chat file path."""
+        return os.path.splitext(os.path.basename(chat_file))[0]
+
+    # Chats
+    def get_chat_id(self, title: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def create_chat(self, title: str, chat_id: str = None) -> str:
+        """Registers a new chat under the given title and returns its id."""
+        raise NotImplementedError
+
+    def list_titles(self) -> list[str]:
+        raise NotImplementedError
+
+    def chat_ids(self) -> dict[str, str]:
+        """Returns the id of every chat by title."""
+        return {title: self.get_chat_id(title) for title in self.list_titles()}
+
+    def get_title(self, chat_file: str) -> Optional[str]:
+        """Returns the title of the chat stored at chat_file, or None."""
+        raise NotImplementedError
+
+    def rename_chat(self, old_title: str, new_title: str) -> bool:
+        raise NotImplementedError
+
+    def delete_chats(self, titles: list[str]) -> list[str]:
+        """Deletes the given chats and returns the chat files that were removed."""
+        raise NotImplementedError
+
+    # Messages
+    def has_history(self, chat_file: str) -> bool:
+        raise NotImplementedError
+
+    def read_records(self, chat_file: str) -> list[dict]:
+        raise NotImplementedError
+
+    def write_records(self, chat_file: str, records: list[dict]) -> None:
+        """Replaces the whole history of a chat."""
+        raise NotImplementedError
+
+    def can_append(self, chat_file: str) -> bool:
+        """Returns True if append_records can be used for this chat."""
+        raise NotImplementedError
+
+    def append_records(self, chat_file: str, records: list[dict], keep: int = None) -> None:
+        """Appends records, dropping all but the first `keep` stored records first if given."""
+        raise NotImplementedError
+
+    def needs_compaction(self, chat_file: str, live_count: int) -> bool:
+        return False
+
+    def version(self, chat_file: str) -> Optional[object]:
+        """
+        Returns a token that changes whenever the chat's history changes,
+        or None if the backend can't tell (callers must then re-read).
+        """
+        return None
+
+    def history_version(self, chat_file: str) -> Optional[object]:
+        """
+        Like version(), but JSON-serializable and comparable across processes
+        and runs, e.g. to tell whether an on-disk index of the chat is stale.
+        """
+        return self.version(chat_file)
+
+    # Per-chat metadata (e.g. the rolling context summary)
+    def read_meta(self, chat_file: str) -> dict:
+        raise NotImplementedError
+
+    def write_meta(self, chat_file: str, meta: dict) -> None:
+        raise NotImplementedError
+
+    # Sessions: the current chat of each terminal (see terminal.terminal_key).
+    # terminal=None addresses the shared session of older versions.
+    def get_current_chat(self, terminal: str = None) -> Optional[str]:
+        """Returns the current chat of a terminal, falling back to the shared session."""
+        raise NotImplementedError
+
+    def set_current_chat(self, chat_file: Optional[str], terminal: str = None) -> None:
+        raise NotImplementedError
+
+    def sessions(self) -> dict[Optional[str], str]:
+        """Returns the current chat of every terminal that has a session."""
+        raise NotImplementedError
+
+    def prune_sessions(self, chat_files: set[str], max_age: float = SESSION_MAX_AGE) -> int:
+        """
+        Removes the sessions of terminals whose current chat is gone (e.g. a
+        flushed temporary chat) and, where the backend keeps track of it, of
+        terminals that didn't switch chats for max_age seconds. The shared
+        session is kept.
+
+        Parameters:
+          chat_files (set[str]): The chat files of all existing chats.
+          max_age (float): Seconds after which an unchanged session is stale.
+
+        Returns:
+          int: The number of removed sessions.
+        """
+        raise NotImplementedError
+
+
+class JsonChatStore(ChatStore):
+    """Default backend: chat_map.json, one session file per terminal and one journal file per chat."""
+
+    def __init__(self, chat_dir: str, chat_map_file: str, session_file: str):
+        super().__init__(chat_dir)
+        self.chat_map_file = chat_map_file
+        self.session_file = session_file
+
+    def get_chat_id(self, title: str) -> Optional[str]:
+        return read_json(self.chat_map_file).get(title)
+
+    def create_chat(self, title: str, chat_id: str = None) -> str:
+        chat_id = chat_id or str(uuid.uuid4())
+        with self.lock():
+            chat_map = read_json(self.chat_map_file)
+            chat_map[title] = chat_id
+            write_json(self.chat_map_file, chat_map)
+        return chat_id
+
+    def list_titles(self) -> list[str]:
+        return list(read_json(self.chat_map_file).keys())
+
+    def chat_ids(self) -> dict[str, str]:
+        return read_json(self.chat_map_file)
+
+    def get_title(self, chat_file: str) -> Optional[str]:
+        for title, chat_id in read_json(self.chat_map_file).items():
+            if self.chat_file(chat_id) == chat_file:
+                return title
+        return None
+
+    def rename_chat(self, old_title: str, new_title: str) -> bool:
+        with self.lock():
+            chat_map = read_json(self.chat_map_file)
+            if old_title not in chat_map:
+                return False
+            chat_map[new_title] = chat_map.pop(old_title)
+            write_json(self.chat_map_file, chat_map)
+        return True
+
+    def delete_chats(self, titles: list[str]) -> list[str]:
+        removed = []
+        with self.lock():
+            chat_map = read_json(self.chat_map_file)
+            for title in titles:
+                if title not in chat_map:
+                    continue
+                chat_file = self.chat_file(chat_map.pop(title))
+                for file_path in (chat_file, self._meta_file(chat_file)):
+                    if os.path.exists(file_path):
+                        os.remove(file_path)
+                journal.forget(chat_file)
+                removed.append(chat_file)
+            if removed:
+                write_json(self.chat_map_file, chat_map)
+        return removed
+
+    def has_history(self, chat_file: str) -> bool:
+        return os.path.exists(chat_file)
+
+    def read_records(self, chat_file: str) -> list[dict]:
+        return journal.read_records(chat_file)
+
+    def write_records(self, chat_file: str, records: list[dict]) -> None:
+        with self.lock():
+            journal.write_records(chat_file, records, compression=self.compression)
+
+    def can_append(self, chat_file: str) -> bool:
+        return journal.can_append(chat_file)
+
+    def append_records(self, chat_file: str, records: list[dict], keep: int = None) -> None:
+        with self.lock():
+            journal.append_records(chat_file, records, keep=keep)
+
+    def needs_compaction(self, chat_file: str, live_count: int) -> bool:
+        return journal.needs_compaction(chat_file, live_count)
+
+    def version(self, chat_file: str) -> Optional[object]:
+        try:
+            stat = os.stat(chat_file)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    @staticmethod
+    def _meta_file(chat_file: str) -> str:
+        return os.path.splitext(chat_file)[0] + ".meta.json"
+
+    def read_meta(self, chat_file: str) -> dict:
+        return read_json(self._meta_file(chat_file))
+
+    def write_meta(self, chat_file: str, meta: dict) -> None:
+        write_json(self._meta_file(chat_file), meta)
+
+    def _session_file(self, terminal: Optional[str]) -> str:
+        if terminal is None:
+            return self.session_file
+        return os.path.join(self.chat_dir, SESSION_DIR_NAME, f"{terminal}.json")
+
+    def get_current_chat(self, terminal: str = None) -> Optional[str]:
+        session = read_json(self._session_file(terminal))
+        if "current_chat" not in session and terminal is not None:
+            session = read_json(self.session_file)
+        return session.get("current_chat", None)
+
+    def set_current_chat(self, chat_file: Optional[str], terminal: str = None) -> None:
+        session_file = self._session_file(terminal)
+        session = {"current_chat": chat_file}
+        if read_json(session_file) == session:
+            return
+        os.makedirs(os.path.dirname(session_file) or ".", exist_ok=True)
+        write_json(session_file, session)
+
+    def sessions(self) -> dict[Optional[str], str]:
+        sessions = {}
+        if os.path.exists(self.session_file):
+            sessions[None] = read_json(self.session_file).get("current_chat")
+        session_dir = os.path.join(self.chat_dir, SESSION_DIR_NAME)
+        if os.path.isdir(session_dir):
+            for name in os.listdir(session_dir):
+                terminal, ext = os.path.splitext(name)
+                if ext == ".json":
+                    sessions[terminal] = read_json(os.path.join(session_dir, name)).get("current_chat")
+        return {terminal: chat_file for terminal, chat_file in sessions.items() if chat_file}
+
+    def prune_sessions(self, chat_files: set[str], max_age: float = SESSION_MAX_AGE) -> int:
+        session_dir = os.path.join(self.chat_dir, SESSION_DIR_NAME)
+        if not os.path.isdir(session_dir):
+            return 0
+        cutoff = time.time() - max_age
+        removed = 0
+        for name in os.listdir(session_dir):
+            session_file = os.path.join(session_dir, name)
+            try:
+                stale = os.path.getmtime(session_file) < cutoff
+                if not stale and read_json(session_file).get("current_chat") in chat_files:
+                    continue
+                os.remove(session_file)
+            except (OSError, ValueError):
+                continue
+            removed += 1
+        return removed
+
+
+class SqliteChatStore(ChatStore):
+    """
+    SQLite backend: chats, messages and session state in one indexed database,
+    so title lookups are index hits and appending a turn inserts single rows.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS chats (
+            id TEXT PRIMARY KEY,
+            title TEXT NOT NULL UNIQUE
+        );
+        CREATE TABLE IF NOT EXISTS messages (
+            chat_id TEXT NOT NULL REFERENCES chats(id) ON DELETE CASCADE,
+            seq INTEGER NOT NULL,
+            record TEXT NOT NULL,
+            PRIMARY KEY (chat_id, seq)
+        );
+        CREATE TABLE IF NOT EXISTS chat_meta (
+            chat_id TEXT PRIMARY KEY REFERENCES chats(id) ON DELETE CASCADE,
+            meta TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS session (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+        CREATE TABLE IF NOT EXISTS chat_revisions (
+            chat_id TEXT PRIMARY KEY REFERENCES chats(id) ON DELETE CASCADE,
+            revision INTEGER NOT NULL
+        );
+    """
+
+    def __init__(self, chat_dir: str, db_file: str = None):
+        super().__init__(chat_dir)
+        self.db_file = db_file or os.path.join(chat_dir, SQLITE_DB_NAME)
+        self._conn = None
+
+    @property
+    def conn(self) -> "sqlite3.Connection":
+        if self._conn is None:
+            import sqlite3
+            os.makedirs(os.path.dirname(self.db_file) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.db_file, timeout=30, isolation_level=None)
+            self._conn.execute("PRAGMA foreign_keys = ON")
+            self._conn.execute("PRAGMA journal_mode = WAL")
+            self._conn.executescript(self.SCHEMA)
+        return self._conn
+
+    @contextmanager
+    def _transaction(self):
+        conn = self.conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def get_chat_id(self, title: str) -> Optional[str]:
+        row = self.conn.execute("SELECT id FROM chats WHERE title = ?", (title,)).fetchone()
+        return row[0] if row else None
+
+    def create_chat(self, title: str, chat_id: str = None) -> str:
+        chat_id = chat_id or str(uuid.uuid4())
+        self.conn.execute("INSERT INTO chats (id, title) VALUES (?, ?)", (chat_id, title))
+        return chat_id
+
+    def list_titles(self) -> list[str]:
+        return [row[0] for row in self.conn.execute("SELECT title FROM chats ORDER BY rowid")]
+
+    def chat_ids(self) -> dict[str, str]:
+        return dict(self.conn.execute("SELECT title, id FROM chats ORDER BY rowid"))
+
+    def get_title(self, chat_file: str) -> Optional[str]:
+        row = self.conn.execute("SELECT title FROM chats WHERE id = ?", (self.chat_id(chat_file),)).fetchone()
+        return row[0] if row else None
+
+    def rename_chat(self, old_title: str, new_title: str) -> bool:
+        with self._transaction():
+            if self.conn.execute("SELECT 1 FROM chats WHERE title = ?", (old_title,)).fetchone() is None:
+                return False
+            # Renaming onto an existing title replaces that chat, like the JSON map does.
+            self.conn.execute("DELETE FROM chats WHERE title = ? AND title != ?", (new_title, old_title))
+            self.conn.execute("UPDATE chats SET title = ? WHERE title = ?", (new_title, old_title))
+        return True
+
+    def delete_chats(self, titles: list[str]) -> list[str]:
+        removed = []
+        with self._transaction():
+            for title in titles:
+                chat_id = self.get_chat_id(title)
+                if chat_id is None:
+                    continue
+                self.conn.execute("DELETE FROM chats WHERE id = ?", (chat_id,))
+                removed.append(self.chat_file(chat_id))
+        return removed
+
+    def has_history(self, chat_file: str) -> bool:
+        row = self.conn.execute(
+            "SELECT 1 FROM messages WHERE chat_id = ? LIMIT 1", (self.chat_id(chat_file),)
+        ).fetchone()
+        return row is not None
+
+    def read_records(self, chat_file: str) -> list[dict]:
+        rows = self.conn.execute(
+            "SELECT record FROM messages WHERE chat_id = ? ORDER BY seq", (self.chat_id(chat_file),)
+        )
+        return [json.loads(row[0]) for row in rows]
+
+    def _ensure_chat(self, chat_id: str) -> None:
+        # Histories can be written for chats that were never registered under
+        # a title (e.g. by tests); give those a placeholder title.
+        self.conn.execute("INSERT OR IGNORE INTO chats (id, title) VALUES (?, ?)", (chat_id, f"untitled_{chat_id}"))
+
+    def _insert(self, chat_id: str, records: list[dict], start: int) -> None:
+        self.conn.execute(
+            "INSERT INTO chat_revisions (chat_id, revision) VALUES (?, 1) "
+            "ON CONFLICT(chat_id) DO UPDATE SET revision = revision + 1",
+            (chat_id,),
+        )
+        self.conn.executemany(
+            "INSERT INTO messages (chat_id, seq, record) VALUES (?, ?, ?)",
+            [(chat_id, start + i, json.dumps(record, separators=(",", ":"))) for i, record in enumerate(records)],
+        )
+
+    def write_records(self, chat_file: str, records: list[dict]) -> None:
+        chat_id = self.chat_id(chat_file)
+        with self._transaction():
+            self._ensure_chat(chat_id)
+            self.conn.execute("DELETE FROM messages WHERE chat_id = ?", (chat_id,))
+            self._insert(chat_id, records, 0)
+
+    def can_append(self, chat_file: str) -> bool:
+        return True
+
+    def version(self, chat_file: str) -> Optional[object]:
+        # data_version changes whenever another connection commits; writes of
+        # this connection change the message count.
+        data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        row = self.conn.execute("SELECT COUNT(*) FROM messages WHERE chat_id = ?", (self.chat_id(chat_file),)).fetchone()
+        return (data_version, row[0])
+
+    def history_version(self, chat_file: str) -> Optional[object]:
+        # data_version is per connection; every write bumps the chat's revision.
+        chat_id = self.chat_id(chat_file)
+        count = self.conn.execute("SELECT COUNT(*) FROM messages WHERE chat_id = ?", (chat_id,)).fetchone()[0]
+        row = self.conn.execute("SELECT revision FROM chat_revisions WHERE chat_id = ?", (chat_id,)).fetchone()
+        return [count, row[0] if row else 0]
+
+    def append_records(self, chat_file: str, records: list[dict], keep: int = None) -> None:
+        chat_id = self.chat_id(chat_file)
+        with self._transaction():
+            self._ensure_chat(chat_id)
+            if keep is not None:
+                self.conn.execute("DELETE FROM messages WHERE chat_id = ? AND seq >= ?", (chat_id, keep))
+            row = self.conn.execute("SELECT COUNT(*) FROM messages WHERE chat_id = ?", (chat_id,)).fetchone()
+            self._insert(chat_id, records, row[0])
+
+    def read_meta(self, chat_file: str) -> dict:
+        row = self.conn.execute("SELECT meta FROM chat_meta WHERE chat_id = ?", (self.chat_id(chat_file),)).fetchone()
+        return json.loads(row[0]) if row else {}
+
+    def write_meta(self, chat_file: str, meta: dict) -> None:
+        chat_id = self.chat_id(chat_file)
+        with self._transaction():
+            self._ensure_chat(chat_id)
+            self.conn.execute(
+                "INSERT INTO chat_meta (chat_id, meta) VALUES (?, ?) "
+                "ON CONFLICT(chat_id) DO UPDATE SET meta = excluded.meta",
+                (chat_id, json.dumps(meta)),
+            )
+
+    @staticmethod
+    def _session_key(terminal: Optional[str]) -> str:
+        return "current_chat" if terminal is None else f"current_chat:{terminal}"
+
+    def get_current_chat(self, terminal: str = None) -> Optional[str]:
+        row = self.conn.execute(
+            "SELECT value FROM session WHERE key = ?", (self._session_key(terminal),)
+        ).fetchone()
+        if row is None and terminal is not None:
+            return self.get_current_chat()
+        return row[0] if row else None
+
+    def set_current_chat(self, chat_file: Optional[str], terminal: str = None) -> None:
+        self.conn.execute(
+            "INSERT INTO session (key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (self._session_key(terminal), chat_file),
+        )
+
+    def sessions(self) -> dict[Optional[str], str]:
+        sessions = {}
+        for key, chat_file in self.conn.execute("SELECT key, value FROM session WHERE key LIKE 'current_chat%'"):
+            if chat_file:
+                sessions[key.partition(":")[2] or None] = chat_file
+        return sessions
+
+    def prune_sessions(self, chat_files: set[str], max_age: float = SESSION_MAX_AGE) -> int:
+        # Sessions don't record when they changed here, so max_age doesn't apply.
+        keys = [
+            key for key, chat_file in self.conn.execute("SELECT key, value FROM session WHERE key LIKE 'current_chat:%'")
+            if chat_file not in chat_files
+        ]
+        with self._transaction():
+            self.conn.executemany("DELETE FROM session WHERE key = ?", [(key,) for key in keys])
+        return len(keys)
+
+
+def _free_title(store: ChatStore, title: str) -> str:
+    number = 2
+    while store.get_chat_id(f"{title} ({number})") is not None:
+        number += 1
+    return f"{title} ({number})"
+
+def migrate(source: ChatStore, target: ChatStore, replace: bool = True) -> int:
+    """
+    Copies every chat, its history and the terminals' sessions from one store to another.
+    Chats keep their ids, so chat file paths stay valid across backends.
+
+    Parameters:
+      source (ChatStore): The store to copy from.
+      target (ChatStore): The store to copy into.
+      replace (bool): Whether chats and sessions of the target are replaced by
+        those of the source. If False, chats with a taken title are copied
+        under a numbered title, and existing sessions are kept.
+
+    Returns:
+      int: The number of chats migrated.
+    """
+    count = 0
+    existing_sessions = {} if replace else target.sessions()
+    for title in source.list_titles():
+        chat_id = source.get_chat_id(title)
+        chat_file = source.chat_file(chat_id)
+        if not replace and target.get_title(target.chat_file(chat_id)) is not None:
+            continue  # copied before
+        if target.get_chat_id(title) is not None:
+            if replace:
+                target.delete_chats([title])
+            else:
+                title = _free_title(target, title)
+        target.create_chat(title, chat_id)
+        target.write_records(target.chat_file(chat_id), source.read_records(chat_file))
+        meta = source.read_meta(chat_file)
+        if meta:
+            target.write_meta(target.chat_file(chat_id), meta)
+        logger.debug(f"Migrated chat {title} ({chat_id})")
+        count += 1
+    for terminal, current_chat in source.sessions().items():
+        if terminal not in existing_sessions:
+            target.set_current_chat(target.chat_file(source.chat_id(current_chat)), terminal)
+    return count
@@ -0,0 +1,30 @@
+# File: ai_shell_agent/terminal.py
+"""
+Identifies the terminal ``ai`` is invoked from, so every terminal can have its
+own current chat.
+
+The id is stable across invocations from the same shell and differs between
+terminals running side by side: it is the AI_SHELL_TERMINAL environment
+variable if set, otherwise the POSIX session id (the process id of the
+terminal's shell), otherwise the parent process id.
+"""
+import os
+import hashlib
+
+TERMINAL_ENV = "AI_SHELL_TERMINAL"
+
+
+def terminal_id() -> str:
+    """Returns an identifier of the current terminal."""
+    if os.getenv(TERMINAL_ENV):
+        return os.environ[TERMINAL_ENV]
+    if hasattr(os, "getsid"):
+        try:
+            return f"sid:{os.getsid(0)}"
+        except OSError:
+            pass
+    return f"ppid:{os.getppid()}"
+
+def terminal_key() -> str:
+    """Returns a short, filename-safe key of terminal_id()."""
+    return hashlib.sha1(terminal_id().encode()).hexdigest()[:16]
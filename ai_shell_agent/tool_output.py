@@ -0,0 +1,127 @@
+# File: ai_shell_agent/tool_output.py
+"""
+Compression of tool outputs before they enter the conversation.
+
+A tool result is sent to the model again with every later call of the chat,
+so a long ``ps aux`` or a noisy build log costs tokens and latency for the
+rest of the conversation. The output the model sees goes through a pipeline
+of filters (selected with the "tool_output_filters" config key); the full
+output is kept in the blob store and shown by ``ai -lsm``.
+
+A filter is called as ``filter(text, max_chars)`` and returns the filtered
+text; more can be added with register_filter.
+"""
+import re
+from typing import Callable, Iterable
+
+DEFAULT_FILTERS = ("ansi", "dedupe", "tables", "elide")
+# Lines wider than this are shortened by the tables filter...
+MAX_LINE_CHARS = 200
+# ...by cutting their cells to this length.
+MAX_CELL_CHARS = 48
+# Runs of at least this many identical lines are collapsed.
+MIN_REPEATS = 3
+
+_ANSI = re.compile(r"\x1b\[[0-?]*[ -/]*[@-~]|\x1b\][^\x07\x1b]*(?:\x07|\x1b\\)|\x1b[@-Z\\-_]")
+_CELLS = re.compile(r"(\s+)")
+
+
+def strip_ansi(text: str, max_chars: int) -> str:
+    """Removes terminal escape sequences, and progress lines overwritten with carriage returns."""
+    text = _ANSI.sub("", text)
+    if "\r" in text:
+        text = "\n".join(line.rstrip("\r").rsplit("\r", 1)[-1] for line in text.split("\n"))
+    return text
+
+def collapse_duplicate_lines(text: str, max_chars: int) -> str:
+    """Replaces runs of identical lines by one line and the number of repeats."""
+    lines = text.split("\n")
+    collapsed = []
+    i = 0
+    while i < len(lines):
+        j = i
+        while j + 1 < len(lines) and lines[j + 1] == lines[i]:
+            j += 1
+        count = j - i + 1
+        if count >= MIN_REPEATS and lines[i].strip():
+            collapsed.append(f"{lines[i]}  [line repeated {count} times]")
+        else:
+            collapsed.extend(lines[i:j + 1])
+        i = j + 1
+    return "\n".join(collapsed)
+
+def _shorten_line(line: str) -> str:
+    parts = _CELLS.split(line)
+    for k in range(0, len(parts), 2):
+        if len(parts[k]) > MAX_CELL_CHARS:
+            parts[k] = parts[k][:MAX_CELL_CHARS - 1] + "…"
+    shortened = "".join(parts)
+    if len(shortened) > MAX_LINE_CHARS:
+        shortened = shortened[:MAX_LINE_CHARS - 1] + "…"
+    return shortened
+
+def truncate_table_columns(text: str, max_chars: int) -> str:
+    """
+    Shortens lines wider than MAX_LINE_CHARS cell by cell, so every column
+    of wide tables (e.g. the command lines in ``ps aux``) stays visible.
+    """
+    return "\n".join(_shorten_line(line) if len(line) > MAX_LINE_CHARS else line for line in text.split("\n"))
+
+def elide_middle(text: str, max_chars: int) -> str:
+    """Keeps the first and last lines of texts longer than max_chars, eliding the middle."""
+    if len(text) <= max_chars:
+        return text
+    lines = text.split("\n")
+    head, tail = [], []
+    budget = max_chars // 2
+    for line in lines:
+        if budget - len(line) - 1 < 0:
+            break
+        head.append(line)
+        budget -= len(line) + 1
+    budget = max_chars - max_chars // 2
+    for line in reversed(lines[len(head):]):
+        if budget - len(line) - 1 < 0:
+            break
+        tail.append(line)
+        budget -= len(line) + 1
+    tail.reverse()
+    elided = lines[len(head):len(lines) - len(tail)]
+    elided_chars = sum(len(line) + 1 for line in elided)
+    marker = f"[... {len(elided)} lines ({elided_chars} characters) elided ...]"
+    if not head and not tail:
+        # A single huge line: cut it instead.
+        return f"{text[:max_chars // 2]}\n{marker}\n{text[-(max_chars // 2):]}"
+    return "\n".join(head + [marker] + tail)
+
+# Filters by name, see the "tool_output_filters" config key.
+FILTERS: dict[str, Callable[[str, int], str]] = {
+    "ansi": strip_ansi,
+    "dedupe": collapse_duplicate_lines,
+    "tables": truncate_table_columns,
+    "elide": elide_middle,
+}
+
+
+def register_filter(name: str, output_filter: Callable[[str, int], str]) -> None:
+    """Makes a filter available under name for the "tool_output_filters" config key."""
+    FILTERS[name] = output_filter
+
+def compress(text: str, filters: Iterable[str] = DEFAULT_FILTERS, max_chars: int = 8000) -> str:
+    """
+    Runs a tool output through a pipeline of filters.
+
+    Parameters:
+      text (str): The tool output.
+      filters (Iterable[str]): Names of the filters to apply, in order.
+        Unknown names are skipped.
+      max_chars (int): The length the output is elided to.
+
+    Returns:
+      str: The compressed output.
+    """
+    for name in filters:
+        output_filter = FILTERS.get(name.strip())
+        if output_filter is not None:
+            text = output_filter(text, max_chars)
+    return text
@@ -1,13 +1,97 @@
-import subprocess
+import sys
 from langchain.tools import BaseTool, tool
+from langchain_core.tools import ToolException
 from langchain_core.utils.function_calling import convert_to_openai_function
 from langchain_experimental.tools.python.tool import PythonREPLTool
-from prompt_toolkit import prompt
 from colorama import Fore, Style, Back
 from . import logger
+from .utils import ask, ask_async
+from .executor import run_command, arun_command
+
+
+def _print_output_header() -> None:
+    print(f"{Fore.CYAN}╭{'─' * 18}╮{Style.RESET_ALL}")
+    print(f"{Fore.CYAN}│{Style.RESET_ALL} {Fore.GREEN}Command Output{Style.RESET_ALL} {Fore.CYAN}│{Style.RESET_ALL}")
+    print(f"{Fore.CYAN}╰{'─' * 18}╯{Style.RESET_ALL}")
+
+def _output_printer() -> tuple:
+    """Returns an on_output callback printing the output header before the first chunk, and the list of printed chunks."""
+    printed = []
+
+    def echo(text: str) -> None:
+        if not printed:
+            _print_output_header()
+        printed.append(text)
+        sys.stdout.write(text)
+        sys.stdout.flush()
+
+    return echo, printed
+
+def _report_result(command: str, result, printed: list, empty_notice: bool, stream_output: bool) -> str:
+    """
+    Prints how a command ended and returns what goes into the chat.
+    
+    Raises:
+        ToolException: If the command timed out and was killed. The tools turn
+            it into a ToolMessage with status "error", so the agent can go on.
+    """
+    if printed and not printed[-1].endswith("\n"):
+        print()
+    if not stream_output and result.stdout.strip():
+        print(f"{Fore.CYAN}▶ {command}{Style.RESET_ALL}\n{result.stdout.rstrip()}")
+    if result.truncated:
+        logger.debug("Command output was elided to fit the output byte cap.")
+
+    if result.timed_out:
+        logger.error(f"{Fore.RED}Command {result.timeout_reason} and was killed.{Style.RESET_ALL}")
+        report = f"Timeout: the command {result.timeout_reason} and was killed."
+        if result.stdout.strip():
+            report += f"\nOutput before the timeout:\n{result.stdout}"
+        if result.stderr.strip():
+            report += f"\nError output before the timeout:\n{result.stderr}"
+        raise ToolException(report)
+
+    if result.returncode != 0:
+        error_msg = f"{Fore.RED}╭{'─' * 16}╮{Style.RESET_ALL}\n"
+        error_msg += f"{Fore.RED}│{Style.RESET_ALL} {Fore.RED}Error Detected{Style.RESET_ALL} {Fore.RED}│{Style.RESET_ALL}\n"
+        error_msg += f"{Fore.RED}╰{'─' * 16}╯{Style.RESET_ALL}\n"
+        error_msg += f"{Fore.RED}{result.stderr}{Style.RESET_ALL}"
+        print(error_msg)
+        logger.error(f"Error: {result.stderr}")
+        return f"Error: {result.stderr}"
+
+    if empty_notice and not result.stdout.strip():
+        print(f"{Fore.YELLOW}Command executed with no output.{Style.RESET_ALL}")
+    logger.debug(f"{result.stdout}")
+    return result.stdout
+
+def _run_command(command: str, empty_notice: bool = False, stream_output: bool = True, detach: bool = False) -> str:
+    """
+    Runs a shell command, streaming its output to the terminal as it arrives.
+    
+    Args:
+        command (str): The shell command to execute.
+        empty_notice (bool): Whether to say so when the command printed nothing.
+        stream_output (bool): If False, the output is printed in one piece once
+            the command finished, so commands running in parallel don't interleave.
+        detach (bool): Run the command without the terminal, see executor.run_command.
+    
+    Returns:
+        str: The (possibly elided) output, or the error output prefixed with "Error:".
+    """
+    echo, printed = _output_printer()
+    result = run_command(command, on_output=echo if stream_output else None, detach=detach)
+    return _report_result(command, result, printed, empty_notice, stream_output)
+
+async def _arun_command(command: str, empty_notice: bool = False, stream_output: bool = True, detach: bool = False) -> str:
+    """Asynchronous version of _run_command, running the command in an asyncio subprocess."""
+    echo, printed = _output_printer()
+    result = await arun_command(command, on_output=echo if stream_output else None, detach=detach)
+    return _report_result(command, result, printed, empty_notice, stream_output)
 
 class ConsoleTool_HITL(BaseTool):
     name: str = "interactive_windows_shell_tool"
+    handle_tool_error: bool = True
     description: str = (
         "Use this tool to run console commands and view the output."
         "Args:"
@@ -26,6 +110,15 @@ class ConsoleTool_HITL(BaseTool):
         Returns:
             str: The output from executing the edited command.
         """
+        self._show_command(command)
+        edited_command = ask(f">", default=command)
+        
+        logger.debug(f"Executing command: {edited_command}")
+        
+        return _run_command(edited_command, empty_notice=True)
+
+    def _show_command(self, command: str) -> None:
+        """Shows the proposed command in a box and asks whether to run it."""
         # Format the command parts with different colors if it contains pipes or redirects
         formatted_cmd = self._format_command(command)
         
@@ -46,38 +139,6 @@ class ConsoleTool_HITL(BaseTool):
         
         # Prompt for command acceptance or edit
         print(f"{Fore.YELLOW}╰─> Run the generated command? [Accept/Edit] ▶{Style.RESET_ALL}")
-        edited_command = prompt(f">", default=command)
-        
-        logger.debug(f"Executing command: {edited_command}")
-        
-        try:
-            result = subprocess.run(
-                edited_command,
-                shell=True,
-                capture_output=True,
-                text=True,
-                check=True
-            )
-            output = result.stdout
-            
-            if output.strip():
-                print(f"{Fore.CYAN}╭{'─' * 18}╮{Style.RESET_ALL}")
-                print(f"{Fore.CYAN}│{Style.RESET_ALL} {Fore.GREEN}Command Output{Style.RESET_ALL} {Fore.CYAN}│{Style.RESET_ALL}")
-                print(f"{Fore.CYAN}╰{'─' * 18}╯{Style.RESET_ALL}")
-                print(f"{output}")
-            else:
-                print(f"{Fore.YELLOW}Command executed with no output.{Style.RESET_ALL}")
-                
-            logger.info(f"{output}")
-            return output
-        except subprocess.CalledProcessError as e:
-            error_msg = f"{Fore.RED}╭{'─' * 16}╮{Style.RESET_ALL}\n"
-            error_msg += f"{Fore.RED}│{Style.RESET_ALL} {Fore.RED}Error Detected{Style.RESET_ALL} {Fore.RED}│{Style.RESET_ALL}\n"
-            error_msg += f"{Fore.RED}╰{'─' * 16}╯{Style.RESET_ALL}\n"
-            error_msg += f"{Fore.RED}{e.stderr}{Style.RESET_ALL}"
-            print(error_msg)
-            logger.error(f"Error: {e.stderr}")
-            return f"Error: {e.stderr}"
 
     def _format_command(self, command: str) -> str:
         """Format a command with colors for pipes, redirects, and arguments."""
@@ -125,12 +186,22 @@ class ConsoleTool_HITL(BaseTool):
         Returns:
             str: The output from executing the edited command.
         """
-        return self._run(command)
+        self._show_command(command)
+        edited_command = await ask_async(f">", default=command)
+        
+        logger.debug(f"Executing command: {edited_command}")
+        
+        return await _arun_command(edited_command, empty_notice=True)
 
 
 class ConsoleTool_Direct(BaseTool):
     name: str = "direct_windows_shell_tool"
     description: str = "Executes a console command directly without user confirmation."
+    handle_tool_error: bool = True
+    # Print the output as it arrives (off when commands run in parallel)
+    stream_output: bool = True
+    # Run without the terminal (on for the agent's unconfirmed commands)
+    detach: bool = True
 
     def _run(self, command: str) -> str:
         """
@@ -146,32 +217,7 @@ class ConsoleTool_Direct(BaseTool):
         print(f"{Fore.CYAN}▶ {formatted_cmd}{Style.RESET_ALL}")
         logger.debug(f"> {formatted_cmd}")
         
-        try:
-            result = subprocess.run(
-                command,
-                shell=True,
-                capture_output=True,
-                text=True,
-                check=True
-            )
-            output = result.stdout
-            
-            if output.strip():
-                print(f"{Fore.CYAN}╭{'─' * 18}╮{Style.RESET_ALL}")
-                print(f"{Fore.CYAN}│{Style.RESET_ALL} {Fore.GREEN}Command Output{Style.RESET_ALL} {Fore.CYAN}│{Style.RESET_ALL}")
-                print(f"{Fore.CYAN}╰{'─' * 18}╯{Style.RESET_ALL}")
-                print(f"{output}")
-            
-            logger.info(f"{output}")
-            return output
-        except subprocess.CalledProcessError as e:
-            error_msg = f"{Fore.RED}╭{'─' * 16}╮{Style.RESET_ALL}\n"
-            error_msg += f"{Fore.RED}│{Style.RESET_ALL} {Fore.RED}Error Detected{Style.RESET_ALL} {Fore.RED}│{Style.RESET_ALL}\n"
-            error_msg += f"{Fore.RED}╰{'─' * 16}╯{Style.RESET_ALL}\n"
-            error_msg += f"{Fore.RED}{e.stderr}{Style.RESET_ALL}"
-            print(error_msg)
-            logger.error(f"Error: {e.stderr}")
-            return f"Error: {e.stderr}"
+        return _run_command(command, stream_output=self.stream_output, detach=self.detach)
             
     def _format_command(self, command: str) -> str:
         """Format a command with colors for pipes, redirects, and arguments."""
@@ -219,7 +265,11 @@ class ConsoleTool_Direct(BaseTool):
         Returns:
             str: The output from executing the command.
         """
-        return self._run(command)
+        formatted_cmd = self._format_command(command)
+        print(f"{Fore.CYAN}▶ {formatted_cmd}{Style.RESET_ALL}")
+        logger.debug(f"> {formatted_cmd}")
+        
+        return await _arun_command(command, stream_output=self.stream_output, detach=self.detach)
 
 # Initialize the built-in Python REPL tool
 python_repl_tool = PythonREPLTool(
@@ -227,6 +277,10 @@ python_repl_tool = PythonREPLTool(
 )
 interactive_windows_shell_tool = ConsoleTool_HITL()
 direct_windows_shell_tool = ConsoleTool_Direct()
+# Runs the user's own commands (ai -x), which may prompt on the terminal
+user_shell_tool = ConsoleTool_Direct(detach=False)
+# Runs the agent's shell commands in direct mode, where several may run at once
+parallel_shell_tool = ConsoleTool_Direct(stream_output=False)
 
 tools = [
     interactive_windows_shell_tool,
@@ -3,6 +3,38 @@ import time
 import threading
 from colorama import Fore, Style
 
+# Replaces the terminal prompt while a command runs inside the daemon, so the
+# question is asked by the client that sent the command.
+_prompt_handler = None
+
+def set_prompt_handler(handler) -> None:
+    """Routes ask() through handler(message, default) instead of the terminal; None restores it."""
+    global _prompt_handler
+    _prompt_handler = handler
+
+def ask(message: str, default: str = "") -> str:
+    """
+    Asks the user for a line of input. With a default, the user gets an
+    editable prefilled line (prompt_toolkit); otherwise a plain input().
+    """
+    if _prompt_handler is not None:
+        return _prompt_handler(message, default)
+    if default:
+        from prompt_toolkit import prompt
+        return prompt(message, default=default)
+    return input(message)
+
+async def ask_async(message: str, default: str = "") -> str:
+    """
+    Asynchronous version of ask() for the async agent loop. It doesn't block
+    the event loop, so Ctrl-C cancels the question right away.
+    """
+    if _prompt_handler is not None:
+        import asyncio
+        return await asyncio.to_thread(_prompt_handler, message, default)
+    from prompt_toolkit import PromptSession
+    return await PromptSession().prompt_async(message, default=default)
+
 class Spinner:
     def __init__(self, message="Thinking", delay=0.1):
         self.spinner = ['⣾', '⣽', '⣻', '⢿', '⡿', '⣟', '⣯', '⣷']
@@ -0,0 +1,205 @@
+"""
+End-to-end benchmark of the agent loop, run offline against the fake provider.
+
+Measures the overhead ai-shell-agent adds around the model on every turn, for
+chats of several sizes: reading a chat cold (``_read_messages``), appending a
+turn (``_write_messages``), dispatching a tool call (``_handle_tool_calls``),
+a full ``send_message`` turn (model call, one command, final answer), and the
+startup of the ``ai`` command. The model answers instantly from a script (see
+fake_llm.py), so the times are the agent's own.
+
+Usage:
+    python benchmarks/agent_loop.py [--sizes 10,100,1000,10000] [--repeat 5]
+                                    [--json results.json] [--compare baseline.json]
+
+With --compare, exits with 1 when a measurement got slower than the baseline by
+more than REGRESSION_RATIO (and REGRESSION_MIN_MS).
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import contextlib
+import statistics
+import subprocess
+
+DEFAULT_SIZES = (10, 100, 1000, 10000)
+DEFAULT_REPEAT = 5
+REGRESSION_RATIO = 1.5
+REGRESSION_MIN_MS = 5.0
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+# One command, then the answer: the shape of a typical turn.
+SCRIPT = [
+    {"content": "", "tool_calls": [{"name": "interactive_windows_shell_tool", "args": {"command": "echo benchmark"}}]},
+    {"content": "The command printed benchmark."},
+]
+
+
+def _environment(data_dir: str) -> dict:
+    """The environment of the benchmark and its subprocesses: fake provider, data in data_dir."""
+    responses_file = os.path.join(data_dir, "responses.json")
+    with open(responses_file, "w") as f:
+        json.dump(SCRIPT, f)
+    env = dict(os.environ)
+    env["PYTHONPATH"] = REPO_ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    env.update({
+        "PROVIDER": "fake",
+        "AI_SHELL_DATA_DIR": data_dir,
+        "AI_SHELL_FAKE_RESPONSES": responses_file,
+        "AI_SHELL_FAKE_LATENCY": "0",
+    })
+    return env
+
+def synthetic_history(size: int) -> list:
+    """A chat of about size messages: a system prompt and turns with one command each."""
+    from langchain_core.messages import SystemMessage, HumanMessage, AIMessage, ToolMessage
+    messages = [SystemMessage(content="You are a helpful shell assistant.")]
+    turn = 0
+    while len(messages) < size:
+        call_id = f"call_{turn}"
+        messages.append(HumanMessage(content=f"Question {turn}: how much disk does /var/log/app{turn} use?"))
+        messages.append(AIMessage(content="", tool_calls=[{"name": "interactive_windows_shell_tool", "args": {"command": f"du -sh /var/log/app{turn}"}, "id": call_id}]))
+        messages.append(ToolMessage(content=f"{turn * 7 % 900}M\t/var/log/app{turn}\n", tool_call_id=call_id))
+        messages.append(AIMessage(content=f"/var/log/app{turn} uses {turn * 7 % 900} MB."))
+        turn += 1
+    return messages[:size]
+
+def _median_ms(function, repeat: int) -> float:
+    """Runs function repeat times and returns the median time in ms."""
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        times.append((time.perf_counter() - started) * 1000)
+    return statistics.median(times)
+
+def measure_chat(size: int, repeat: int) -> dict:
+    """
+    Measures the per-turn overhead for a chat of size messages.
+
+    Returns:
+      dict: Median times in ms, by measurement.
+    """
+    from langchain_core.messages import HumanMessage, AIMessage
+    from ai_shell_agent import chat_manager
+
+    history = synthetic_history(size)
+    chat_file = chat_manager.create_or_load_chat(f"Benchmark {size}")
+    chat_manager._write_messages(chat_file, history)
+
+    def read_cold():
+        chat_manager._forget_messages(chat_file)
+        chat_manager._read_messages(chat_file)
+
+    messages = chat_manager._read_messages(chat_file)
+    def write_append():
+        messages.append(HumanMessage(content="one more question"))
+        messages.append(AIMessage(content="one more answer"))
+        chat_manager._write_messages(chat_file, messages)
+
+    tool_call = AIMessage(content="", tool_calls=[{"name": "interactive_windows_shell_tool", "args": {"command": "echo benchmark"}, "id": "call_dispatch"}])
+    def tool_dispatch():
+        chat_manager._run_sync(chat_manager._handle_tool_calls(tool_call, []))
+
+    results = {
+        "read_messages": _median_ms(read_cold, repeat),
+        "write_messages": _median_ms(write_append, repeat),
+        "tool_dispatch": _median_ms(tool_dispatch, repeat),
+        "send_message": _median_ms(lambda: chat_manager.send_message("check the logs again"), repeat),
+    }
+    # Keep the chats of the next sizes from growing this one further.
+    chat_manager.delete_chat(f"Benchmark {size}")
+    return results
+
+def measure_startup(env: dict, repeat: int) -> dict:
+    """Measures the ``ai`` command: a bookkeeping command and a one-shot message."""
+    def run(*args):
+        subprocess.run([sys.executable, "-m", "ai_shell_agent.ai", *args], env=env, cwd=env["AI_SHELL_DATA_DIR"], capture_output=True, check=True)
+    return {
+        "startup_current_chat": _median_ms(lambda: run("-ct"), repeat),
+        "startup_message": _median_ms(lambda: run("-tc", "hello"), repeat),
+    }
+
+def run_benchmark(sizes: list[int], repeat: int) -> dict:
+    """
+    Runs every measurement in a temporary data directory.
+
+    Returns:
+      dict: "startup" (times in ms) and "chats", mapping each size to its times in ms.
+    """
+    from ai_shell_agent import logger, chat_manager, llms
+    with tempfile.TemporaryDirectory() as data_dir:
+        env = _environment(data_dir)
+        saved = {name: os.environ.get(name) for name in env}
+        os.environ.update(env)
+        level = logger.level
+        logger.setLevel("WARNING")
+        try:
+            chat_manager.set_data_dir(data_dir)
+            chat_manager.set_direct_tools(True)
+            llms.invalidate_llm_cache()
+            results = {"startup": measure_startup(env, repeat), "chats": {}}
+            # Commands and spinners print to the terminal; keep the report readable.
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+                for size in sizes:
+                    results["chats"][str(size)] = measure_chat(size, repeat)
+        finally:
+            logger.setLevel(level)
+            llms.invalidate_llm_cache()
+            for name, value in saved.items():
+                if value is None:
+                    os.environ.pop(name, None)
+                else:
+                    os.environ[name] = value
+    return results
+
+def _flatten(results: dict) -> dict:
+    flat = {name: ms for name, ms in results["startup"].items()}
+    for size, times in results["chats"].items():
+        flat.update({f"{name}[{size}]": ms for name, ms in times.items()})
+    return flat
+
+def regressions(results: dict, baseline: dict) -> list[str]:
+    """Returns the measurements that got slower than in baseline, as printable lines."""
+    current = _flatten(results)
+    slower = []
+    for name, before in _flatten(baseline).items():
+        after = current.get(name)
+        if after is not None and after > before * REGRESSION_RATIO and after - before > REGRESSION_MIN_MS:
+            slower.append(f"{name}: {before:.1f} ms -> {after:.1f} ms")
+    return slower
+
+def main(argv: list[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the agent loop against the offline fake provider.")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="Comma-separated chat sizes in messages")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT, help="Runs per measurement (the median is reported)")
+    parser.add_argument("--json", help="Write the results to this file")
+    parser.add_argument("--compare", help="Compare with the results in this file; exit with 1 on a regression")
+    args = parser.parse_args(argv)
+
+    results = run_benchmark([int(size) for size in args.sizes.split(",")], args.repeat)
+    names = list(next(iter(results["chats"].values())))
+    print(f"{'messages':>10}" + "".join(f"{name + ' [ms]':>20}" for name in names))
+    for size, times in results["chats"].items():
+        print(f"{size:>10}" + "".join(f"{times[name]:>20.1f}" for name in names))
+    for name, ms in results["startup"].items():
+        print(f"{name}: {ms:.1f} ms")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare, "r") as f:
+            slower = regressions(results, json.load(f))
+        if slower:
+            print("\nSlower than the baseline:\n  " + "\n  ".join(slower))
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
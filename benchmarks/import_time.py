@@ -0,0 +1,97 @@
+"""
+Import-time benchmark for the ``ai`` CLI.
+
+Imports the CLI module in a fresh interpreter with ``python -X importtime`` and
+reports the slowest imports. Bookkeeping commands (``ai -lsc``, ``ai -ct``,
+``ai -rnc`` ...) only pay for this import, so it has to stay within
+IMPORT_BUDGET_MS and must not pull in LangChain or the model providers.
+
+The budget applies to an import with compiled bytecode, as every ``ai`` call
+after the first one has it. The first import after installing or editing the
+package also compiles the modules it loads and takes several times as long;
+it has no budget. The benchmark compiles with an unmeasured first import,
+into a temporary PYTHONPYCACHEPREFIX rather than the source tree.
+
+Usage:
+    python benchmarks/import_time.py [module]
+"""
+import os
+import sys
+import subprocess
+import tempfile
+
+IMPORT_BUDGET_MS = 100
+HEAVY_MODULES = (
+    "langchain",
+    "langchain_core",
+    "langchain_openai",
+    "langchain_google_genai",
+    "langchain_experimental",
+    "openai",
+    "google.generativeai",
+    "google.ai",
+    "pydantic",
+    "prompt_toolkit",
+)
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _import_report(module: str, cwd: str, env: dict) -> dict:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=cwd,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = (int(self_us) / 1000, int(cumulative_us) / 1000)
+    return {"total_ms": modules[module][1], "modules": modules}
+
+def measure_import_time(module: str = "ai_shell_agent.ai") -> dict:
+    """
+    Imports a module in a fresh interpreter and parses the -X importtime report.
+    A first, unmeasured import compiles the bytecode into a temporary cache
+    directory; the measured one runs with it.
+
+    Returns:
+      dict: "total_ms" (cumulative import time of the module) and "modules",
+        mapping every imported module to its (self, cumulative) time in ms.
+    """
+    env = dict(os.environ)
+    env["PYTHONPATH"] = REPO_ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    env.setdefault("PROVIDER", "openai")
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    # Run from an empty directory so no local chats or .env files are picked up.
+    with tempfile.TemporaryDirectory() as cwd, tempfile.TemporaryDirectory() as cache:
+        env["PYTHONPYCACHEPREFIX"] = cache
+        _import_report(module, cwd, env)
+        return _import_report(module, cwd, env)
+
+def heavy_imports(report: dict) -> list[str]:
+    """Returns the heavy modules that were imported."""
+    return sorted(
+        name for name in report["modules"]
+        if any(name == heavy or name.startswith(heavy + ".") for heavy in HEAVY_MODULES)
+    )
+
+def main() -> int:
+    module = sys.argv[1] if len(sys.argv) > 1 else "ai_shell_agent.ai"
+    report = measure_import_time(module)
+    slowest = sorted(report["modules"].items(), key=lambda item: item[1][0], reverse=True)[:15]
+    print(f"{'self [ms]':>10} {'cumulative [ms]':>16}  module")
+    for name, (self_ms, cumulative_ms) in slowest:
+        print(f"{self_ms:>10.1f} {cumulative_ms:>16.1f}  {name}")
+    print(f"\nimport {module}: {report['total_ms']:.1f} ms (budget {IMPORT_BUDGET_MS} ms)")
+    heavy = heavy_imports(report)
+    if heavy:
+        print(f"Heavy modules imported: {', '.join(heavy)}")
+    return 0 if report["total_ms"] <= IMPORT_BUDGET_MS and not heavy else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
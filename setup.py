@@ -28,6 +28,10 @@ setup(
         'langchain-google-genai==2.0.11',
         'colorama==0.4.6',	
     ],
+    extras_require={
+        'zstd': ['zstandard'],
+        'retrieval': ['numpy'],
+    },
     cmdclass={
         'install': CustomInstallCommand,
     },
@@ -0,0 +1,75 @@
+import os
+import pytest
+
+from langchain_core.messages import HumanMessage, AIMessage, SystemMessage, ToolMessage
+
+import ai_shell_agent.chat_manager as chat_manager
+from ai_shell_agent import blobs
+
+
+@pytest.fixture(scope="function")
+def chat_env(tmp_path):
+    """chat_manager pointed at the default JSON backend in tmp_path."""
+    chat_manager.CHAT_DIR = str(tmp_path)
+    chat_manager.CHAT_MAP_FILE = str(tmp_path / "chat_map.json")
+    chat_manager.SESSION_FILE = str(tmp_path / "session.json")
+    chat_manager.CONFIG_FILE = str(tmp_path / "config.json")
+    return tmp_path
+
+def _blob_count(blob_dir):
+    return sum(len(files) for _, _, files in os.walk(blob_dir))
+
+def _age_blobs(blob_dir, seconds):
+    for root, _, files in os.walk(blob_dir):
+        for name in files:
+            path = os.path.join(root, name)
+            mtime = os.path.getmtime(path) - seconds
+            os.utime(path, (mtime, mtime))
+
+def test_put_is_deduplicated_and_compressed(tmp_path):
+    store = blobs.BlobStore(str(tmp_path))
+    output = "total 0\n" + "-rw-r--r-- 1 user user 0 file\n" * 200
+    digest = store.put(output)
+    assert store.put(output) == digest
+    assert _blob_count(tmp_path) == 1
+    assert os.path.getsize(store.path(digest)) < len(output) / 10
+    assert blobs.BlobStore(str(tmp_path)).get(digest) == output
+
+def test_large_outputs_are_stored_once_across_chats(chat_env):
+    output = "PID TTY TIME CMD\n" * 500
+    for title in ("First", "Second"):
+        chat_file = chat_manager.create_or_load_chat(title)
+        messages = chat_manager._read_messages(chat_file)
+        messages += [
+            HumanMessage(content="list processes"),
+            AIMessage(content="", tool_calls=[{"name": "run", "args": {}, "id": "call_1"}]),
+            ToolMessage(content=output, tool_call_id="call_1"),
+        ]
+        chat_manager._write_messages(chat_file, messages)
+        records = chat_manager._store().read_records(chat_file)
+        assert records[-1]["content"] == "" and "output" in records[-1]
+        assert os.path.getsize(chat_file) < len(output)
+
+    blob_dir = chat_env / blobs.BLOB_DIR_NAME
+    assert _blob_count(blob_dir) == 1
+    chat_manager._forget_messages(chat_file)
+    assert chat_manager._read_messages(chat_file)[-1].content == output
+
+    chat_manager.delete_chat("First")
+    chat_manager.flush_temp_chats()
+    assert _blob_count(blob_dir) == 1
+    chat_manager.delete_chat("Second")
+    # Unreferenced outputs are only collected by flush_temp_chats...
+    assert _blob_count(blob_dir) == 1
+    # ...and not while they are recent: another process may be about to write a message using them.
+    chat_manager.flush_temp_chats()
+    assert _blob_count(blob_dir) == 1
+    _age_blobs(blob_dir, blobs.GC_GRACE_SECONDS + 60)
+    chat_manager.flush_temp_chats()
+    assert _blob_count(blob_dir) == 0
+
+def test_small_contents_stay_inline(chat_env):
+    chat_file = chat_manager.create_or_load_chat("Small")
+    messages = chat_manager._read_messages(chat_file) + [HumanMessage(content="CMD> pwd\n/home")]
+    chat_manager._write_messages(chat_file, messages)
+    assert chat_manager._store().read_records(chat_file)[-1]["content"] == "CMD> pwd\n/home"
@@ -1,5 +1,6 @@
 import os
 import json
+import asyncio
 import tempfile
 import shutil
 import pytest
@@ -75,7 +76,7 @@ def test_send_message_and_conversation_flow(temp_chat_env):
     assert response.startswith("AI:")
     
     # Read chat history from file and check that both user and AI messages are present.
-    history = json.load(open(chat_file, "r"))
+    history = chat_manager.journal.read_records(chat_file)
     assert history[0]["role"] == "user"
     assert history[0]["content"] == "Hello, how are you?"
     assert history[1]["role"] == "ai"
@@ -90,7 +91,7 @@ def test_edit_message(temp_chat_env):
     # Edit the AI response at index 1
     success = chat_manager.edit_message(1, "Edited AI response")
     assert success is True
-    history = json.load(open(chat_file, "r"))
+    history = chat_manager.journal.read_records(chat_file)
     assert history[1]["content"] == "Edited AI response"
     # Ensure only messages up to index 1 remain.
     assert len(history) == 2
@@ -113,6 +114,95 @@ def test_set_and_update_system_prompt(temp_chat_env):
     chat_manager.send_message("User message")
     new_system_prompt = "Updated system prompt."
     chat_manager.update_system_prompt(new_system_prompt)
-    history = json.load(open(chat_file, "r"))
+    history = chat_manager.journal.read_records(chat_file)
     assert history[0]["role"] == "system"
     assert history[0]["content"] == new_system_prompt
+
+class FakeStreamingLLM:
+    """Streams a response in chunks, splitting a tool call across two of them."""
+    async def astream(self, messages):
+        from langchain_core.messages import AIMessageChunk
+        yield AIMessageChunk(content="Let me ")
+        yield AIMessageChunk(content="check.", tool_call_chunks=[{"name": "run_python_code", "args": '{"query": ', "id": "call_1", "index": 0}])
+        yield AIMessageChunk(content="", tool_call_chunks=[{"name": None, "args": '"print(1)"}', "id": None, "index": 0}])
+
+def test_stream_response_assembles_message(capsys):
+    response = asyncio.run(chat_manager._stream_response(FakeStreamingLLM(), []))
+    assert response.content == "Let me check."
+    assert response.tool_calls == [{"name": "run_python_code", "args": {"query": "print(1)"}, "id": "call_1", "type": "tool_call"}]
+    assert "Let me check." in capsys.readouterr().out
+
+class FakeToolCallingLLM:
+    """Always asks for two tool calls."""
+    async def ainvoke(self, messages):
+        from langchain_core.messages import AIMessage
+        return AIMessage(content="", tool_calls=[
+            {"name": "run_python_code", "args": {"query": "1"}, "id": "call_1"},
+            {"name": "run_python_code", "args": {"query": "2"}, "id": "call_2"},
+        ])
+
+class InterruptingTool:
+    async def ainvoke(self, tool_call):
+        raise KeyboardInterrupt
+
+def test_interrupted_tool_calls_are_answered_and_saved(temp_chat_env, monkeypatch):
+    from ai_shell_agent import llms, tools
+    monkeypatch.setattr(llms, "get_bound_llm", lambda tools_functions: FakeToolCallingLLM())
+    monkeypatch.setattr(tools, "tools", [InterruptingTool(), InterruptingTool()])
+    chat_file = chat_manager.create_or_load_chat("Interrupted Chat")
+    with pytest.raises(KeyboardInterrupt):
+        chat_manager.send_message("run it")
+    records = chat_manager._store().read_records(chat_file)
+    assert [r["type"] for r in records] == ["system", "human", "ai", "tool", "tool"]
+    assert [r["tool_call_id"] for r in records[3:]] == ["call_1", "call_2"]
+    assert all(r["status"] == "error" for r in records[3:])
+
+def test_direct_mode_runs_shell_calls_in_parallel_in_order(temp_chat_env):
+    import time
+    from langchain_core.messages import AIMessage
+    chat_manager.set_direct_tools(True)
+    ai_message = AIMessage(content="", tool_calls=[
+        {"name": "interactive_windows_shell_tool", "args": {"command": f"sleep {delay}; echo {i}"}, "id": f"call_{i}"}
+        for i, delay in enumerate([0.6, 0.3, 0.1])
+    ])
+    messages = []
+    started = time.monotonic()
+    asyncio.run(chat_manager._handle_tool_calls(ai_message, messages))
+    assert time.monotonic() - started < 1.0
+    assert [msg.tool_call_id for msg in messages] == ["call_0", "call_1", "call_2"]
+    assert [msg.content.strip() for msg in messages] == ["0", "1", "2"]
+    # Answered under the name of the function the model called.
+    assert {msg.name for msg in messages} == {"interactive_windows_shell_tool"}
+
+def test_single_direct_command_streams_its_output(temp_chat_env, capsys):
+    from langchain_core.messages import AIMessage
+    chat_manager.set_direct_tools(True)
+    ai_message = AIMessage(content="", tool_calls=[
+        {"name": "interactive_windows_shell_tool", "args": {"command": "echo live"}, "id": "call_1"},
+    ])
+    messages = []
+    asyncio.run(chat_manager._handle_tool_calls(ai_message, messages))
+    assert messages[0].name == "interactive_windows_shell_tool"
+    out = capsys.readouterr().out
+    # Streamed as it ran, not repeated in one piece after the command ("▶ echo live").
+    assert "live\n" in out and "▶ echo live" not in out
+
+def test_send_message_async_runs_tools_and_saves_the_turn(temp_chat_env, monkeypatch):
+    from langchain_core.messages import AIMessage
+    from ai_shell_agent import llms
+
+    class FakeLLM:
+        """Asks for one command, then answers with its output."""
+        async def ainvoke(self, messages):
+            if messages[-1]["role"] == "tool":
+                return AIMessage(content=f"It printed {messages[-1]['content'].strip()}")
+            return AIMessage(content="", tool_calls=[
+                {"name": "interactive_windows_shell_tool", "args": {"command": "echo async"}, "id": "call_1"},
+            ])
+
+    monkeypatch.setattr(llms, "get_bound_llm", lambda tools_functions: FakeLLM())
+    chat_manager.set_direct_tools(True)
+    chat_file = chat_manager.create_or_load_chat("Async Chat")
+    assert asyncio.run(chat_manager.send_message_async("what does it print?")) == "It printed async"
+    records = chat_manager._store().read_records(chat_file)
+    assert [r["type"] for r in records] == ["system", "human", "ai", "tool", "ai"]
@@ -0,0 +1,82 @@
+from langchain_core.messages import HumanMessage, AIMessage, SystemMessage, ToolMessage
+
+from ai_shell_agent import context
+
+
+def _history(turns, size=400):
+    messages = [SystemMessage(content="system", id="sys")]
+    for i in range(turns):
+        messages.append(HumanMessage(content=f"question {i} " + "x" * size, id=f"h{i}"))
+        messages.append(AIMessage(content="", id=f"c{i}", tool_calls=[{"name": "run", "args": {}, "id": f"call{i}"}]))
+        messages.append(ToolMessage(content="y" * size, tool_call_id=f"call{i}", id=f"t{i}"))
+        messages.append(AIMessage(content=f"answer {i}", id=f"a{i}"))
+    return messages
+
+class FakeSummarizer:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, previous, messages):
+        self.calls.append([msg.id for msg in messages])
+        return f"{previous}+{len(messages)}"
+
+def test_window_starts_at_a_turn_and_keeps_latest_turn():
+    messages = _history(5)
+    start = context.window_start(messages, budget=450)
+    assert isinstance(messages[start], HumanMessage)
+    assert start == len(messages) - 4
+    assert context.window_start(messages, budget=10**6) == 1
+
+def test_under_budget_history_is_sent_unchanged():
+    messages = _history(2)
+    summarize = FakeSummarizer()
+    sent, state = context.build_context(messages, 10**6, {}, summarize)
+    assert sent == messages
+    assert state is None
+    assert summarize.calls == []
+
+def test_rolled_off_turns_are_summarized_once():
+    messages = _history(5)
+    summarize = FakeSummarizer()
+    sent, state = context.build_context(messages, 450, {}, summarize)
+    assert len(summarize.calls) == 1
+    assert summarize.calls[0][0] == "h0"
+    assert sent[0].content.startswith("system")
+    assert "+16" in sent[0].content
+    assert sent[1:] == messages[-4:]
+
+    # Same history with the stored summary: nothing is recomputed.
+    meta = {"context_summary": state}
+    sent_again, new_state = context.build_context(messages, 450, meta, summarize)
+    assert new_state is None
+    assert len(summarize.calls) == 1
+    assert sent_again[0].content == sent[0].content
+
+    # A new turn only folds the newly rolled-off messages into the summary.
+    messages += _history(6)[-4:]
+    _, state = context.build_context(messages, 450, meta, summarize)
+    assert summarize.calls[1] == ["h4", "c4", "t4", "a4"]
+    assert state["summary"] == "+16+4"
+
+def test_summary_is_dropped_when_history_was_truncated():
+    messages = _history(5)
+    summarize = FakeSummarizer()
+    _, state = context.build_context(messages, 450, {}, summarize)
+    edited = messages[:5] + [HumanMessage(content="edited", id="e")]
+    sent, _ = context.build_context(edited, 10**6, {"context_summary": state}, summarize)
+    assert sent == edited
+
+def test_window_slides_in_steps_and_keeps_the_prompt_prefix():
+    summarize = FakeSummarizer()
+    meta = {}
+    previous = None
+    for turns in range(1, 13):
+        sent, state = context.build_context(_history(turns), 800, meta, summarize)
+        if state is not None:
+            meta = {"context_summary": state}
+        elif previous is not None:
+            # Until the window slides, every prompt extends the previous one.
+            assert sent[:len(previous)] == previous
+        previous = sent
+    # Each slide drops several turns at once instead of one per new turn.
+    assert 1 < len(summarize.calls) <= 5
@@ -0,0 +1,65 @@
+import os
+import sys
+import time
+import subprocess
+import pytest
+
+from ai_shell_agent import daemon
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+pytestmark = pytest.mark.skipif(not daemon.is_supported(), reason="needs Unix domain sockets")
+
+
+@pytest.fixture(scope="function")
+def running_daemon(tmp_path, monkeypatch):
+    """Runs a daemon on a temporary socket, with the test working in tmp_path."""
+    monkeypatch.setenv(daemon.SOCKET_ENV, str(tmp_path / "ai.sock"))
+    monkeypatch.setenv("PROVIDER", "openai")
+    monkeypatch.setenv("PYTHONPATH", REPO_ROOT)
+    monkeypatch.setenv("AI_SHELL_DATA_DIR", str(tmp_path / "data"))
+    monkeypatch.chdir(tmp_path)
+    process = subprocess.Popen([sys.executable, "-m", "ai_shell_agent.daemon"], cwd=str(tmp_path))
+    deadline = time.monotonic() + 30
+    while daemon.status() is None:
+        assert time.monotonic() < deadline, "daemon did not start"
+        time.sleep(0.1)
+    yield process
+    daemon.stop()
+    process.wait(timeout=10)
+
+def test_forward_without_daemon_runs_in_process(tmp_path, monkeypatch):
+    monkeypatch.setenv(daemon.SOCKET_ENV, str(tmp_path / "missing.sock"))
+    assert daemon.forward(["-lsc"]) is None
+
+def test_forward_runs_commands_in_daemon(running_daemon, tmp_path, capsys):
+    assert daemon.status() == running_daemon.pid
+    assert daemon.forward(["-c", "Daemon Chat"]) == 0
+    # The command used the client's data directory.
+    assert os.path.exists(tmp_path / "data" / "chats" / "chat_map.json")
+    assert daemon.forward(["-lsc"]) == 0
+    assert "Daemon Chat" in capsys.readouterr().err
+
+def test_forward_reports_argument_errors(running_daemon):
+    assert daemon.forward(["--no-such-flag"]) == 2
+
+def test_busy_daemon_lets_other_terminals_run_in_process(running_daemon):
+    import socket
+    # One terminal's command waits at a prompt...
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.connect(os.environ[daemon.SOCKET_ENV])
+    stream = client.makefile("rwb")
+    daemon._send(stream, {"type": "run", "argv": ["-k"], "cwd": os.getcwd(), "env": dict(os.environ)})
+    assert daemon._receive(stream)["type"] == "ask"
+    # ...while others still get answers, running their commands themselves.
+    started = time.monotonic()
+    assert daemon.status() == running_daemon.pid
+    assert daemon.forward(["-lsc"]) is None
+    assert time.monotonic() - started < 5
+    # Once the prompt is given up, the daemon takes commands again.
+    daemon._send(stream, {"type": "answer", "data": None})
+    while daemon._receive(stream)["type"] != "exit":
+        pass
+    stream.close()
+    client.close()
+    assert daemon.forward(["-lsc"]) == 0
@@ -0,0 +1,102 @@
+import os
+import sys
+import time
+
+import pytest
+
+from ai_shell_agent.executor import OutputBuffer, run_command, arun_command
+
+
+def _python(code):
+    return f'"{sys.executable}" -c "{code}"'
+
+def test_output_buffer_keeps_head_and_tail():
+    buffer = OutputBuffer(max_bytes=10)
+    for i in range(100):
+        buffer.write(f"{i:03d}".encode())
+    text = buffer.getvalue()
+    assert buffer.truncated
+    assert text.startswith("00000")
+    assert text.endswith("98099")
+    assert "[... 290 bytes omitted ...]" in text
+
+def test_output_buffer_below_cap_is_unchanged():
+    buffer = OutputBuffer(max_bytes=100)
+    buffer.write(b"hello ")
+    buffer.write(b"world")
+    assert not buffer.truncated
+    assert buffer.getvalue() == "hello world"
+
+def test_run_command_streams_and_caps_output():
+    chunks = []
+    result = run_command(_python("print('x' * 100000)"), on_output=chunks.append, max_bytes=1000)
+    assert result.returncode == 0
+    assert result.truncated
+    assert len(result.stdout) < 1100
+    assert "".join(chunks).strip() == "x" * 100000
+
+def test_run_command_reports_failures():
+    result = run_command(_python("import sys; sys.stderr.write('boom'); sys.exit(3)"))
+    assert result.returncode == 3
+    assert result.stderr == "boom"
+    assert result.stdout == ""
+
+def test_run_command_kills_the_process_group_on_timeout():
+    # The background sleep keeps stdout open, so only a group kill ends the command.
+    result = run_command("echo started; sleep 30 & sleep 30", timeout=0.5, detach=True)
+    assert result.timed_out
+    assert "longer than 0.5 seconds" in result.timeout_reason
+    assert result.stdout.strip() == "started"
+
+def test_run_command_idle_timeout():
+    result = run_command(_python("import time; print('tick', flush=True); time.sleep(30)"), timeout=0, idle=0.5)
+    assert result.timed_out
+    assert "no output" in result.timeout_reason
+    assert result.stdout.strip() == "tick"
+
+def test_commands_reading_input_get_eof_right_away():
+    started = time.monotonic()
+    result = run_command(_python("import sys; print(repr(sys.stdin.read()))"), timeout=10, detach=True)
+    assert result.stdout.strip() == "''"
+    assert not result.timed_out and time.monotonic() - started < 5
+
+@pytest.mark.skipif(os.name != "posix", reason="POSIX sessions")
+def test_commands_prompting_on_the_terminal_fail_fast():
+    # Like sudo or ssh asking for a password: there is no terminal to open.
+    started = time.monotonic()
+    result = run_command("exec 3</dev/tty && echo opened", timeout=10, detach=True)
+    assert result.returncode != 0 and "opened" not in result.stdout
+    assert not result.timed_out and time.monotonic() - started < 5
+
+@pytest.mark.skipif(os.name != "posix", reason="POSIX sessions")
+def test_only_detached_commands_leave_the_terminal():
+    # The user's own and confirmed commands keep the terminal for password prompts.
+    session = _python("import os; print(os.getsid(0))")
+    assert run_command(session).stdout.strip() == str(os.getsid(0))
+    assert run_command(session, detach=True).stdout.strip() != str(os.getsid(0))
+
+def test_attached_commands_are_killed_on_timeout():
+    started = time.monotonic()
+    result = run_command(_python("import time; print('tick', flush=True); time.sleep(30)"), timeout=0.5)
+    assert result.timed_out and result.stdout.strip() == "tick"
+    assert time.monotonic() - started < 10
+
+def test_attached_async_commands_are_killed_on_timeout():
+    import asyncio
+    started = time.monotonic()
+    # The shell's sleep isn't killed and keeps the pipes open.
+    result = asyncio.run(arun_command("echo started; sleep 30", timeout=0.5))
+    assert result.timed_out and result.stdout.strip() == "started"
+    assert time.monotonic() - started < 10
+
+def test_limits_come_from_config_json(tmp_path, monkeypatch):
+    from ai_shell_agent import chat_manager, paths
+    monkeypatch.setattr(paths, "_data_dir", str(tmp_path))
+    monkeypatch.setattr(chat_manager, "CONFIG_FILE", paths.config_file())
+    assert chat_manager.set_setting("command_timeout", "0.5")
+    assert chat_manager.set_setting("max_output_bytes", "1000")
+    assert not chat_manager.set_setting("command_timeout", "soon")
+    assert not chat_manager.set_setting("no_such_setting", "1")
+    result = run_command(_python("print('x' * 100000, flush=True); import time; time.sleep(30)"))
+    assert result.timed_out and "longer than 0.5 seconds" in result.timeout_reason
+    assert result.truncated and len(result.stdout) < 1100
@@ -0,0 +1,67 @@
+import json
+import time
+
+import pytest
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+import ai_shell_agent.chat_manager as chat_manager
+from ai_shell_agent import llms, fake_llm
+
+
+@pytest.fixture(scope="function")
+def offline(tmp_path, monkeypatch):
+    """Points chat_manager at tmp_path and the model at the offline providers."""
+    chat_manager.CHAT_DIR = str(tmp_path)
+    chat_manager.CHAT_MAP_FILE = str(tmp_path / "chat_map.json")
+    chat_manager.SESSION_FILE = str(tmp_path / "session.json")
+    chat_manager.CONFIG_FILE = str(tmp_path / "config.json")
+    monkeypatch.setenv("PROVIDER", "fake")
+    llms.invalidate_llm_cache()
+    yield tmp_path
+    llms.invalidate_llm_cache()
+
+def test_fake_provider_runs_scripted_tool_calls(offline, monkeypatch):
+    script = offline / "script.json"
+    script.write_text(json.dumps([
+        {"content": "", "tool_calls": [{"name": "interactive_windows_shell_tool", "args": {"command": "echo scripted"}}]},
+        {"content": "It printed scripted."},
+    ]))
+    monkeypatch.setenv(fake_llm.RESPONSES_ENV, str(script))
+    chat_manager.set_direct_tools(True)
+    chat_file = chat_manager.create_or_load_chat("Fake Chat")
+    assert chat_manager.send_message("what does it print?") == "It printed scripted."
+    records = chat_manager._store().read_records(chat_file)
+    assert [r["type"] for r in records] == ["system", "human", "ai", "tool", "ai"]
+    assert records[3]["content"].strip() == "scripted"
+
+def test_fake_provider_echoes_without_a_script(offline):
+    chat_manager.create_or_load_chat("Echo Chat")
+    assert chat_manager.send_message("hello") == "Echo: hello"
+
+def test_recorded_responses_are_replayed(offline, monkeypatch):
+    recording = offline / "recording.jsonl"
+    monkeypatch.setenv(fake_llm.RECORDING_ENV, str(recording))
+    monkeypatch.setenv(fake_llm.RECORD_ENV, "1")
+    monkeypatch.setenv("PROVIDER", "openai")
+    chat_manager._record_response(AIMessage(content="recorded answer"))
+    monkeypatch.setenv("PROVIDER", "replay")
+    chat_manager.create_or_load_chat("Replay Chat")
+    assert chat_manager.send_message("again") == "recorded answer"
+    # Replaying doesn't record.
+    assert len(recording.read_text().splitlines()) == 1
+
+def test_fake_latency():
+    model = fake_llm.FakeChatModel(responses=[{"content": "slow"}], latency=0.2)
+    started = time.monotonic()
+    response = model.invoke([HumanMessage(content="hi")])
+    assert time.monotonic() - started >= 0.2
+    assert response.content == "slow" and response.usage_metadata["input_tokens"] == 0
+
+def test_agent_loop_benchmark_runs_offline(monkeypatch):
+    from benchmarks.agent_loop import run_benchmark, regressions
+    monkeypatch.setenv("PROVIDER", "openai")
+    results = run_benchmark([10], repeat=1)
+    assert set(results["chats"]["10"]) == {"read_messages", "write_messages", "tool_dispatch", "send_message"}
+    assert all(ms > 0 for ms in results["startup"].values())
+    assert regressions(results, results) == []
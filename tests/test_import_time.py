@@ -0,0 +1,15 @@
+from benchmarks.import_time import IMPORT_BUDGET_MS, measure_import_time, heavy_imports
+
+
+def test_cli_import_does_not_load_langchain():
+    report = measure_import_time("ai_shell_agent.ai")
+    assert heavy_imports(report) == []
+
+def test_cli_import_within_budget():
+    # Best of three runs, to keep the test stable on busy machines.
+    best = min(measure_import_time("ai_shell_agent.ai")["total_ms"] for _ in range(3))
+    assert best <= IMPORT_BUDGET_MS
+
+def test_cli_import_leaves_storage_backends_and_daemon_client_lazy():
+    modules = measure_import_time("ai_shell_agent.ai")["modules"]
+    assert not {"sqlite3", "socket", "ai_shell_agent.search", "ai_shell_agent.retrieval"} & set(modules)
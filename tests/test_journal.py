@@ -0,0 +1,152 @@
+import json
+import pytest
+
+from langchain_core.messages import HumanMessage, AIMessage, SystemMessage, ToolMessage
+
+import ai_shell_agent.chat_manager as chat_manager
+from ai_shell_agent import journal
+from ai_shell_agent.message_views import MessageView, materialize
+
+
+@pytest.fixture(scope="function")
+def chat_file(tmp_path):
+    """A chat file path, with chat_manager pointed at the default JSON backend in tmp_path."""
+    chat_manager.CHAT_DIR = str(tmp_path)
+    chat_manager.CHAT_MAP_FILE = str(tmp_path / "chat_map.json")
+    chat_manager.SESSION_FILE = str(tmp_path / "session.json")
+    chat_manager.CONFIG_FILE = str(tmp_path / "config.json")
+    return str(tmp_path / "chat.json")
+
+def _line_count(file_path):
+    with open(file_path, "r") as f:
+        return sum(1 for line in f if line.strip())
+
+def test_append_and_replay(chat_file):
+    journal.write_records(chat_file, [{"type": "system", "content": "s"}])
+    journal.append_records(chat_file, [{"type": "human", "content": "a"}, {"type": "ai", "content": "b"}])
+    journal.append_records(chat_file, [{"type": "human", "content": "c"}], keep=1)
+    records = journal.read_records(chat_file)
+    assert [r["content"] for r in records] == ["s", "c"]
+
+def test_reads_legacy_json_list(chat_file):
+    with open(chat_file, "w") as f:
+        json.dump([{"type": "system", "content": "s"}], f, indent=4)
+    assert journal.read_records(chat_file) == [{"type": "system", "content": "s"}]
+    assert not journal.can_append(chat_file)
+
+def test_ignores_torn_last_line(chat_file):
+    journal.write_records(chat_file, [{"type": "system", "content": "s"}])
+    with open(chat_file, "a") as f:
+        f.write('{"type": "hum')
+    assert journal.read_records(chat_file) == [{"type": "system", "content": "s"}]
+
+def test_write_after_torn_last_line_rewrites_the_journal(chat_file):
+    chat_manager._write_messages(chat_file, [SystemMessage(content="s")])
+    with open(chat_file, "a") as f:
+        f.write('{"type": "hum')
+    chat_manager._forget_messages(chat_file)
+    messages = chat_manager._read_messages(chat_file)
+    assert not journal.can_append(chat_file)
+    messages.append(HumanMessage(content="after the tear"))
+    chat_manager._write_messages(chat_file, messages)
+    chat_manager._forget_messages(chat_file)
+    assert [m.content for m in chat_manager._read_messages(chat_file)] == ["s", "after the tear"]
+
+def test_write_messages_only_appends_new_turns(chat_file):
+    messages = [SystemMessage(content="s"), HumanMessage(content="hi")]
+    chat_manager._write_messages(chat_file, messages)
+    messages = chat_manager._read_messages(chat_file)
+    messages.append(AIMessage(content="hello"))
+    chat_manager._write_messages(chat_file, messages)
+    assert _line_count(chat_file) == 3
+    assert [m.content for m in chat_manager._read_messages(chat_file)] == ["s", "hi", "hello"]
+
+def test_write_messages_truncates_edited_history(chat_file):
+    chat_manager._write_messages(chat_file, [SystemMessage(content="s"), HumanMessage(content="a"), AIMessage(content="b")])
+    messages = chat_manager._read_messages(chat_file)[:1]
+    messages.append(HumanMessage(content="edited"))
+    chat_manager._write_messages(chat_file, messages)
+    assert [m.content for m in chat_manager._read_messages(chat_file)] == ["s", "edited"]
+
+def test_write_messages_compacts_long_journals(chat_file, monkeypatch):
+    monkeypatch.setattr(journal, "COMPACT_MIN_LINES", 4)
+    messages = [SystemMessage(content="s")]
+    chat_manager._write_messages(chat_file, messages)
+    for i in range(5):
+        messages = chat_manager._read_messages(chat_file)[:1]
+        messages.append(HumanMessage(content=f"m{i}"))
+        chat_manager._write_messages(chat_file, messages)
+    assert _line_count(chat_file) <= 4
+    assert [m.content for m in chat_manager._read_messages(chat_file)] == ["s", "m4"]
+
+@pytest.mark.parametrize("compression", ["gzip", "zstd"])
+def test_compressed_append_and_replay(chat_file, compression):
+    if compression == "zstd":
+        pytest.importorskip("zstandard")
+    journal.write_records(chat_file, [{"type": "system", "content": "s"}], compression=compression)
+    journal.append_records(chat_file, [{"type": "human", "content": "a"}])
+    with open(chat_file, "rb") as f:
+        assert journal.detect_compression(f.read(4)) == compression
+    journal.forget(chat_file)
+    assert [r["content"] for r in journal.read_records(chat_file)] == ["s", "a"]
+
+def test_ignores_torn_compressed_block(chat_file):
+    journal.write_records(chat_file, [{"type": "system", "content": "s"}], compression="gzip")
+    with open(chat_file, "ab") as f:
+        f.write(b"\x1f\x8b\x08\x00")
+    assert journal.read_records(chat_file) == [{"type": "system", "content": "s"}]
+
+@pytest.mark.parametrize("compression", ["gzip", "zstd"])
+def test_write_after_truncated_frame_rewrites_the_journal(chat_file, compression):
+    if compression == "zstd":
+        pytest.importorskip("zstandard")
+    chat_manager.set_chat_compression(compression)
+    chat_manager._write_messages(chat_file, [SystemMessage(content="s")])
+    # An interrupted append: the first half of a frame.
+    frame = journal._compress(b'{"type":"human","content":"lost"}\n', compression)
+    with open(chat_file, "ab") as f:
+        f.write(frame[:len(frame) // 2])
+    for text in ("first", "second"):
+        chat_manager._forget_messages(chat_file)
+        messages = chat_manager._read_messages(chat_file)
+        messages.append(HumanMessage(content=text))
+        chat_manager._write_messages(chat_file, messages)
+    chat_manager._forget_messages(chat_file)
+    assert [m.content for m in chat_manager._read_messages(chat_file)] == ["s", "first", "second"]
+
+def test_records_leave_out_default_fields(chat_file):
+    chat_manager._write_messages(chat_file, [SystemMessage(content="s"), AIMessage(content="hello")])
+    records = journal.read_records(chat_file)
+    assert set(records[1]) <= {"type", "content", "id"}
+    chat_manager._forget_messages(chat_file)
+    message = materialize(chat_manager._read_messages(chat_file))[1]
+    assert isinstance(message, AIMessage)
+    assert message.content == "hello" and message.tool_calls == []
+
+def test_set_chat_compression_rewrites_chats(chat_file):
+    chat_manager.create_or_load_chat("Compressed")
+    chat_file = chat_manager.get_current_chat()
+    chat_manager.set_chat_compression("gzip")
+    with open(chat_file, "rb") as f:
+        assert f.read(2) == b"\x1f\x8b"
+    chat_manager._write_messages(chat_file, chat_manager._read_messages(chat_file) + [HumanMessage(content="hi")])
+    chat_manager._forget_messages(chat_file)
+    assert chat_manager._read_messages(chat_file)[-1].content == "hi"
+
+def test_read_messages_builds_langchain_messages_lazily(chat_file):
+    tool_call = {"name": "run", "args": {"command": "ls"}, "id": "call_1"}
+    chat_manager._write_messages(chat_file, [
+        SystemMessage(content="s"),
+        HumanMessage(content="list files"),
+        AIMessage(content="", tool_calls=[tool_call]),
+        ToolMessage(content="a.txt", tool_call_id="call_1", name="run"),
+    ])
+    chat_manager._forget_messages(chat_file)
+    views = chat_manager._read_messages(chat_file)
+    assert all(isinstance(view, MessageView) for view in views)
+    assert [view.type for view in views] == ["system", "human", "ai", "tool"]
+    assert views[2].tool_calls[0]["id"] == "call_1"
+    assert all(view._message is None for view in views)
+    messages = materialize(views)
+    assert isinstance(messages[3], ToolMessage) and messages[3].content == "a.txt"
+    assert messages[2].tool_calls[0]["args"] == {"command": "ls"}
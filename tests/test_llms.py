@@ -0,0 +1,32 @@
+import pytest
+
+from ai_shell_agent import llms
+
+
+@pytest.fixture
+def openai_llms(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    monkeypatch.setenv("PROVIDER", "openai")
+    monkeypatch.setenv("TEMPERATURE", "0")
+    llms.invalidate_llm_cache()
+    yield llms
+    llms.invalidate_llm_cache()
+
+def test_bound_llm_is_reused_for_the_same_tools(openai_llms):
+    tools = [{"type": "function", "function": {"name": "run", "parameters": {"type": "object", "properties": {}}}}]
+    bound = openai_llms.get_bound_llm(tools)
+    assert openai_llms.get_bound_llm(list(tools)) is bound
+    assert openai_llms.get_llm() is bound.bound
+
+    other_tools = [{"type": "function", "function": {"name": "other", "parameters": {"type": "object", "properties": {}}}}]
+    assert openai_llms.get_bound_llm(other_tools) is not bound
+
+def test_settings_changes_create_new_clients(openai_llms, monkeypatch):
+    llm = openai_llms.get_llm()
+    monkeypatch.setenv("TEMPERATURE", "0.5")
+    assert openai_llms.get_llm() is not llm
+    assert openai_llms.get_llm().temperature == 0.5
+
+    llm = openai_llms.get_llm()
+    openai_llms.invalidate_llm_cache()
+    assert openai_llms.get_llm() is not llm
@@ -0,0 +1,62 @@
+import json
+
+import pytest
+
+import ai_shell_agent.chat_manager as chat_manager
+from ai_shell_agent import llms, profiling, fake_llm
+
+
+@pytest.fixture(scope="function")
+def offline(tmp_path, monkeypatch):
+    """Points chat_manager at tmp_path and the model at a script with one command."""
+    chat_manager.CHAT_DIR = str(tmp_path)
+    chat_manager.CHAT_MAP_FILE = str(tmp_path / "chat_map.json")
+    chat_manager.SESSION_FILE = str(tmp_path / "session.json")
+    chat_manager.CONFIG_FILE = str(tmp_path / "config.json")
+    script = tmp_path / "script.json"
+    script.write_text(json.dumps([
+        {"content": "", "tool_calls": [{"name": "interactive_windows_shell_tool", "args": {"command": "echo traced"}}]},
+        {"content": "Done."},
+    ]))
+    monkeypatch.setenv("PROVIDER", "fake")
+    monkeypatch.setenv(fake_llm.RESPONSES_ENV, str(script))
+    llms.invalidate_llm_cache()
+    chat_manager.set_direct_tools(True)
+    yield tmp_path
+    profiling.disable()
+    llms.invalidate_llm_cache()
+
+def test_spans_cover_the_turn_with_token_usage(offline):
+    chat_manager.create_or_load_chat("Profiled Chat")
+    profiling.enable()
+    assert chat_manager.send_message("trace this") == "Done."
+    profiling.end_startup()
+    spans = profiling.spans()
+    names = [span["name"] for span in spans]
+    for name in ("startup", "read_messages", "load_model", "llm", "tool", "write_messages", "turn"):
+        assert name in names
+    calls = [span for span in spans if span["name"] == "llm"]
+    assert len(calls) == 2 and all(call["args"]["input_tokens"] > 0 for call in calls)
+    assert [span["args"] for span in spans if span["name"] == "tool"][0]["args"] == {"command": "echo traced"}
+
+    table = profiling.summary_table()
+    assert "write_messages" in table and "model call 2:" in table
+    events = profiling.chrome_trace()["traceEvents"]
+    assert len(events) == len(spans) and all(event["ph"] == "X" and event["dur"] >= 0 for event in events)
+
+def test_nothing_is_recorded_unless_enabled(offline):
+    chat_manager.create_or_load_chat("Quiet Chat")
+    chat_manager.send_message("not traced")
+    assert profiling.spans() == []
+    with profiling.span("llm") as span:
+        span["input_tokens"] = 1
+    assert profiling.spans() == []
+
+def test_cli_writes_a_chrome_trace(tmp_path, monkeypatch):
+    from ai_shell_agent.ai import main
+    monkeypatch.setenv("PROVIDER", "fake")
+    trace_file = tmp_path / "trace.json"
+    main(["--data-dir", str(tmp_path / "data"), "--profile", str(trace_file), "-ct"])
+    events = json.loads(trace_file.read_text())["traceEvents"]
+    assert events[0]["name"] == "startup"
+    assert not profiling.enabled()
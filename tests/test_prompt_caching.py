@@ -0,0 +1,115 @@
+import os
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import ai_shell_agent.chat_manager as chat_manager
+from ai_shell_agent import llms, paths, settings
+
+
+class StandInModel(BaseHTTPRequestHandler):
+    """
+    OpenAI-compatible chat completions endpoint. Asks for one command after
+    each user message, answers after the command's result, and reports the
+    prompt prefix it shares with the previous request as cached tokens, like
+    OpenAI's automatic prompt caching.
+    """
+
+    requests = []
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        prompt = json.dumps(body["messages"])
+        cached = 0
+        if self.requests:
+            previous = json.dumps(self.requests[-1]["messages"])
+            cached = len(os.path.commonprefix([previous, prompt])) // 4
+        self.requests.append(body)
+        if body["messages"][-1]["role"] == "tool":
+            message = {"role": "assistant", "content": "Done."}
+        else:
+            message = {"role": "assistant", "content": None, "tool_calls": [{
+                "id": f"call_{len(self.requests)}", "type": "function",
+                "function": {"name": "interactive_windows_shell_tool", "arguments": json.dumps({"command": "echo ok"})},
+            }]}
+        response = json.dumps({
+            "id": "stand-in", "object": "chat.completion", "created": 0, "model": body["model"],
+            "choices": [{"index": 0, "message": message, "finish_reason": "stop"}],
+            "usage": {
+                "prompt_tokens": len(prompt) // 4, "completion_tokens": 1, "total_tokens": len(prompt) // 4 + 1,
+                "prompt_tokens_details": {"cached_tokens": cached},
+            },
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture(scope="function")
+def stand_in_model(tmp_path, monkeypatch):
+    """Points chat_manager at tmp_path and the OpenAI client at a local stand-in model server."""
+    chat_manager.CHAT_DIR = str(tmp_path)
+    chat_manager.CHAT_MAP_FILE = str(tmp_path / "chat_map.json")
+    chat_manager.SESSION_FILE = str(tmp_path / "session.json")
+    chat_manager.CONFIG_FILE = str(tmp_path / "config.json")
+    # llms reads the settings of the data directory.
+    monkeypatch.setattr(paths, "_data_dir", str(tmp_path))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInModel)
+    StandInModel.requests = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    monkeypatch.setenv("PROVIDER", "openai")
+    monkeypatch.setenv("TEMPERATURE", "0")
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setenv("OPENAI_BASE_URL", base_url)
+    monkeypatch.setenv("OPENAI_API_BASE", base_url)
+    llms.invalidate_llm_cache()
+    yield StandInModel.requests
+    llms.invalidate_llm_cache()
+    server.shutdown()
+
+def test_every_call_extends_the_previous_prompt(stand_in_model):
+    chat_manager.set_direct_tools(True)
+    chat_manager.create_or_load_chat("Cached Chat")
+    usage_before = chat_manager.prompt_cache_usage()
+    assert chat_manager.send_message("check the disk") == "Done."
+    assert chat_manager.send_message("and the memory?") == "Done."
+
+    requests = stand_in_model
+    assert len(requests) == 4
+    for previous, current in zip(requests, requests[1:]):
+        # Byte-identical prefix: system prompt, tools and history never change.
+        assert json.dumps(current["messages"]).startswith(json.dumps(previous["messages"])[:-1])
+        assert current["tools"] == previous["tools"]
+    # Not sent to a server other than api.openai.com unless asked to.
+    assert all("prompt_cache_key" not in request for request in requests)
+
+    usage = chat_manager.prompt_cache_usage()
+    assert usage["calls"] - usage_before["calls"] == 4
+    assert usage["cache_read"] - usage_before["cache_read"] > 0
+
+def test_prompt_cache_key_is_sent_when_enabled(stand_in_model):
+    assert chat_manager.set_setting("prompt_cache_key", "on")
+    chat_manager.set_direct_tools(True)
+    chat_manager.create_or_load_chat("Keyed Chat")
+    assert chat_manager.send_message("check the disk") == "Done."
+    assert all(request["prompt_cache_key"] == llms.PROMPT_CACHE_KEY for request in stand_in_model)
+
+def test_prompt_cache_key_only_goes_to_openai(tmp_path, monkeypatch):
+    monkeypatch.setattr(paths, "_data_dir", str(tmp_path))
+    monkeypatch.delenv("OPENAI_API_BASE", raising=False)
+    monkeypatch.delenv("OPENAI_BASE_URL", raising=False)
+    assert llms._sends_prompt_cache_key()
+    monkeypatch.setenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+    assert llms._sends_prompt_cache_key()
+    monkeypatch.setenv("OPENAI_BASE_URL", "http://localhost:11434/v1")
+    assert not llms._sends_prompt_cache_key()
+    settings.update(paths.config_file(), prompt_cache_key="off")
+    monkeypatch.delenv("OPENAI_BASE_URL")
+    assert not llms._sends_prompt_cache_key()
@@ -0,0 +1,61 @@
+import asyncio
+import json
+
+from ai_shell_agent import chat_manager
+from ai_shell_agent.response_cache import ResponseCache, cache_key
+
+
+def test_cache_key_depends_on_every_part():
+    key = cache_key(("openai", "gpt-4o-mini", 0, None), [{"role": "user", "content": "hi"}])
+    assert key == cache_key(("openai", "gpt-4o-mini", 0, None), [{"role": "user", "content": "hi"}])
+    assert key != cache_key(("openai", "gpt-4o-mini", 0, "tools"), [{"role": "user", "content": "hi"}])
+    assert key != cache_key(("openai", "gpt-4o-mini", 0, None), [{"role": "user", "content": "hello"}])
+
+def test_get_put_and_ttl(tmp_path, monkeypatch):
+    cache = ResponseCache(str(tmp_path / "responses.db"), ttl=60)
+    assert cache.get("a") is None
+    cache.put("a", {"content": "cached"})
+    assert cache.get("a") == {"content": "cached"}
+
+    now = __import__("time").time()
+    monkeypatch.setattr("ai_shell_agent.response_cache.time.time", lambda: now + 120)
+    assert cache.get("a") is None
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    value = {"content": "x" * 100}
+    size = len(json.dumps(value, separators=(",", ":")))
+    cache = ResponseCache(str(tmp_path / "responses.db"), max_bytes=2 * size)
+    cache.put("a", value)
+    cache.put("b", value)
+    cache.get("a")  # "b" is now the least recently used entry
+    cache.put("c", value)
+    assert cache.get("a") is not None
+    assert cache.get("b") is None
+    assert cache.get("c") is not None
+
+class CountingLLM:
+    def __init__(self):
+        self.calls = 0
+
+    async def ainvoke(self, messages):
+        from langchain_core.messages import AIMessage
+        self.calls += 1
+        return AIMessage(content="answer", id="run-1")
+
+def test_identical_calls_are_answered_from_the_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(chat_manager, "CHAT_DIR", str(tmp_path))
+    monkeypatch.setattr(chat_manager, "CONFIG_FILE", str(tmp_path / "config.json"))
+    monkeypatch.setenv("TEMPERATURE", "0")
+    chat_manager.set_response_cache(True)
+    cache = chat_manager._response_cache()
+    llm = CountingLLM()
+    context = [{"role": "user", "content": "what is 2 + 2?"}]
+
+    first = asyncio.run(chat_manager._invoke_llm(llm, context, False, cache, ("openai", "m", 0, None)))
+    second = asyncio.run(chat_manager._invoke_llm(llm, context, False, cache, ("openai", "m", 0, None)))
+    assert llm.calls == 1
+    assert second.content == first.content == "answer"
+    assert second.id is None
+
+    monkeypatch.setenv("TEMPERATURE", "0.7")
+    assert chat_manager._response_cache() is None
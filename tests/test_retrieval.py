@@ -0,0 +1,58 @@
+import pytest
+
+from langchain_core.messages import HumanMessage, AIMessage, SystemMessage, ToolMessage
+
+import ai_shell_agent.chat_manager as chat_manager
+from ai_shell_agent import retrieval, settings
+
+
+@pytest.fixture(scope="function")
+def chat_file(tmp_path):
+    """A chat file path, with chat_manager pointed at tmp_path and retrieval enabled."""
+    chat_manager.CHAT_DIR = str(tmp_path)
+    chat_manager.CHAT_MAP_FILE = str(tmp_path / "chat_map.json")
+    chat_manager.SESSION_FILE = str(tmp_path / "session.json")
+    chat_manager.CONFIG_FILE = str(tmp_path / "config.json")
+    settings.update(chat_manager.CONFIG_FILE, retrieval_top_k=2, context_token_budget=200)
+    return str(tmp_path / "chat.json")
+
+def _history():
+    topics = ["nginx returns 502 bad gateway", "disk usage of /var/log", "python virtualenv broken", "cron job not running"]
+    messages = [SystemMessage(content="system")]
+    for i, topic in enumerate(topics):
+        messages.append(HumanMessage(content=f"help: {topic}"))
+        messages.append(AIMessage(content="", tool_calls=[{"name": "run", "args": {"command": f"check {i}"}, "id": f"call{i}"}]))
+        messages.append(ToolMessage(content=f"output about {topic} " + "z" * 300, tool_call_id=f"call{i}"))
+        messages.append(AIMessage(content=f"answer about {topic}"))
+    return messages
+
+def test_hashed_embedder_is_deterministic_and_similarity_based():
+    embedder = retrieval.HashedNgramEmbedder()
+    vectors = embedder.embed(["restart the nginx server", "nginx server restarts", "free disk space", ""])
+    assert (vectors == retrieval.HashedNgramEmbedder().embed(["restart the nginx server", "nginx server restarts", "free disk space", ""])).all()
+    assert vectors[0] @ vectors[1] > vectors[0] @ vectors[2]
+    assert not vectors[3].any()
+
+def test_vector_index_embeds_only_new_messages(chat_file):
+    messages = _history()
+    chat_manager._write_messages(chat_file, messages)
+    index = chat_manager._vector_index(chat_file)
+    assert index.vectors().shape == (len(messages), index.embedder.dim)
+    assert index.update(messages) == 0
+    # An edit replaces the rows from the edited message on.
+    edited = chat_manager._read_messages(chat_file)[:5] + [HumanMessage(content="new question")]
+    chat_manager._write_messages(chat_file, edited)
+    assert index.update(edited) == 0
+    assert index.vectors().shape[0] == 6
+
+def test_relevant_older_messages_are_added_to_the_context(chat_file, monkeypatch):
+    monkeypatch.setattr(chat_manager, "_summarize", lambda previous, messages: "summary")
+    messages = _history() + [HumanMessage(content="the nginx 502 bad gateway is back")]
+    chat_manager._write_messages(chat_file, messages)
+    sent = chat_manager._prepare_context(chat_file, chat_manager._read_messages(chat_file))
+    retrieved = sent[-2]["content"]
+    assert sent[-2]["role"] == "user" and "nginx returns 502 bad gateway" in retrieved
+    assert "cron job" not in retrieved
+    assert sent[-1]["content"] == "the nginx 502 bad gateway is back"
+    # The system prompt doesn't depend on the request, so its cached prefix is reused.
+    assert sent[0]["content"] == "system\n\nSummary of the earlier part of this conversation:\nsummary"
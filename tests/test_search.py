@@ -0,0 +1,56 @@
+import pytest
+
+from langchain_core.messages import HumanMessage, AIMessage, SystemMessage, ToolMessage
+
+import ai_shell_agent.chat_manager as chat_manager
+from ai_shell_agent import search, settings, journal
+
+
+@pytest.fixture(scope="function", params=["json", "sqlite"])
+def store(tmp_path, request):
+    """The chat store of the given backend, with chat_manager pointed at tmp_path."""
+    chat_manager.CHAT_DIR = str(tmp_path)
+    chat_manager.CHAT_MAP_FILE = str(tmp_path / "chat_map.json")
+    chat_manager.SESSION_FILE = str(tmp_path / "session.json")
+    chat_manager.CONFIG_FILE = str(tmp_path / "config.json")
+    settings.update(chat_manager.CONFIG_FILE, storage_backend=request.param)
+    return chat_manager._store()
+
+def _chat(store, title, messages):
+    chat_file = store.chat_file(store.create_chat(title))
+    chat_manager._write_messages(chat_file, messages)
+    return chat_file
+
+def test_search_finds_messages_across_chats(store):
+    _chat(store, "disk", [SystemMessage(content="s"), HumanMessage(content="why is my disk full?"),
+                          AIMessage(content="", tool_calls=[{"name": "run", "args": {"command": "du -sh /var/log"}, "id": "1"}]),
+                          ToolMessage(content="4.0G /var/log", tool_call_id="1")])
+    _chat(store, "git", [SystemMessage(content="s"), HumanMessage(content="undo the last git commit")])
+    results = chat_manager.search_chats("disk")
+    assert [(r["title"], r["index"], r["type"]) for r in results] == [("disk", 1, "human")]
+    assert search.MATCH_START + "disk" + search.MATCH_END in results[0]["snippet"]
+    # Commands the AI ran are searchable, and the last word matches as a prefix.
+    assert [(r["title"], r["index"]) for r in chat_manager.search_chats("du /var/lo")] == [("disk", 2)]
+    assert chat_manager.search_chats("git") and not chat_manager.search_chats("kubernetes")
+    # Operators and quotes are taken literally.
+    assert chat_manager.search_chats('"git" -') == chat_manager.search_chats("git")
+
+def test_index_follows_appends_edits_and_deletes(store):
+    chat_file = _chat(store, "c", [SystemMessage(content="s"), HumanMessage(content="first question")])
+    messages = chat_manager._read_messages(chat_file)
+    messages.append(AIMessage(content="first answer"))
+    chat_manager._write_messages(chat_file, messages)
+    assert [r["index"] for r in chat_manager.search_chats("first")] in ([1, 2], [2, 1])
+    # Editing drops the truncated messages from the index.
+    chat_manager._write_messages(chat_file, chat_manager._read_messages(chat_file)[:1] + [HumanMessage(content="second question")])
+    assert [r["index"] for r in chat_manager.search_chats("question")] == [1]
+    assert chat_manager.search_chats("first") == []
+    chat_manager.delete_chat("c")
+    assert chat_manager._search_index().versions() == {}
+
+def test_search_reindexes_chats_written_elsewhere(store):
+    chat_file = _chat(store, "c", [SystemMessage(content="s"), HumanMessage(content="hello")])
+    # Written without going through chat_manager, e.g. by another tool.
+    store.write_records(chat_file, [{"type": "system", "content": "s"}, {"type": "human", "content": "goodbye"}])
+    assert [r["index"] for r in chat_manager.search_chats("goodbye")] == [1]
+    assert chat_manager.search_chats("hello") == []
@@ -0,0 +1,46 @@
+import os
+import json
+
+from ai_shell_agent import settings
+
+
+def _write_config(path, config):
+    with open(path, "w") as f:
+        json.dump(config, f)
+
+def test_settings_are_typed_and_default(tmp_path):
+    config_file = str(tmp_path / "config.json")
+    _write_config(config_file, {"stream": "on", "max_parallel_tools": "8"})
+    current = settings.load(config_file)
+    assert current.stream is True
+    assert current.max_parallel_tools == 8
+    assert current.context_token_budget == 16000
+    assert settings.load(str(tmp_path / "missing.json")).direct_tools is False
+
+def test_settings_are_cached_until_the_file_changes(tmp_path):
+    config_file = str(tmp_path / "config.json")
+    _write_config(config_file, {"stream": False})
+    current = settings.load(config_file)
+    assert settings.load(config_file) is current
+
+    settings.update(config_file, stream=True)
+    assert settings.load(config_file).stream is True
+    with open(config_file) as f:
+        assert json.load(f) == {"stream": True}
+
+def test_model_settings_are_read_at_call_time(monkeypatch):
+    monkeypatch.setenv("PROVIDER", "openai")
+    monkeypatch.setenv("TEMPERATURE", "0.3")
+    assert (settings.load().model, settings.load().temperature) == ("gpt-4o-mini", 0.3)
+    monkeypatch.setenv("PROVIDER", "google")
+    assert settings.load().model == "gemini-2.0-flash"
+
+def test_env_file_does_not_override_the_environment(tmp_path, monkeypatch):
+    env_file = tmp_path / ".env"
+    env_file.write_text("AI_SHELL_TEST_A=from-file\nAI_SHELL_TEST_B=from-file\n")
+    monkeypatch.setenv("AI_SHELL_TEST_A", "from-env")
+    monkeypatch.delenv("AI_SHELL_TEST_B", raising=False)
+    settings.load_env_file(str(env_file))
+    assert os.environ["AI_SHELL_TEST_A"] == "from-env"
+    assert os.environ["AI_SHELL_TEST_B"] == "from-file"
+    monkeypatch.delenv("AI_SHELL_TEST_B")
@@ -0,0 +1,171 @@
+import os
+import json
+import pytest
+
+from langchain_core.messages import HumanMessage
+
+import ai_shell_agent.chat_manager as chat_manager
+from ai_shell_agent import storage
+from ai_shell_agent.terminal import terminal_key
+
+
+@pytest.fixture(scope="function")
+def temp_chat_env(tmp_path):
+    """Points chat_manager at a temporary directory, using the JSON backend."""
+    temp_dir = tmp_path / "chat_env"
+    temp_dir.mkdir()
+    chat_manager.CHAT_DIR = str(temp_dir / "chats")
+    os.makedirs(chat_manager.CHAT_DIR, exist_ok=True)
+    chat_manager.CHAT_MAP_FILE = str(temp_dir / "chat_map.json")
+    chat_manager.SESSION_FILE = str(temp_dir / "session.json")
+    chat_manager.CONFIG_FILE = str(temp_dir / "config.json")
+    with open(chat_manager.CONFIG_FILE, "w") as fp:
+        json.dump({"default_system_prompt": "system"}, fp)
+    yield temp_dir
+
+@pytest.fixture(scope="function")
+def sqlite_chat_env(temp_chat_env):
+    with open(chat_manager.CONFIG_FILE, "w") as fp:
+        json.dump({"default_system_prompt": "system", "storage_backend": "sqlite"}, fp)
+    yield temp_chat_env
+
+def test_selects_backend_from_config(temp_chat_env, sqlite_chat_env):
+    assert isinstance(chat_manager._store(), storage.SqliteChatStore)
+
+def test_sqlite_chat_lifecycle(sqlite_chat_env):
+    chat_file = chat_manager.create_or_load_chat("First")
+    chat_manager.create_or_load_chat("Second")
+    assert chat_manager.get_chat_titles_list() == ["First", "Second"]
+    assert chat_manager.get_current_chat() != chat_file
+
+    chat_manager.save_session(chat_file)
+    assert chat_manager.load_session() == chat_file
+    assert chat_manager.rename_chat("First", "Renamed") is True
+    assert chat_manager._store().get_title(chat_file) == "Renamed"
+    assert chat_manager.delete_chat("Second") is True
+    assert chat_manager.get_chat_titles_list() == ["Renamed"]
+    assert not os.path.exists(chat_file)
+
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_renaming_a_missing_chat_keeps_the_target(temp_chat_env, backend):
+    with open(chat_manager.CONFIG_FILE, "w") as fp:
+        json.dump({"default_system_prompt": "system", "storage_backend": backend}, fp)
+    chat_file = chat_manager.create_or_load_chat("Keep")
+    assert chat_manager._store().rename_chat("Missing", "Keep") is False
+    assert chat_manager.get_chat_titles_list() == ["Keep"]
+    chat_manager._forget_messages(chat_file)
+    assert [m.content for m in chat_manager._read_messages(chat_file)] == ["system"]
+
+def test_sqlite_appends_and_truncates(sqlite_chat_env):
+    chat_file = chat_manager.create_or_load_chat("Chat")
+    messages = chat_manager._read_messages(chat_file)
+    messages.append(HumanMessage(content="a"))
+    chat_manager._write_messages(chat_file, messages)
+    messages = chat_manager._read_messages(chat_file)[:1]
+    messages.append(HumanMessage(content="b"))
+    chat_manager._write_messages(chat_file, messages)
+    assert [m.content for m in chat_manager._read_messages(chat_file)] == ["system", "b"]
+
+def test_migrate_json_to_sqlite(temp_chat_env):
+    chat_file = chat_manager.create_or_load_chat("Kept")
+    messages = chat_manager._read_messages(chat_file)
+    messages.append(HumanMessage(content="hello"))
+    chat_manager._write_messages(chat_file, messages)
+
+    assert chat_manager.migrate_storage("sqlite") == 1
+    assert isinstance(chat_manager._store(), storage.SqliteChatStore)
+    assert chat_manager.get_chat_titles_list() == ["Kept"]
+    assert chat_manager.get_current_chat() == chat_file
+    assert [m.content for m in chat_manager._read_messages(chat_file)] == ["system", "hello"]
+
+def _create_chats(chat_dir, chat_map_file, session_file, prefix):
+    store = storage.JsonChatStore(chat_dir, chat_map_file, session_file)
+    for i in range(20):
+        store.create_chat(f"{prefix}{i}")
+
+@pytest.mark.skipif(os.name != "posix", reason="uses fork")
+def test_concurrent_chat_creation_keeps_every_chat(temp_chat_env):
+    import multiprocessing
+    context = multiprocessing.get_context("fork")
+    args = (chat_manager.CHAT_DIR, chat_manager.CHAT_MAP_FILE, chat_manager.SESSION_FILE)
+    processes = [context.Process(target=_create_chats, args=args + (prefix,)) for prefix in "abcd"]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+    assert len(chat_manager.get_chat_titles_list()) == 80
+
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_merges_messages_appended_by_another_process(temp_chat_env, backend):
+    with open(chat_manager.CONFIG_FILE, "w") as fp:
+        json.dump({"default_system_prompt": "system", "storage_backend": backend}, fp)
+    chat_file = chat_manager.create_or_load_chat("Shared")
+    messages = chat_manager._read_messages(chat_file)
+
+    # Another terminal appends a turn to the same chat.
+    other = chat_manager._create_store(backend)
+    other.append_records(chat_file, [{"type": "human", "content": "from other", "id": "other-1"}])
+
+    messages.append(HumanMessage(content="from here"))
+    chat_manager._write_messages(chat_file, messages)
+    chat_manager._forget_messages(chat_file)
+    stored = [m.content for m in chat_manager._read_messages(chat_file)]
+    assert stored == ["system", "from other", "from here"]
+    assert [m.content for m in messages] == stored
+
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_each_terminal_has_its_own_current_chat(temp_chat_env, monkeypatch, backend):
+    with open(chat_manager.CONFIG_FILE, "w") as fp:
+        json.dump({"default_system_prompt": "system", "storage_backend": backend}, fp)
+    monkeypatch.setenv("AI_SHELL_TERMINAL", "one")
+    first = chat_manager.create_or_load_chat("First")
+    monkeypatch.setenv("AI_SHELL_TERMINAL", "two")
+    second = chat_manager.create_or_load_chat("Second")
+    assert chat_manager.get_current_chat() == second
+    monkeypatch.setenv("AI_SHELL_TERMINAL", "one")
+    assert chat_manager.get_current_chat() == first
+    assert set(chat_manager._store().sessions().values()) == {first, second}
+
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_flushing_prunes_sessions_of_gone_chats(temp_chat_env, monkeypatch, backend):
+    with open(chat_manager.CONFIG_FILE, "w") as fp:
+        json.dump({"default_system_prompt": "system", "storage_backend": backend}, fp)
+    monkeypatch.setenv("AI_SHELL_TERMINAL", "one")
+    first = chat_manager.create_or_load_chat("First")
+    monkeypatch.setenv("AI_SHELL_TERMINAL", "two")
+    chat_manager.create_or_load_chat("Second")
+    chat_manager.delete_chat("Second")
+    chat_manager.flush_temp_chats()
+    assert list(chat_manager._store().sessions().values()) == [first]
+
+def test_flushing_prunes_sessions_of_terminals_long_gone(temp_chat_env, monkeypatch):
+    monkeypatch.setenv("AI_SHELL_TERMINAL", "old")
+    chat_manager.create_or_load_chat("First")
+    session_file = os.path.join(chat_manager.CHAT_DIR, storage.SESSION_DIR_NAME, f"{terminal_key()}.json")
+    stale = os.path.getmtime(session_file) - storage.SESSION_MAX_AGE - 60
+    os.utime(session_file, (stale, stale))
+    chat_manager.flush_temp_chats()
+    assert not os.path.exists(session_file)
+
+def test_new_terminals_fall_back_to_the_shared_session(temp_chat_env, monkeypatch):
+    chat_file = chat_manager.create_or_load_chat("Old")
+    with open(chat_manager.SESSION_FILE, "w") as fp:
+        json.dump({"current_chat": chat_file}, fp)
+    monkeypatch.setenv("AI_SHELL_TERMINAL", "new")
+    assert chat_manager.get_current_chat() == chat_file
+
+def test_migrates_chats_left_in_the_working_directory(temp_chat_env, tmp_path):
+    legacy_dir = tmp_path / "project"
+    (legacy_dir / "chats").mkdir(parents=True)
+    legacy = storage.JsonChatStore(str(legacy_dir / "chats"), str(legacy_dir / "chats" / "chat_map.json"), str(legacy_dir / "session.json"))
+    chat_id = legacy.create_chat("Old chat")
+    legacy.write_records(legacy.chat_file(chat_id), [{"type": "system", "content": "old"}])
+    legacy.set_current_chat(legacy.chat_file(chat_id))
+    chat_manager.create_or_load_chat("Old chat")
+
+    assert chat_manager.migrate_legacy_data(str(legacy_dir)) == 1
+    assert chat_manager.get_chat_titles_list() == ["Old chat", "Old chat (2)"]
+    chat_file = chat_manager._store().chat_file(chat_id)
+    assert [m.content for m in chat_manager._read_messages(chat_file)] == ["old"]
+    # Only once per directory.
+    assert chat_manager.migrate_legacy_data(str(legacy_dir)) == 0
@@ -0,0 +1,67 @@
+import os
+import pytest
+
+from langchain_core.messages import SystemMessage, ToolMessage
+
+import ai_shell_agent.chat_manager as chat_manager
+from ai_shell_agent import tool_output, settings
+
+
+@pytest.fixture(scope="function")
+def chat_file(tmp_path):
+    """A chat file path, with chat_manager pointed at the default JSON backend in tmp_path."""
+    chat_manager.CHAT_DIR = str(tmp_path)
+    chat_manager.CHAT_MAP_FILE = str(tmp_path / "chat_map.json")
+    chat_manager.SESSION_FILE = str(tmp_path / "session.json")
+    chat_manager.CONFIG_FILE = str(tmp_path / "config.json")
+    return str(tmp_path / "chat.json")
+
+def test_strips_ansi_and_progress_lines():
+    text = "\x1b[1;32mok\x1b[0m\n10%\r50%\r100% done\n\x1b]0;title\x07end"
+    assert tool_output.strip_ansi(text, 100) == "ok\n100% done\nend"
+
+def test_collapses_repeated_lines():
+    text = "start\n" + "warning: deprecated\n" * 5 + "\n\nend"
+    assert tool_output.collapse_duplicate_lines(text, 100) == "start\nwarning: deprecated  [line repeated 5 times]\n\n\nend"
+
+def test_shortens_wide_lines_cell_by_cell():
+    row = "root  1234  0.0  /usr/bin/python3 " + "--option=" + "x" * 300
+    shortened = tool_output.truncate_table_columns(f"USER  PID  %CPU  COMMAND\n{row}", 100)
+    header, line = shortened.split("\n")
+    assert header == "USER  PID  %CPU  COMMAND"
+    assert line.startswith("root  1234  0.0  /usr/bin/python3 --option=") and line.endswith("…")
+    assert len(line) <= tool_output.MAX_LINE_CHARS
+
+def test_elides_the_middle_of_long_outputs():
+    text = "\n".join(f"line {i}" for i in range(1000))
+    elided = tool_output.elide_middle(text, 200)
+    assert len(elided) < 300
+    assert elided.startswith("line 0\n") and elided.endswith("line 999")
+    assert "lines" in elided and "elided" in elided
+    assert tool_output.elide_middle("short", 200) == "short"
+
+def test_tool_output_is_compressed_for_the_model_and_kept_in_full(chat_file):
+    settings.update(chat_manager.CONFIG_FILE, tool_output_max_chars=500)
+    full_output = "\n".join(f"process {i}" for i in range(500))
+    message = chat_manager._compress_tool_output(ToolMessage(content=full_output, tool_call_id="1"))
+    assert len(message.content) <= 600
+    assert chat_manager._full_tool_output(message) == full_output
+    # Only stored with the message, under the store lock, so garbage collection can't race it.
+    blob_dir = chat_manager._blob_store().blob_dir
+    assert not os.path.isdir(blob_dir) or not any(files for _, _, files in os.walk(blob_dir))
+    store = chat_manager._store()
+    chat_file = store.chat_file(store.create_chat("c"))
+    chat_manager._write_messages(chat_file, [SystemMessage(content="s"), message])
+    assert "full_output_text" not in store.read_records(chat_file)[1]["artifact"]
+    chat_manager._forget_messages(chat_file)
+    stored = chat_manager._read_messages(chat_file)[1]
+    assert stored.content == message.content
+    assert chat_manager._full_tool_output(stored) == full_output
+    # The full output survives garbage collection of the blob store.
+    chat_manager._collect_blob_garbage()
+    assert chat_manager._full_tool_output(stored) == full_output
+
+def test_tool_output_filters_can_be_disabled(chat_file):
+    settings.update(chat_manager.CONFIG_FILE, tool_output_filters="")
+    output = "\x1b[31mred\x1b[0m"
+    assert chat_manager._compress_tool_output(ToolMessage(content=output, tool_call_id="1")).content == output